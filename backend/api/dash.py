@@ -2,183 +2,203 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from typing import Dict, Any
 from ..models.database import User as UserModel, Goods, JushuitanProduct
 from .auth import get_current_user
+from ..services.dashboard_cache import dashboard_cache
+from ..services.executors import db_lane, run_in_lane
 from datetime import datetime, timedelta
-from peewee import fn
+from peewee import fn, Case
 
 router = APIRouter()
 
+# 图表展示的天数（含今天）
+CHART_DAYS = 7
+
+
+def _sum_sales_since(start, end=None):
+    """SUM(CASE WHEN created_at 在范围内 THEN sales_amount ELSE 0 END)，在一次扫描中统计多个时间段的销售额"""
+    condition = Goods.created_at >= start
+    if end is not None:
+        condition &= Goods.created_at <= end
+    return fn.SUM(Case(None, [(condition, Goods.sales_amount)], 0))
+
+
+def _count_distinct(field):
+    """去重计数，和 SELECT DISTINCT 后计数一致：NULL 也算一个值"""
+    return fn.COUNT(field.distinct()) + fn.MAX(Case(None, [(field.is_null(), 1)], 0))
+
+
+def _compute_dashboard_stats():
+    """
+    仪表盘统计数据：用户数、商品数、店铺数、销售额等
+    商品表的各项统计用条件聚合在一次扫描中算出，用户数和订单数作为子查询放在同一条 SQL 里
+    """
+    today = datetime.now().date()
+    today_start = datetime.combine(today, datetime.min.time())
+    today_end = datetime.combine(today, datetime.max.time())
+    week_start_dt = datetime.combine(today - timedelta(days=today.weekday()), datetime.min.time())  # 本周一
+    month_start_dt = datetime.combine(today.replace(day=1), datetime.min.time())
+
+    # 用户数（排除已删除的用户）、订单数（聚水潭产品表）
+    users_count = UserModel.select(fn.COUNT(UserModel.id)).where(UserModel.is_del == 0)
+    orders_count = JushuitanProduct.select(fn.COUNT(JushuitanProduct.id)).where(JushuitanProduct.is_del == 0)
+
+    stats = (Goods
+             .select(fn.COUNT(Goods.id).alias('total_goods'),
+                     # 店铺数、商品类型数：按店铺ID、商品名称去重
+                     _count_distinct(Goods.store_id).alias('total_stores'),
+                     _count_distinct(Goods.goods_name).alias('total_good_types'),
+                     fn.SUM(Goods.sales_amount).alias('total_sales_amount'),
+                     _sum_sales_since(today_start, today_end).alias('today_sales'),
+                     _sum_sales_since(week_start_dt).alias('week_sales'),
+                     _sum_sales_since(month_start_dt).alias('month_sales'),
+                     users_count.alias('total_users'),
+                     orders_count.alias('total_orders'))
+             .where(Goods.is_del == False)
+             .dicts()
+             .get())
+
+    total_users = stats['total_users'] or 0
+    total_orders = stats['total_orders'] or 0
+    total_sales_amount = stats['total_sales_amount'] or 0.0
+
+    # 统计活跃用户数（最近30天内有活动的用户，这里简化为最近登录的用户）
+    # 由于没有登录时间字段，暂时返回总用户数
+    active_users = total_users
+    
+    # 计算平均客单价
+    avg_order_value = 0.0
+    if total_orders > 0 and total_sales_amount > 0:
+        avg_order_value = total_sales_amount / total_orders
+    
+    # 返回统计数据
+    return {
+        "status": "success",
+        "data": {
+            "total_users": total_users,
+            "total_goods": stats['total_goods'] or 0,
+            "total_stores": stats['total_stores'] or 0,
+            "total_sales_amount": round(float(total_sales_amount), 2),
+            "today_sales": round(float(stats['today_sales'] or 0.0), 2),
+            "week_sales": round(float(stats['week_sales'] or 0.0), 2),
+            "month_sales": round(float(stats['month_sales'] or 0.0), 2),
+            "total_good_types": stats['total_good_types'] or 0,
+            "active_users": active_users,
+            "total_orders": total_orders,
+            "avg_order_value": round(avg_order_value, 2),
+            "last_updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+    }
+
+
 @router.get("/dashboard/stats")
+@run_in_lane(db_lane)
 def get_dashboard_stats(current_user = Depends(get_current_user)):
     """
     获取仪表盘统计数据
     包括用户数、商品数、店铺数、销售额等
+    结果经过仪表盘缓存（见 services/dashboard_cache.py），last_updated 为实际计算的时间
     """
     try:
-        # 统计用户数（排除已删除的用户）
-        total_users = UserModel.select().where(UserModel.is_del == 0).count()
-        
-        # 统计商品数（未删除的商品）
-        total_goods = Goods.select().where(Goods.is_del == False).count()
-        
-        # 统计店铺数（从商品表中获取不重复的店铺）
-        distinct_stores = Goods.select(Goods.store_id).where(Goods.is_del == False).distinct()
-        total_stores = distinct_stores.count()
-        
-        # 统计销售额（使用sales_amount字段）
-        total_sales_amount = Goods.select(
-            fn.SUM(Goods.sales_amount)
-        ).where(Goods.is_del == False).scalar() or 0.0
-        
-        # 统计今日销售额
-        today = datetime.now().date()
-        today_start = datetime.combine(today, datetime.min.time())
-        today_end = datetime.combine(today, datetime.max.time())
-        
-        today_sales = Goods.select(
-            fn.SUM(Goods.sales_amount)
-        ).where(
-            (Goods.is_del == False) &
-            (Goods.created_at >= today_start) &
-            (Goods.created_at <= today_end)
-        ).scalar() or 0.0
-        
-        # 统计本周销售额
-        week_start = today - timedelta(days=today.weekday())  # 本周一
-        week_start_dt = datetime.combine(week_start, datetime.min.time())
-        
-        week_sales = Goods.select(
-            fn.SUM(Goods.sales_amount)
-        ).where(
-            (Goods.is_del == False) &
-            (Goods.created_at >= week_start_dt)
-        ).scalar() or 0.0
-        
-        # 统计本月销售额
-        month_start = today.replace(day=1)
-        month_start_dt = datetime.combine(month_start, datetime.min.time())
-        
-        month_sales = Goods.select(
-            fn.SUM(Goods.sales_amount)
-        ).where(
-            (Goods.is_del == False) &
-            (Goods.created_at >= month_start_dt)
-        ).scalar() or 0.0
-        
-        # 统计商品类型数（使用商品名称去重）
-        total_good_types = Goods.select(Goods.goods_name).where(Goods.is_del == False).distinct().count()
-        
-        # 统计活跃用户数（最近30天内有活动的用户，这里简化为最近登录的用户）
-        # 由于没有登录时间字段，暂时返回总用户数
-        active_users = total_users
-        
-        # 统计订单数（从聚水潭产品表中获取）
-        total_orders = JushuitanProduct.select().where(JushuitanProduct.is_del == 0).count()
-        
-        # 计算平均客单价
-        avg_order_value = 0.0
-        if total_orders > 0 and total_sales_amount > 0:
-            avg_order_value = total_sales_amount / total_orders
-        
-        # 返回统计数据
-        return {
-            "status": "success",
-            "data": {
-                "total_users": total_users,
-                "total_goods": total_goods,
-                "total_stores": total_stores,
-                "total_sales_amount": round(float(total_sales_amount), 2),
-                "today_sales": round(float(today_sales), 2),
-                "week_sales": round(float(week_sales), 2),
-                "month_sales": round(float(month_sales), 2),
-                "total_good_types": total_good_types,
-                "active_users": active_users,
-                "total_orders": total_orders,
-                "avg_order_value": round(avg_order_value, 2),
-                "last_updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-        }
+        return dashboard_cache.get("stats", _compute_dashboard_stats)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取仪表盘统计数据失败: {str(e)}")
 
 
+def _daily_totals(model, value, start):
+    """按 DATE(created_at) 分组统计 start 之后每天的数据（created_at 走 (created_at, id) 索引范围扫描），返回 {日期: 值}"""
+    day = fn.DATE(model.created_at)
+    rows = (model
+            .select(day.alias('day'), value.alias('value'))
+            .where((model.is_del == False) & (model.created_at >= start))
+            .group_by(day)
+            .tuples())
+    totals = {}
+    for row_day, row_value in rows:
+        if isinstance(row_day, datetime):
+            row_day = row_day.date()
+        elif isinstance(row_day, str):
+            row_day = datetime.strptime(row_day[:10], "%Y-%m-%d").date()
+        totals[row_day] = row_value or 0
+    return totals
+
+
+def _compute_dashboard_chart_data():
+    """最近7天的销售趋势：销售额和订单数各用一条 GROUP BY DATE(created_at) 查询取回，没有数据的日期补 0"""
+    today = datetime.now().date()
+    first_day = today - timedelta(days=CHART_DAYS - 1)
+    start = datetime.combine(first_day, datetime.min.time())
+
+    # 每天的销售额、订单数
+    daily_sales = _daily_totals(Goods, fn.SUM(Goods.sales_amount), start)
+    daily_orders = _daily_totals(JushuitanProduct, fn.COUNT(JushuitanProduct.id), start)
+
+    chart_data = []
+    for i in range(CHART_DAYS):  # 从7天前到今天
+        target_date = first_day + timedelta(days=i)
+        chart_data.append({
+            "date": target_date.strftime("%m-%d"),
+            "sales": round(float(daily_sales.get(target_date, 0.0)), 2),
+            "orders": daily_orders.get(target_date, 0),
+            "day_of_week": target_date.strftime("%a")
+        })
+    
+    return {
+        "status": "success",
+        "data": chart_data
+    }
+
+
 @router.get("/dashboard/chart-data")
+@run_in_lane(db_lane)
 def get_dashboard_chart_data(current_user = Depends(get_current_user)):
     """
     获取仪表盘图表数据（最近7天的销售趋势）
+    结果经过仪表盘缓存（见 services/dashboard_cache.py）
     """
     try:
-        # 获取最近7天的销售数据
-        chart_data = []
-        today = datetime.now().date()
-        
-        for i in range(6, -1, -1):  # 从7天前到今天
-            target_date = today - timedelta(days=i)
-            start_of_day = datetime.combine(target_date, datetime.min.time())
-            end_of_day = datetime.combine(target_date, datetime.max.time())
-            
-            # 获取当天的销售额
-            day_sales = Goods.select(
-                fn.SUM(Goods.sales_amount)
-            ).where(
-                (Goods.is_del == False) &
-                (Goods.created_at >= start_of_day) &
-                (Goods.created_at <= end_of_day)
-            ).scalar() or 0.0
-            
-            # 获取当天的订单数
-            day_orders = JushuitanProduct.select().where(
-                (JushuitanProduct.is_del == 0) &
-                (JushuitanProduct.created_at >= start_of_day) &
-                (JushuitanProduct.created_at <= end_of_day)
-            ).count()
-            
-            chart_data.append({
-                "date": target_date.strftime("%m-%d"),
-                "sales": round(float(day_sales), 2),
-                "orders": day_orders,
-                "day_of_week": target_date.strftime("%a")
-            })
-        
-        return {
-            "status": "success",
-            "data": chart_data
-        }
+        return dashboard_cache.get("chart-data", _compute_dashboard_chart_data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取图表数据失败: {str(e)}")
 
 
+def _compute_recent_activities():
+    """最近活动：最近更新的 4 条商品记录，不足 4 条时补充同步任务的记录"""
+    # 获取最近的商品更新记录
+    recent_goods = Goods.select().where(
+        Goods.is_del == False
+    ).order_by(Goods.updated_at.desc()).limit(4)
+    
+    activities = []
+    for good in recent_goods:
+        activities.append({
+            "user": getattr(good, 'creator', 'System'),
+            "action": f"更新了商品 \"{good.goods_name}\"",
+            "time": good.updated_at.strftime("%m-%d %H:%M") if good.updated_at else "未知时间",
+            "avatar_color": "blue"  # 默认颜色
+        })
+    
+    # 如果商品不足4个，补充一些虚拟数据
+    while len(activities) < 4:
+        activities.append({
+            "user": "系统",
+            "action": "执行了数据同步任务",
+            "time": "刚刚",
+            "avatar_color": "green"
+        })
+    
+    return {
+        "status": "success",
+        "data": activities[:4]  # 确保最多返回4条
+    }
+
+
 @router.get("/dashboard/recent-activities")
+@run_in_lane(db_lane)
 def get_recent_activities(current_user = Depends(get_current_user)):
     """
     获取最近活动数据
+    结果经过仪表盘缓存（见 services/dashboard_cache.py）
     """
     try:
-        # 获取最近的商品更新记录
-        recent_goods = Goods.select().where(
-            Goods.is_del == False
-        ).order_by(Goods.updated_at.desc()).limit(4)
-        
-        activities = []
-        for good in recent_goods:
-            activities.append({
-                "user": getattr(good, 'creator', 'System'),
-                "action": f"更新了商品 \"{good.goods_name}\"",
-                "time": good.updated_at.strftime("%m-%d %H:%M") if good.updated_at else "未知时间",
-                "avatar_color": "blue"  # 默认颜色
-            })
-        
-        # 如果商品不足4个，补充一些虚拟数据
-        while len(activities) < 4:
-            activities.append({
-                "user": "系统",
-                "action": "执行了数据同步任务",
-                "time": "刚刚",
-                "avatar_color": "green"
-            })
-        
-        return {
-            "status": "success",
-            "data": activities[:4]  # 确保最多返回4条
-        }
+        return dashboard_cache.get("recent-activities", _compute_recent_activities)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取最近活动失败: {str(e)}")
\ No newline at end of file
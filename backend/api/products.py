@@ -1,59 +1,167 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi.responses import StreamingResponse
+import io
+import csv
 import json
-from datetime import datetime
+import os
+import struct
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 import traceback
-from peewee import fn
+from peewee import fn, Tuple
 
 
 
-from ..database import get_db
-from ..models.database import JushuitanProduct, Goods, User, Store
+from ..models.database import JushuitanProduct, Goods, User, Store, PddTable, PddBillRecord, JushuitanOrderRecord, SyncWatermark, GoodsDaily, database as models_database
 from .auth import get_current_user
-from ..spiders.jushuitan_api import get_all_jushuitan_orders
-
-# 导入新的获取商品和店铺数据的方法
-from backend.spiders.jushuitan_api import get_jushuitan_orders_for_sales_amount, get_jushuitan_orders_for_sales_cost
+from ..services.sync_jobs import sync_job_manager, DuplicateSyncJobError
+from ..services.executors import db_lane, sync_lane, run_in_lane, get_lane_stats, LaneBusyError, SYNC_FANOUT_WORKERS
+from ..services.order_explode import explode_orders, drop_repeated_orders
+from ..services.goods_daily import refresh_goods_daily
+from ..services.response_cache import bump_data_version, cached_response, response_cache
+from ..services.profit_enrichment import compute_profit_metrics, enrich_goods_days, enrich_store_days, PROFIT_METRICS, STORE_PROFIT_COLUMNS
+from ..services.pagination import paginate, count_rows, keyset_order, keyset_condition, encode_cursor, COUNT_MODES, InvalidCursorError
+from ..utils.responses import FastJSONResponse
+from ..spiders.jushuitan_api import get_all_jushuitan_orders, SALES_AMOUNT_ORDER_STATUS
+
+# 导入新的获取商品和店铺数据的方法（分页逐条返回订单）
+from backend.spiders.jushuitan_api import iter_jushuitan_orders_for_sales_amount, iter_jushuitan_orders_for_sales_cost
+from backend.spiders.jushuitan_api import iter_jushuitan_modified_orders_for_sales_amount, iter_jushuitan_modified_orders_for_sales_cost
+from backend.spiders.jushuitan_api import scm121_client
 
 router = APIRouter()
 
 
+# 聚水潭订单导出（ndjson / csv）时每批读取的行数：按 (created_at, id) 游标分批，内存占用与总行数无关
+JUSHUITAN_EXPORT_BATCH_SIZE = 1000
+JUSHUITAN_PRODUCT_FORMATS = ("json", "ndjson", "csv")
+
+
+def _jushuitan_product_columns(fields):
+    """
+    解析逗号分隔的列名，返回 (要查询的字段, 要输出的列名)，不传时为全部列；有不存在的列时抛出 400
+    游标分页依赖 id 和 created_at，不在投影里时也会查出来，但不输出
+    """
+    all_fields = JushuitanProduct._meta.fields
+    if not fields:
+        return list(all_fields.values()), list(all_fields)
+    names = list(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+    unknown = [name for name in names if name not in all_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不存在的列: {', '.join(unknown)}")
+    selected = names + [name for name in ('id', 'created_at') if name not in names]
+    return [all_fields[name] for name in selected], names
+
+
+def _format_jushuitan_row(row, column_names):
+    """只保留请求的列，datetime 转为字符串"""
+    return {
+        name: row[name].strftime('%Y-%m-%d %H:%M:%S') if isinstance(row[name], datetime) else row[name]
+        for name in column_names
+    }
+
+
+def _iter_jushuitan_rows(query, column_names):
+    """
+    按 (created_at, id) 游标分批读取，每批用 .dicts().iterator() 读取，不缓存模型实例
+    流式响应的每次迭代可能在线程池的不同线程中执行，而 peewee 的连接是按线程保存的：
+    每批在同一个线程里打开连接、读完、关闭连接之后再逐行返回，连接不会跨越 yield
+    """
+    cursor = None
+    while True:
+        with models_database.connection_context():
+            batch_query = query.order_by(*keyset_order(JushuitanProduct))
+            if cursor:
+                batch_query = batch_query.where(keyset_condition(JushuitanProduct, cursor))
+            rows = list(batch_query.limit(JUSHUITAN_EXPORT_BATCH_SIZE).dicts().iterator())
+        for row in rows:
+            yield _format_jushuitan_row(row, column_names)
+        if len(rows) < JUSHUITAN_EXPORT_BATCH_SIZE:
+            return
+        cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+
+
+def _stream_jushuitan_ndjson(query, column_names):
+    for row in _iter_jushuitan_rows(query, column_names):
+        yield json.dumps(row, ensure_ascii=False, default=str) + "\n"
+
+
+def _stream_jushuitan_csv(query, column_names):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # 带 BOM，Excel 打开中文不乱码
+    buffer.write('\ufeff')
+    writer.writerow(column_names)
+    for row in _iter_jushuitan_rows(query, column_names):
+        writer.writerow([row[name] for name in column_names])
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
 # 聚水潭数据相关路由
 @router.get("/jushuitan_products/")
-def read_jushuitan_products(search: str = ""):
-    """获取聚水潭商品数据列表"""
+@run_in_lane(db_lane)
+def read_jushuitan_products(
+    search: str = "",
+    skip: int = Query(0, ge=0, description="跳过的记录数"),
+    limit: int = Query(50, ge=1, le=1000, description="返回的记录数"),
+    cursor: str = Query(None, description="游标分页：传上一页返回的 next_cursor，传了之后忽略 skip"),
+    count: str = Query("exact", description="总数统计方式：exact / cached / approx / none"),
+    fields: str = Query(None, description="逗号分隔的列名，只返回这些列（默认全部列）"),
+    format: str = Query("json", description="json 分页返回；ndjson / csv 流式导出全部匹配的记录")
+):
+    """
+    获取聚水潭商品数据列表
+    json 模式按 (created_at, id) 降序分页；ndjson / csv 模式分批读取并流式输出全部匹配的记录
+    fields 可以只取界面需要展示的列，减少查询和序列化的数据量
+    """
+    if format not in JUSHUITAN_PRODUCT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format 只能是 {' / '.join(JUSHUITAN_PRODUCT_FORMATS)}")
+    if count not in COUNT_MODES:
+        raise HTTPException(status_code=400, detail=f"count 只能是 {' / '.join(COUNT_MODES)}")
+
+    columns, column_names = _jushuitan_product_columns(fields)
+
+    # 构建查询
+    query = JushuitanProduct.select(*columns).where(JushuitanProduct.is_del == False)
+    
+    # 如果有搜索条件，添加搜索过滤
+    if search:
+        query = query.where(JushuitanProduct.disInnerOrderGoodsViewList.contains(search))
+
+    if format == "ndjson":
+        return StreamingResponse(_stream_jushuitan_ndjson(query, column_names), media_type="application/x-ndjson")
+    if format == "csv":
+        return StreamingResponse(
+            _stream_jushuitan_csv(query, column_names),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": "attachment; filename=jushuitan_products.csv"}
+        )
+
+    # 查询使用模型的数据库实例，连接由 db 通道打开和归还
     try:
-        with get_db() as db:
-            # 构建查询
-            query = JushuitanProduct.select().where(JushuitanProduct.is_del == False)
-            
-            # 如果有搜索条件，添加搜索过滤
-            if search:
-                query = query.where(JushuitanProduct.disInnerOrderGoodsViewList.contains(search))
-            
-            # 获取总数
-            total_count = query.count()
-            
-            # 按创建时间降序排序
-            query = query.order_by(JushuitanProduct.created_at.desc())
-            
-            # 将结果转换为字典列表
-            result = []
-            for record in query:
-                record_dict = {}
-                for field in JushuitanProduct._meta.fields.values():
-                    field_value = getattr(record, field.name)
-                    # 将datetime转换为字符串
-                    if isinstance(field_value, datetime):
-                        record_dict[field.name] = field_value.strftime('%Y-%m-%d %H:%M:%S')
-                    else:
-                        record_dict[field.name] = field_value
-                result.append(record_dict)
-            
-            # 返回包含数据和总数的对象
-            return {
-                "data": result,
-                "total": total_count
-            }
+        # 获取总数
+        total_count = count_rows(query, JushuitanProduct, mode=count, filtered=bool(search))
+
+        # 按创建时间降序分页，转换为字典列表
+        rows, next_cursor = paginate(query.dicts(), JushuitanProduct, skip=skip, limit=limit, cursor=cursor)
+        result = [_format_jushuitan_row(row, column_names) for row in rows]
+
+        # 返回包含数据和总数的对象
+        return {
+            "data": result,
+            "total": total_count,
+            "skip": skip,
+            "limit": limit,
+            "next_cursor": next_cursor
+        }
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"查询聚水潭商品数据失败: {str(e)}")
         import traceback
@@ -66,17 +174,12 @@ def read_jushuitan_products(search: str = ""):
 
 # 点击获取同步数据进表里
 @router.post("/sync_jushuitan_data")
+@run_in_lane(sync_lane)
 def sync_jushuitan_data(request: dict = None):
     """同步聚水潭数据到数据库，根据oid字段处理重复数据 - 使用批量操作优化性能"""
 
     # 获取请求体中的同步日期
-    sync_date_str = request.get('sync_date') if request else None
-    sync_date = None
-    if sync_date_str:
-        try:
-            sync_date = datetime.strptime(sync_date_str, '%Y-%m-%d').date()
-        except ValueError:
-            raise HTTPException(status_code=400, detail="日期格式不正确，请使用 YYYY-MM-DD 格式")
+    sync_date = _parse_sync_date(request)
 
     # # 获取聚水潭API数据
     # api_response = get_all_jushuitan_orders(sync_date=sync_date)
@@ -230,291 +333,739 @@ def sync_jushuitan_data(request: dict = None):
     #                         continue
     
     try:
-        # 同步商品和店铺数据
-        goods_processed_count, _ = sync_goods(sync_date)
-        store_processed_count, _ = sync_stores(sync_date)
-        
+        result = run_daily_sync(sync_date)
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"同步商品数据时发生错误: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"同步商品数据失败: {str(e)}")
 
     return {
-        "message": f"成功同步聚水潭数据，处理了 {goods_processed_count} 条商品记录和 {store_processed_count} 条店铺记录",
+        "message": f"成功同步聚水潭数据，处理了 {result['goods_processed_count']} 条商品记录和 {result['stores_processed_count']} 条店铺记录",
         # "processed_count": processed_count,
+        "goods_processed_count": result['goods_processed_count'],
+        "stores_processed_count": result['stores_processed_count'],
+        "streams": result['streams']
+    }
+
+
+def _parse_sync_date(request):
+    """从请求体中解析 sync_date（YYYY-MM-DD），未提供时返回 None"""
+    sync_date_str = request.get('sync_date') if request else None
+    if not sync_date_str:
+        return None
+    try:
+        return datetime.strptime(sync_date_str, '%Y-%m-%d').date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式不正确，请使用 YYYY-MM-DD 格式")
+
+
+def run_daily_sync(sync_date, progress=None):
+    """
+    同步一天的聚水潭数据：构建订单快照，再写入商品表和店铺表
+    商品表和店铺表都只删除/写入该日期的数据，不同日期之间互不影响
+    progress: 可选的同步任务对象（见 services/sync_jobs.py），用于上报阶段和处理行数
+    """
+    # 两个订单集合只拉取、解析一次，商品和店铺数据共用同一份快照
+    snapshot = build_order_snapshot(sync_date, progress=progress)
+
+    # 同步商品和店铺数据
+    goods_processed_count, _ = sync_goods(sync_date, snapshot=snapshot, progress=progress)
+    store_processed_count, _ = sync_stores(sync_date, snapshot=snapshot, progress=progress)
+
+    return {
         "goods_processed_count": goods_processed_count,
-        "stores_processed_count": store_processed_count
+        "stores_processed_count": store_processed_count,
+        "orders_count": snapshot['sales_amount_order_count'] + snapshot['sales_cost_order_count'],
+        "streams": snapshot['streams']
+    }
+
+
+# 回补同步：并发的天数（可通过环境变量调整），以及单次允许的最大天数
+# 回补在 sync 通道中执行，每个并发的天占用一个数据库连接，最大并发数受 executors.py 的连接预算限制
+BACKFILL_MAX_WORKERS = SYNC_FANOUT_WORKERS
+BACKFILL_WORKERS = min(int(os.getenv("JST_BACKFILL_WORKERS", BACKFILL_MAX_WORKERS)), BACKFILL_MAX_WORKERS)
+BACKFILL_MAX_DAYS = 93
+
+
+def _backfill_one_day(sync_date):
+    """回补中的单日任务：失败只记录在当天的结果里，不影响其他日期"""
+    started = time.time()
+    report = {
+        "date": sync_date.strftime('%Y-%m-%d'),
+        "status": "success",
+        "orders_count": 0,
+        "goods_processed_count": 0,
+        "stores_processed_count": 0,
+        "elapsed": 0,
+        "rows_per_second": 0,
+        "error": None
+    }
+    try:
+        # 每个工作线程用完即归还自己的数据库连接
+        with models_database.connection_context():
+            result = run_daily_sync(sync_date)
+        report.update(result)
+    except Exception as e:
+        report["status"] = "failed"
+        report["error"] = e.detail if isinstance(e, HTTPException) else str(e)
+        print(f"回补 {report['date']} 失败: {report['error']}")
+
+    elapsed = time.time() - started
+    rows = report["goods_processed_count"] + report["stores_processed_count"]
+    report["elapsed"] = round(elapsed, 3)
+    report["rows_per_second"] = round(rows / elapsed, 2) if elapsed > 0 else 0
+    return report
+
+
+# 按日期范围回补同步，多天并发执行
+@router.post("/sync_jushuitan_backfill")
+@run_in_lane(sync_lane)
+def sync_jushuitan_backfill(request: dict):
+    """
+    按日期范围回补同步聚水潭数据
+    
+    请求参数:
+        start_date: 开始日期，格式 YYYY-MM-DD
+        end_date: 结束日期，格式 YYYY-MM-DD（包含当天）
+        workers: 同时同步的天数，默认和最大值为 SYNC_FANOUT_WORKERS（见 services/executors.py）
+    
+    返回每一天的同步状态、处理条数、耗时和吞吐量
+    """
+    try:
+        start_date = datetime.strptime(request.get('start_date') or '', '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.get('end_date') or '', '%Y-%m-%d').date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式不正确，请使用 YYYY-MM-DD 格式")
+
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="开始日期不能晚于结束日期")
+
+    day_count = (end_date - start_date).days + 1
+    if day_count > BACKFILL_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"单次回补最多 {BACKFILL_MAX_DAYS} 天")
+
+    try:
+        workers = int(request.get('workers') or BACKFILL_WORKERS)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="workers 必须是整数")
+    workers = max(1, min(workers, BACKFILL_MAX_WORKERS, day_count))
+
+    sync_dates = [start_date + timedelta(days=i) for i in range(day_count)]
+    print(f"开始回补 {start_date} 至 {end_date}，共 {day_count} 天，并发 {workers}")
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        days = list(pool.map(_backfill_one_day, sync_dates))
+    elapsed = time.time() - started
+
+    failed_days = [day["date"] for day in days if day["status"] == "failed"]
+    total_rows = sum(day["goods_processed_count"] + day["stores_processed_count"] for day in days)
+
+    return {
+        "message": f"回补完成：成功 {day_count - len(failed_days)} 天，失败 {len(failed_days)} 天",
+        "start_date": start_date.strftime('%Y-%m-%d'),
+        "end_date": end_date.strftime('%Y-%m-%d'),
+        "workers": workers,
+        "failed_days": failed_days,
+        "elapsed": round(elapsed, 3),
+        "rows_per_second": round(total_rows / elapsed, 2) if elapsed > 0 else 0,
+        "days": days
+    }
+
+
+
+
+# 提交后台同步任务，立即返回任务ID
+@router.post("/sync_jobs")
+def submit_sync_job(request: dict = None):
+    """
+    提交聚水潭同步任务，在后台线程执行，通过 /sync_jobs/{job_id} 查询进度
+    
+    请求参数:
+        sync_date: 同步日期，格式 YYYY-MM-DD（可选）
+        mode: daily（默认，按天全量同步）或 incremental（按订单修改时间增量同步，忽略 sync_date）
+    
+    同一日期（或增量同步）已有未结束的任务时返回 409
+    """
+    mode = (request or {}).get('mode') or 'daily'
+    if mode not in ('daily', 'incremental'):
+        raise HTTPException(status_code=400, detail="mode 只能是 daily 或 incremental")
+
+    if mode == 'incremental':
+        key = 'incremental'
+        label = '增量同步'
+    else:
+        sync_date = _parse_sync_date(request)
+        key = sync_date.strftime('%Y-%m-%d') if sync_date else 'default'
+        label = f"日期 {key}"
+
+    def _job(job):
+        # 在 sync 通道中执行，结束后通道归还数据库连接
+        if mode == 'incremental':
+            return run_incremental_sync(progress=job)
+        return run_daily_sync(sync_date, progress=job)
+
+    try:
+        job = sync_job_manager.submit(key, _job, description=f"同步聚水潭数据 {key}")
+    except DuplicateSyncJobError as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": f"{label} 已有同步任务正在执行", "job_id": e.job.id}
+        )
+    except LaneBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    return {
+        "message": f"同步任务已提交：{key}",
+        "job_id": job.id,
+        "status": job.status
+    }
+
+
+# 查询同步任务进度
+@router.get("/sync_jobs/{job_id}")
+def get_sync_job(job_id: str):
+    """返回同步任务的阶段、已处理行数、每秒处理行数和错误信息"""
+    job = sync_job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="同步任务不存在")
+    return job.to_dict()
+
+
+# 最近的同步任务列表
+@router.get("/sync_jobs")
+def list_sync_jobs(limit: int = Query(20, ge=1, le=200)):
+    """返回最近提交的同步任务（按提交时间倒序）"""
+    return {"data": [job.to_dict() for job in sync_job_manager.list_jobs(limit)]}
+
+
+# 报表接口响应缓存统计
+@router.get("/response_cache_stats")
+def get_response_cache_stats():
+    """报表接口响应缓存的命中、未命中、淘汰次数（按接口），用于调整缓存大小"""
+    return response_cache.get_stats()
+
+
+# 接口执行通道统计
+@router.get("/executor_stats")
+def get_executor_stats():
+    """各执行通道（interactive / db / sync）的线程数、执行中和排队中的任务数、等待时间"""
+    return get_lane_stats()
+
+
+# 聚水潭接口调用统计
+@router.get("/sync_client_stats")
+def get_sync_client_stats():
+    """返回 scm121 共享客户端按接口统计的调用次数、失败/重试次数和耗时"""
+    return {"data": scm121_client.get_stats()}
+
+
+def _fallback_order_time(sync_date):
+    """订单没有可用时间时的兜底值：优先使用同步日期零点"""
+    if sync_date:
+        return datetime.combine(sync_date, datetime.min.time())
+    return datetime.now()
+
+
+def _new_order_snapshot(sync_date, track_orders=False):
+    return {
+        'sync_date': sync_date,
+        # 商品维度：key = (shopIid, shopId, oid, 订单时间)，与 goods 表唯一索引一致
+        'goods_sales_amount': {},
+        'goods_sales_cost': {},
+        # 店铺维度：key = (store_id, order_date)
+        'stores': {},
+        'store_sales_cost': {},
+        'sales_amount_order_count': 0,
+        'sales_cost_order_count': 0,
+        # 每个订单流已累加的订单ID，分页拉取时重复出现的订单只累加一次
+        'sales_amount_oids': set(),
+        'sales_cost_oids': set(),
+        # 订单维度（只在增量同步时记录）：key = oid，两个订单流各写各的
+        'order_amounts': {} if track_orders else None,
+        'order_costs': {} if track_orders else None,
+        # 已不计入销售金额的订单（状态不在 SALES_AMOUNT_ORDER_STATUS 中）：oid -> 修改时间
+        'excluded_orders': {} if track_orders else None,
+    }
+
+
+def _new_store_data(store_id, store_name, order_date, last_order_time):
+    """店铺日汇总的初始值"""
+    return {
+        'store_id': store_id,
+        'store_name': store_name or '未知店铺',
+        'order_date': order_date,
+        'total_payment_amount': 0.0,
+        'total_sales_amount': 0.0,
+        'total_refund_amount': 0.0,
+        'total_sales_cost': 0.0,
+        'total_gross_profit_1_occurred': 0.0,
+        'total_advertising_expenses': 0.0,
+        'total_gross_profit_3': 0.0,
+        'total_gross_profit_4': 0.0,
+        'total_net_profit': 0.0,
+        'goods_count': 0,
+        'order_count': 0,
+        'creator': 'system',
+        'last_order_time': last_order_time,
+        'created_at': datetime.now(),
+        'updated_at': datetime.now()
+    }
+
+
+def _fold_sales_amount_batch(snapshot, batch):
+    """把一批展开后的销售金额订单累加进快照的商品和店铺聚合中，已累加过的订单跳过"""
+    batch = drop_repeated_orders(batch, snapshot['sales_amount_oids'])
+    sync_date = snapshot['sync_date']
+    orders = batch['orders']
+    goods = batch['goods']
+    snapshot['sales_amount_order_count'] += len(orders['order_id'])
+
+    # 订单时间无法解析时的兜底值，整批只计算一次
+    fallback_time = _fallback_order_time(sync_date)
+    fallback_date = sync_date
+
+    # 增量同步：记录订单级别的金额，用于重算店铺汇总；状态已不计入销售金额的订单单独记录，由调用方删除
+    order_amounts = snapshot['order_amounts']
+    if order_amounts is not None:
+        excluded_orders = snapshot['excluded_orders']
+        for oid, so_id, store_id, store_name, order_status, ts, amount, goods_count, goods_valid, updated in zip(
+                orders['order_id'], orders['so_id'], orders['store_id'], orders['store_name'], orders['status'],
+                orders['ts'], orders['amount'], orders['goods_count'], orders['goods_valid'], orders['updated']):
+            if not oid:
+                continue
+            if order_status and order_status not in SALES_AMOUNT_ORDER_STATUS:
+                excluded_orders[oid] = updated
+                continue
+            order_amounts[oid] = {
+                'oid': oid,
+                'so_id': so_id,
+                'store_id': store_id,
+                'store_name': store_name,
+                'order_date': ts.date() if ts else fallback_date,
+                'order_time': ts,
+                'sales_amount': amount,
+                'goods_count': goods_count,
+                'goods_valid': goods_valid,
+                'updated': updated,
+            }
+
+    # 商品维度：累加销售金额，使用 goods 表的自然键 (商品ID, 店铺ID, 订单ID, 订单时间) 作为唯一键
+    goods_map = snapshot['goods_sales_amount']
+    for goods_id, item_name, order_index, store_id, oid, so_id, ts, amount in zip(
+            goods['goods_id'], goods['item_name'], goods['order_index'], goods['store_id'],
+            goods['order_id'], goods['so_id'], goods['ts'], goods['amount']):
+        order_datetime = ts or fallback_time
+        store_id = store_id or ''
+        unique_key = (goods_id, store_id, oid, order_datetime)
+
+        goods_data = goods_map.get(unique_key)
+        if goods_data is None:
+            goods_map[unique_key] = {
+                'shop_iid': goods_id,
+                'item_name': item_name,
+                'shop_id': store_id,
+                'shop_name': orders['store_name'][order_index] or '未知店铺',
+                'order_id': oid,
+                'so_id': so_id,  # 线上订单号
+                'order_time': order_datetime,
+                'sales_amount': amount
+            }
+        else:
+            goods_data['sales_amount'] += amount
+
+    # 店铺维度：商品列表不是合法 JSON 的订单不计入；没有订单日期时使用同步日期
+    stores = snapshot['stores']
+    for store_id, store_name, ts, amount, goods_count, goods_valid in zip(
+            orders['store_id'], orders['store_name'], orders['ts'], orders['amount'],
+            orders['goods_count'], orders['goods_valid']):
+        if not goods_valid:
+            continue
+        order_date = ts.date() if ts else fallback_date
+        if not store_id or not order_date:
+            continue
+
+        order_datetime = ts or fallback_time
+        unique_key = (store_id, order_date)
+        store_data = stores.get(unique_key)
+        if store_data is None:
+            store_data = stores[unique_key] = _new_store_data(store_id, store_name, order_date, order_datetime)
+
+        # 累加销售金额
+        store_data['total_sales_amount'] += amount
+        store_data['goods_count'] += goods_count
+        store_data['order_count'] += 1
+
+        # 更新最后订单时间
+        if not store_data['last_order_time'] or order_datetime > store_data['last_order_time']:
+            store_data['last_order_time'] = order_datetime
+
+
+def _fold_sales_cost_batch(snapshot, batch):
+    """把一批展开后的销售成本订单累加进快照的商品和店铺成本中，已累加过的订单跳过"""
+    batch = drop_repeated_orders(batch, snapshot['sales_cost_oids'])
+    sync_date = snapshot['sync_date']
+    orders = batch['orders']
+    goods = batch['goods']
+    snapshot['sales_cost_order_count'] += len(orders['order_id'])
+    fallback_time = _fallback_order_time(sync_date)
+
+    order_costs = snapshot['order_costs']
+    if order_costs is not None:
+        for oid, amount, updated in zip(orders['order_id'], orders['amount'], orders['updated']):
+            if oid:
+                order_costs[oid] = {'sales_cost': amount, 'updated': updated}
+
+    # 商品维度：累加销售成本
+    goods_cost = snapshot['goods_sales_cost']
+    for goods_id, store_id, oid, ts, amount in zip(
+            goods['goods_id'], goods['store_id'], goods['order_id'], goods['ts'], goods['amount']):
+        unique_key = (goods_id, store_id or '', oid, ts or fallback_time)
+        goods_cost[unique_key] = goods_cost.get(unique_key, 0.0) + amount
+
+    # 店铺维度：按 (store_id, order_date) 累加销售成本
+    store_cost = snapshot['store_sales_cost']
+    for store_id, ts, amount in zip(orders['store_id'], orders['ts'], orders['amount']):
+        order_date = ts.date() if ts else sync_date
+        if store_id and order_date:
+            unique_key = (store_id, order_date)
+            store_cost[unique_key] = store_cost.get(unique_key, 0.0) + amount
+
+
+# 订单快照中的两个订单流：(名称, 显示名, 拉取方法, 金额字段, 累加方法)
+ORDER_SNAPSHOT_STREAMS = (
+    ('sales_amount', '销售金额', iter_jushuitan_orders_for_sales_amount, 'payAmount', _fold_sales_amount_batch),
+    ('sales_cost', '销售成本', iter_jushuitan_orders_for_sales_cost, 'drpAmount', _fold_sales_cost_batch),
+)
+# 增量同步使用的订单流：按修改时间拉取，累加方法相同
+MODIFIED_ORDER_STREAMS = (
+    ('sales_amount', '增量销售金额', iter_jushuitan_modified_orders_for_sales_amount, 'payAmount', _fold_sales_amount_batch),
+    ('sales_cost', '增量销售成本', iter_jushuitan_modified_orders_for_sales_cost, 'drpAmount', _fold_sales_cost_batch),
+)
+# 每次展开、累加的订单数
+ORDER_EXPLODE_BATCH_SIZE = 1000
+
+
+def _consume_order_stream(snapshot, stream_name, order_iter, amount_field, fold, page_size):
+    """
+    拉取一个订单流并累加进快照，结果记录在 snapshot['streams'][stream_name]
+    订单按批展开成列式数组（见 services/order_explode.py）后再累加
+    两个订单流写入快照中互不重叠的部分，可以在不同线程里同时执行
+    """
+    stream = snapshot['streams'][stream_name]
+    modified_since = snapshot.get('modified_since')
+    started = time.time()
+    try:
+        orders = order_iter(page_size=page_size, stats=stream, **snapshot['fetch_args'])
+        while True:
+            chunk = list(islice(orders, ORDER_EXPLODE_BATCH_SIZE))
+            if not chunk:
+                break
+            # 增量同步：上游没有按修改时间过滤时，跳过水位之前就没再修改过的订单
+            fold(snapshot, explode_orders(chunk, amount_field, modified_since=modified_since))
+        stream['status'] = 'success'
+    except Exception as e:
+        stream['status'] = 'failed'
+        stream['error'] = str(e)
+    stream['elapsed'] = round(time.time() - started, 3)
+    return stream
+
+
+# 订单快照：两个订单集合各拉取一次、商品列表各解析一次，商品台账和店铺汇总共用
+def build_order_snapshot(sync_date, page_size=None, progress=None, modified_window=None):
+    """
+    并发拉取销售金额和销售成本两个订单集合，边拉取边累加成快照
+    - 两个订单流同时拉取，每个订单流内部的分页也并发拉取（见 iter_jushuitan_order_pages）
+    - 每页订单解析后立即累加，原始订单不会在内存中堆积
+    - 快照中只保留商品维度和店铺维度的聚合结果，以及每个订单流的拉取情况
+    - 传入 modified_window=(开始时间, 结束时间) 时改为拉取这段时间内有修改的订单，并记录订单维度数据
+    """
+    if modified_window:
+        order_streams = MODIFIED_ORDER_STREAMS
+        print(f"正在获取有修改的订单数据，时间段: {modified_window[0]} ~ {modified_window[1]}")
+        snapshot = _new_order_snapshot(None, track_orders=True)
+        snapshot['fetch_args'] = {'start_time': modified_window[0], 'end_time': modified_window[1]}
+        snapshot['modified_since'] = modified_window[0]
+    else:
+        order_streams = ORDER_SNAPSHOT_STREAMS
+        print(f"正在获取销售金额和销售成本订单数据，日期: {sync_date}")
+        snapshot = _new_order_snapshot(sync_date)
+        snapshot['fetch_args'] = {'sync_date': sync_date}
+    snapshot['streams'] = {
+        name: {'status': 'pending', 'pages': 0, 'orders': 0, 'error': None, 'elapsed': 0}
+        for name, *_ in order_streams
     }
+    if progress:
+        progress.set_phase('fetching')
+        progress.attach_streams(snapshot['streams'])
+
+    with ThreadPoolExecutor(max_workers=len(order_streams)) as pool:
+        futures = [
+            pool.submit(_consume_order_stream, snapshot, name, order_iter, amount_field, fold, page_size)
+            for name, _, order_iter, amount_field, fold in order_streams
+        ]
+        for future in futures:
+            future.result()
+
+    for name, display_name, *_ in order_streams:
+        stream = snapshot['streams'][name]
+        print(f"{display_name}订单流: {stream['status']}，{stream['pages']} 页 {stream['orders']} 条，耗时 {stream['elapsed']} 秒")
+
+    # 任一订单流失败都不能写库，否则会用不完整的数据覆盖当天数据
+    failed = [
+        f"获取{display_name}数据失败（已获取 {snapshot['streams'][name]['orders']} 条）: {snapshot['streams'][name]['error']}"
+        for name, display_name, *_ in order_streams
+        if snapshot['streams'][name]['status'] == 'failed'
+    ]
+    if failed:
+        raise HTTPException(status_code=400, detail="；".join(failed))
+
+    print(f"订单快照构建完成：销售金额订单 {snapshot['sales_amount_order_count']} 条，销售成本订单 {snapshot['sales_cost_order_count']} 条")
+
+    return snapshot
+
+
+# goods 表的自然键，和 Goods.Meta.indexes 中的唯一索引保持一致
+GOODS_NATURAL_KEY = ('goods_id', 'store_id', 'order_id', 'goodorder_time')
+# 判断一行是否有变化时比较的字段（利润列由这些字段推导，不单独比较）
+GOODS_COMPARE_FIELDS = ('goods_name', 'store_name', 'soId', 'sales_amount', 'sales_cost')
+GOODS_SO_ID_INDEX = GOODS_COMPARE_FIELDS.index('soId')
+# 命中唯一键冲突时需要覆盖的字段（created_at / creator 保留首次写入的值）
+GOODS_UPSERT_FIELDS = (
+    'goods_name', 'store_name', 'soId', 'payment_amount', 'sales_amount', 'refund_amount', 'sales_cost',
+    'gross_profit_1_occurred', 'gross_profit_1_rate', 'advertising_ratio',
+    'gross_profit_3', 'gross_profit_3_rate', 'gross_profit_4', 'gross_profit_4_rate',
+    'net_profit', 'net_profit_rate', 'updated_at'
+)
+GOODS_UPSERT_BATCH_SIZE = 500
+
+
+# goods 表的金额列是单精度 FLOAT：读回的值和上游的值有差异（如 1234.56 读回 1234.5600586，
+# 123456.78 读回 123456.78125），比较金额时先都转成单精度，写入后不会改变存储值的视为相同
+_FLOAT32 = struct.Struct('<f')
 
 
+def _as_float32(value):
+    return _FLOAT32.unpack(_FLOAT32.pack(value))[0]
 
 
-# 从两个接口获取对应的数据
-def get_sales_amount_data_and_sales_cost_data(sync_date):
-    sales_amount_data = get_jushuitan_orders_for_sales_amount(sync_date=sync_date)
-    sales_cost_data = get_jushuitan_orders_for_sales_cost(sync_date=sync_date)
-    return sales_amount_data, sales_cost_data
+def _goods_row_signature(row):
+    """用于比较新旧数据是否一致的字段值，金额转成 float"""
+    signature = []
+    for field in GOODS_COMPARE_FIELDS:
+        value = row.get(field)
+        if isinstance(value, int) and not isinstance(value, bool):
+            value = float(value)
+        signature.append(value if value is not None else '')
+    return tuple(signature)
 
 
+def _goods_signature_changed(old_signature, new_signature):
+    """逐个字段比较签名，金额按单精度比较"""
+    for old_value, new_value in zip(old_signature, new_signature):
+        if isinstance(old_value, float) and isinstance(new_value, float):
+            if _as_float32(old_value) != _as_float32(new_value):
+                return True
+        elif old_value != new_value:
+            return True
+    return False
+
+
+def _goods_sync_ranges(sync_date, goods_dict):
+    """
+    本次同步覆盖的订单时间范围（查询条件列表）：指定日期时为当天，
+    未指定日期时取本次数据中出现的日期（不再清空整张表）
+    """
+    if sync_date:
+        order_dates = [sync_date]
+    else:
+        order_dates = sorted({row['goodorder_time'].date() for row in goods_dict.values() if row['goodorder_time']})
+    return [
+        (Goods.goodorder_time >= datetime.combine(order_date, datetime.min.time())) &
+        (Goods.goodorder_time <= datetime.combine(order_date, datetime.max.time()))
+        for order_date in order_dates
+    ]
+
+
+def _upsert_goods_rows(goods_dict, scopes, progress=None):
+    """
+    把按自然键聚合好的商品行增量写入 goods 表：
+    - scopes 为同步范围的查询条件列表（按日期或按订单ID）
+    - 读出同步范围内已有的行，和新数据逐行比较，未变化的行直接跳过
+    - 新增和有变化的行用 INSERT ... ON DUPLICATE KEY UPDATE 分批写入
+    - 同步范围内已存在、但本次上游数据中没有的行（以及历史遗留的重复行）删除
+    - 再补全涉及到的 (店铺, 日期) 的广告费、退款和利润列，最后重算这些日期的商品日汇总
+    - 写入到重算在一个事务中完成
+    """
+    stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0, 'daily_rows': 0}
+
+    # 读出同步范围内已有的行：自然键 -> (id, 比较签名)
+    existing = {}
+    stale_ids = []
+    # 新增、修改、删除的行涉及的 (店铺, 日期) 和 (店铺, 线上订单号)，用于重算商品日汇总
+    daily_keys = set()
+    so_keys = set()
+    select_fields = [Goods.id] + [getattr(Goods, field) for field in GOODS_NATURAL_KEY + GOODS_COMPARE_FIELDS]
+    for scope in scopes:
+        query = Goods.select(*select_fields).where(scope).dicts()
+        for row in query:
+            key = tuple(row[field] if row[field] is not None else '' for field in GOODS_NATURAL_KEY)
+            if key in existing:
+                # 旧版本按 shopIid + 订单时间 写入时可能留下重复行，只保留一条
+                stale_ids.append(row['id'])
+                if row['goodorder_time']:
+                    daily_keys.add((row['store_id'], row['goodorder_time'].date()))
+                continue
+            existing[key] = (row['id'], _goods_row_signature(row))
+
+    changed_rows = []
+    for key, row in goods_dict.items():
+        current = existing.pop(key, None)
+        if current is None:
+            stats['inserted'] += 1
+            changed_rows.append(row)
+        elif _goods_signature_changed(current[1], _goods_row_signature(row)):
+            stats['updated'] += 1
+            changed_rows.append(row)
+            so_keys.add((key[1], current[1][GOODS_SO_ID_INDEX]))
+        else:
+            stats['unchanged'] += 1
+            continue
+        if row['goodorder_time']:
+            daily_keys.add((row['store_id'], row['goodorder_time'].date()))
+        so_keys.add((row['store_id'], row['soId']))
+
+    # 剩下的是上游已经不存在的行
+    for key, (row_id, signature) in existing.items():
+        stale_ids.append(row_id)
+        if key[3]:
+            daily_keys.add((key[1], key[3].date()))
+        so_keys.add((key[1], signature[GOODS_SO_ID_INDEX]))
+
+    print(f"商品增量比对完成：新增 {stats['inserted']} 条，更新 {stats['updated']} 条，"
+          f"未变化 {stats['unchanged']} 条，待删除 {len(stale_ids)} 条")
+
+    upsert_fields = [getattr(Goods, field) for field in GOODS_UPSERT_FIELDS]
+    written_count = 0
+    # 写入、删除、补全和重算商品日汇总在同一个事务里，中途失败时整体回滚，商品台账和日汇总保持一致
+    with models_database.atomic():
+        for i in range(0, len(changed_rows), GOODS_UPSERT_BATCH_SIZE):
+            batch = changed_rows[i:i + GOODS_UPSERT_BATCH_SIZE]
+            Goods.insert_many(batch).on_conflict(preserve=upsert_fields).execute()
+            written_count += len(batch)
+            if progress:
+                progress.add_rows(len(batch))
+            print(f"成功写入批次 {i // GOODS_UPSERT_BATCH_SIZE + 1}: {len(batch)} 条商品记录，进度 {written_count}/{len(changed_rows)}")
+
+        for i in range(0, len(stale_ids), GOODS_UPSERT_BATCH_SIZE):
+            batch_ids = stale_ids[i:i + GOODS_UPSERT_BATCH_SIZE]
+            stats['deleted'] += Goods.delete().where(Goods.id.in_(batch_ids)).execute()
+
+        enrich_goods_days(daily_keys)
+        stats['daily_rows'] = refresh_goods_daily(daily_keys, so_keys)
+    return stats
+
+
+def _build_goods_rows(snapshot):
+    """合并快照中的商品销售金额和销售成本，计算利润指标，返回 {自然键: goods 行}"""
+    sales_amount_map = snapshot['goods_sales_amount']
+    sales_cost_map = snapshot['goods_sales_cost']
+    
+    # 合并两个映射表，构建最终的商品数据
+    goods_dict = {}
+    for unique_key, sales_data in sales_amount_map.items():
+        # 获取对应的销售成本
+        sales_cost = sales_cost_map.get(unique_key, 0.0)
+        
+        # 提取数值，确保不为 None
+        sales_amount = sales_data['sales_amount'] or 0.0
+        cost_amount = sales_cost or 0.0
+        
+        # 直接在这里计算利润指标
+        gross_profit_1_occurred = sales_amount - cost_amount
+        gross_profit_1_rate = round(((sales_amount - cost_amount) / sales_amount) * 100, 2) if sales_amount > 0 else 0
+        
+        # 广告费先写 0，写入后由 enrich_goods_days 按拼多多推广数据补全
+        ad_cost = 0.0
+        advertising_ratio = round((ad_cost / sales_amount) * 100, 2) if sales_amount > 0 else 0
+        
+        gross_profit_3 = sales_amount - cost_amount - ad_cost
+        gross_profit_3_rate = round(((sales_amount - cost_amount - ad_cost) / sales_amount) * 100, 2) if sales_amount > 0 else 0
+        
+        gross_profit_4 = sales_amount - cost_amount - ad_cost
+        gross_profit_4_rate = round(((sales_amount - cost_amount - ad_cost) / sales_amount) * 100, 2) if sales_amount > 0 else 0
+        
+        net_profit = sales_amount - cost_amount - ad_cost
+        net_profit_rate = round(((sales_amount - cost_amount - ad_cost) / sales_amount) * 100, 2) if sales_amount > 0 else 0
+        
+        goods_dict[unique_key] = {
+            'goods_id': sales_data['shop_iid'],
+            'goods_name': sales_data['item_name'],
+            'store_id': sales_data['shop_id'],
+            'store_name': sales_data['shop_name'],
+            'order_id': sales_data['order_id'],
+            'soId': sales_data['so_id'],
+            'payment_amount': 0.0,
+            'sales_amount': sales_amount,
+            'refund_amount': 0.0,
+            'sales_cost': cost_amount,
+            'gross_profit_1_occurred': gross_profit_1_occurred,
+            'gross_profit_1_rate': gross_profit_1_rate,
+            'advertising_ratio': advertising_ratio,
+            'gross_profit_3': gross_profit_3,
+            'gross_profit_3_rate': gross_profit_3_rate,
+            'gross_profit_4': gross_profit_4,
+            'gross_profit_4_rate': gross_profit_4_rate,
+            'net_profit': net_profit,
+            'net_profit_rate': net_profit_rate,
+            'creator': 'system',
+            'created_at': datetime.now(),
+            'goodorder_time': sales_data['order_time'],
+            'updated_at': datetime.now()
+        }
+
+    return goods_dict
+
 
 # 批量新增商品台账方法
-def sync_goods(sync_date):
+def sync_goods(sync_date, snapshot=None, progress=None):
     """
     同步订单数据中的商品信息到goods表
-    - 从两个不同的API获取销售金额和销售成本数据
-    - 提取disInnerOrderGoodsViewList中的商品数据
-    - 按shopIid聚合相同商品的金额
+    - 使用订单快照中按 (shopIid, shopId, oid, 订单时间) 聚合好的销售金额和销售成本（未传入时自行构建）
+    - 按自然键增量写入，只写新增和有变化的行
     - 支持按指定日期同步数据
     """
 
     try:
         # 同步商品数据
         print("开始拉取商品数据，并同步至数据库...")
-        # 获取销售金额数据（包含所有状态）
-        print(f"正在获取销售金额数据，日期: {sync_date}")
-        # 获取销售成本数据（不包含已取消和被拆分）
-        print(f"正在获取销售成本数据，日期: {sync_date}")
+        if snapshot is None:
+            snapshot = build_order_snapshot(sync_date, progress=progress)
+        if progress:
+            progress.set_phase('writing_goods')
 
-        sales_amount_data, sales_cost_data = get_sales_amount_data_and_sales_cost_data(sync_date)
-        
-        
-        if not sales_amount_data or 'data' not in sales_amount_data:
-            raise HTTPException(status_code=400, detail="获取销售金额数据失败")
-        
-        if not sales_cost_data or 'data' not in sales_cost_data:
-            raise HTTPException(status_code=400, detail="获取销售成本数据失败")
-        
-        # 构建销售金额映射表：key = shopIid, value = payAmount
-        sales_amount_map = {}
-        for order in sales_amount_data.get('data', []):
-            try:
-                payAmount = float(order.get('payAmount', 0) or 0)
-                
-                # 解析商品列表
-                goods_list_raw = order.get('disInnerOrderGoodsViewList')
-                try:
-                    if isinstance(goods_list_raw, str):
-                        goods_list = json.loads(goods_list_raw)
-                    else:
-                        goods_list = goods_list_raw
-                except json.JSONDecodeError:
-                    continue
-                
-                if not isinstance(goods_list, list):
-                    if goods_list is None:
-                        goods_list = []
-                    else:
-                        goods_list = [goods_list]
-                
-                # 遍历商品，累加销售金额
-                for goods_item in goods_list:
-                    if not isinstance(goods_item, dict):
-                        continue
-                    
-                    shop_iid = goods_item.get('shopIid')
-                    if not shop_iid:
-                        continue
-                    
-                    # 获取订单时间
-                    order_time_str = order.get('orderTime')
-                    order_datetime = None
-                    if order_time_str:
-                        try:
-                            if 'T' in order_time_str:
-                                order_datetime = datetime.fromisoformat(order_time_str.replace('Z', '+00:00'))
-                            else:
-                                order_datetime = datetime.strptime(order_time_str, '%Y-%m-%d %H:%M:%S')
-                        except ValueError:
-                            try:
-                                order_datetime = datetime.strptime(order_time_str, '%Y-%m-%d')
-                            except ValueError:
-                                order_datetime = datetime.now()
-                    else:
-                        order_datetime = datetime.now()
-                    
-                    # 使用shopIid + 订单时间作为唯一键
-                    unique_key = f"{shop_iid}_{order_datetime.strftime('%Y%m%d%H%M%S')}"
-                    
-                    if unique_key not in sales_amount_map:
-                        sales_amount_map[unique_key] = {
-                            'shop_iid': shop_iid,
-                            'item_name': goods_item.get('itemName', '未知商品'),
-                            'shop_id': order.get('shopId') or '',
-                            'shop_name': order.get('shopName') or '未知店铺',
-                            'order_id': order.get('oid') or '',
-                            'so_id': order.get('soId') or '',  # 线上订单号
-                            'order_time': order_datetime,
-                            'sales_amount': payAmount
-                        }
-                    else:
-                        sales_amount_map[unique_key]['sales_amount'] += payAmount
-                        
-            except Exception as e:
-                print(f"处理销售金额订单时出错: {e}")
-                continue
-        
-        # 构建销售成本映射表：key = shopIid, value = drpAmount
-        sales_cost_map = {}
-        for order in sales_cost_data.get('data', []):
-            try:
-                drpAmount = float(order.get('drpAmount', 0) or 0)
-                
-                # 解析商品列表
-                goods_list_raw = order.get('disInnerOrderGoodsViewList')
-                try:
-                    if isinstance(goods_list_raw, str):
-                        goods_list = json.loads(goods_list_raw)
-                    else:
-                        goods_list = goods_list_raw
-                except json.JSONDecodeError:
-                    continue
-                
-                if not isinstance(goods_list, list):
-                    if goods_list is None:
-                        goods_list = []
-                    else:
-                        goods_list = [goods_list]
-                
-                # 遍历商品，累加销售成本
-                for goods_item in goods_list:
-                    if not isinstance(goods_item, dict):
-                        continue
-                    
-                    shop_iid = goods_item.get('shopIid')
-                    if not shop_iid:
-                        continue
-                    
-                    # 获取订单时间
-                    order_time_str = order.get('orderTime')
-                    order_datetime = None
-                    if order_time_str:
-                        try:
-                            if 'T' in order_time_str:
-                                order_datetime = datetime.fromisoformat(order_time_str.replace('Z', '+00:00'))
-                            else:
-                                order_datetime = datetime.strptime(order_time_str, '%Y-%m-%d %H:%M:%S')
-                        except ValueError:
-                            try:
-                                order_datetime = datetime.strptime(order_time_str, '%Y-%m-%d')
-                            except ValueError:
-                                order_datetime = datetime.now()
-                    else:
-                        # 如果没有订单时间，则使用同步日期并转换为年月日时分秒
-                        if sync_date:
-                            order_datetime = datetime.combine(sync_date, datetime.min.time())
-                        else:
-                            order_datetime = datetime.now()
-                    
-                    # 使用shopIid + 订单时间作为唯一键
-                    unique_key = f"{shop_iid}_{order_datetime.strftime('%Y%m%d%H%M%S')}"
-                    
-                    if unique_key not in sales_cost_map:
-                        sales_cost_map[unique_key] = drpAmount
-                    else:
-                        sales_cost_map[unique_key] += drpAmount
-                        
-            except Exception as e:
-                print(f"处理销售成本订单时出错: {e}")
-                continue
-        
-        # 合并两个映射表，构建最终的商品数据
-        goods_dict = {}
-        for unique_key, sales_data in sales_amount_map.items():
-            # 获取对应的销售成本
-            sales_cost = sales_cost_map.get(unique_key, 0.0)
-            
-            # 提取数值，确保不为 None
-            sales_amount = sales_data['sales_amount'] or 0.0
-            cost_amount = sales_cost or 0.0
-            
-            # 直接在这里计算利润指标
-            gross_profit_1_occurred = sales_amount - cost_amount
-            gross_profit_1_rate = round(((sales_amount - cost_amount) / sales_amount) * 100, 2) if sales_amount > 0 else 0
-            
-            # 广告费用暂时为 0（后续可以从其他数据源获取）
-            ad_cost = 0.0
-            advertising_ratio = round((ad_cost / sales_amount) * 100, 2) if sales_amount > 0 else 0
-            
-            gross_profit_3 = sales_amount - cost_amount - ad_cost
-            gross_profit_3_rate = round(((sales_amount - cost_amount - ad_cost) / sales_amount) * 100, 2) if sales_amount > 0 else 0
-            
-            gross_profit_4 = sales_amount - cost_amount - ad_cost
-            gross_profit_4_rate = round(((sales_amount - cost_amount - ad_cost) / sales_amount) * 100, 2) if sales_amount > 0 else 0
-            
-            net_profit = sales_amount - cost_amount - ad_cost
-            net_profit_rate = round(((sales_amount - cost_amount - ad_cost) / sales_amount) * 100, 2) if sales_amount > 0 else 0
-            
-            goods_dict[unique_key] = {
-                'goods_id': sales_data['shop_iid'],
-                'goods_name': sales_data['item_name'],
-                'store_id': sales_data['shop_id'],
-                'store_name': sales_data['shop_name'],
-                'order_id': sales_data['order_id'],
-                'soId': sales_data['so_id'],
-                'payment_amount': 0.0,
-                'sales_amount': sales_amount,
-                'refund_amount': 0.0,
-                'sales_cost': cost_amount,
-                'gross_profit_1_occurred': gross_profit_1_occurred,
-                'gross_profit_1_rate': gross_profit_1_rate,
-                'advertising_ratio': advertising_ratio,
-                'gross_profit_3': gross_profit_3,
-                'gross_profit_3_rate': gross_profit_3_rate,
-                'gross_profit_4': gross_profit_4,
-                'gross_profit_4_rate': gross_profit_4_rate,
-                'net_profit': net_profit,
-                'net_profit_rate': net_profit_rate,
-                'creator': 'system',
-                'created_at': datetime.now(),
-                'goodorder_time': sales_data['order_time'],
-                'updated_at': datetime.now()
-            }
-        
-        # 删除之前同步的相同日期的数据（避免重复）
-        if sync_date:
-            start_of_day = datetime.combine(sync_date, datetime.min.time())
-            end_of_day = datetime.combine(sync_date, datetime.max.time())
-            Goods.delete().where(
-                (Goods.goodorder_time >= start_of_day) & 
-                (Goods.goodorder_time <= end_of_day)
-            ).execute()
-        else:
-            Goods.delete().execute()
-
-        # 使用 insert_many 批量插入新的商品记录（已包含利润指标）
-        goods_data_list = list(goods_dict.values())
-        if goods_data_list:
-            print(f"开始插入 {len(goods_data_list)} 条商品记录...")
-            batch_size = 500
-            inserted_count = 0
-            for i in range(0, len(goods_data_list), batch_size):
-                batch = goods_data_list[i:i + batch_size]
-                try:
-                    Goods.insert_many(batch).execute()
-                    inserted_count += len(batch)
-                    print(f"成功插入批次 {i//batch_size + 1}: {len(batch)} 条商品记录，进度 {inserted_count}/{len(goods_data_list)}")
-                except Exception as e:
-                    print(f"批量插入商品失败，尝试逐条插入：{e}")
-                    for item in batch:
-                        try:
-                            Goods.create(**item)
-                            inserted_count += 1
-                        except Exception as create_error:
-                            print(f"插入单条商品记录失败：{create_error}")
-                            continue
-            print(f"商品记录插入完成，总计 {inserted_count} 条")
-
-       
+        goods_dict = _build_goods_rows(snapshot)
+
+        # 按自然键增量写入：只写新增和有变化的行，删除本次范围内上游已不存在的行
+        write_stats = _upsert_goods_rows(goods_dict, _goods_sync_ranges(sync_date, goods_dict), progress=progress)
+        bump_data_version()
 
         # 统计处理结果
         processed_count = len(goods_dict)
         print(f"商品数据处理完成，共 {processed_count} 条记录")
-        
+        change_text = (
+            f"新增 {write_stats['inserted']} 条，更新 {write_stats['updated']} 条，"
+            f"未变化 {write_stats['unchanged']} 条，删除 {write_stats['deleted']} 条"
+        )
+
         # 根据是否指定了同步日期返回不同的消息
         if sync_date:
-            message_text = f"成功同步指定日期 {sync_date} 的商品数据，处理了 {processed_count} 条商品记录"
+            message_text = f"成功同步指定日期 {sync_date} 的商品数据，处理了 {processed_count} 条商品记录（{change_text}）"
         else:
-            message_text = f"成功同步商品数据，处理了 {processed_count} 条商品记录"
+            message_text = f"成功同步商品数据，处理了 {processed_count} 条商品记录（{change_text}）"
 
         print(message_text)
 
@@ -530,212 +1081,125 @@ def sync_goods(sync_date):
 
 
 
+def _build_store_record(store_data):
+    """根据店铺日汇总计算利润指标，返回 stores 表的一行"""
+    # 确保所有数值字段都不为 None
+    sales_amount = store_data['total_sales_amount'] or 0.0
+    cost_amount = store_data['total_sales_cost'] or 0.0
+    
+    # 计算各种利润指标
+    gross_profit_1_occurred = sales_amount - cost_amount
+    avg_gross_profit_1_rate = round(((sales_amount - cost_amount) / sales_amount) * 100, 2) if sales_amount > 0 else 0
+    
+    # 广告费先写 0，写入后由 enrich_store_days 按拼多多推广数据补全
+    ad_cost = 0.0
+    avg_advertising_ratio = round((ad_cost / sales_amount) * 100, 2) if sales_amount > 0 else 0
+    
+    gross_profit_3 = sales_amount - cost_amount - ad_cost
+    avg_gross_profit_3_rate = round(((sales_amount - cost_amount - ad_cost) / sales_amount) * 100, 2) if sales_amount > 0 else 0
+    
+    gross_profit_4 = sales_amount - cost_amount - ad_cost
+    avg_gross_profit_4_rate = round(((sales_amount - cost_amount - ad_cost) / sales_amount) * 100, 2) if sales_amount > 0 else 0
+    
+    net_profit = sales_amount - cost_amount - ad_cost
+    avg_net_profit_rate = round(((sales_amount - cost_amount - ad_cost) / sales_amount) * 100, 2) if sales_amount > 0 else 0
+    
+    # 构建完整的店铺记录
+    return {
+        'store_id': str(store_data['store_id']),  # 确保是字符串
+        'store_name': store_data['store_name'],
+        'order_date': store_data['order_date'],
+        'total_payment_amount': store_data['total_payment_amount'] or 0.0,
+        'total_sales_amount': sales_amount,
+        'total_refund_amount': store_data['total_refund_amount'] or 0.0,
+        'total_sales_cost': cost_amount,
+        'total_gross_profit_1_occurred': gross_profit_1_occurred,
+        'avg_gross_profit_1_rate': avg_gross_profit_1_rate,
+        'total_advertising_expenses': ad_cost,
+        'avg_advertising_ratio': avg_advertising_ratio,
+        'total_gross_profit_3': gross_profit_3,
+        'avg_gross_profit_3_rate': avg_gross_profit_3_rate,
+        'total_gross_profit_4': gross_profit_4,
+        'avg_gross_profit_4_rate': avg_gross_profit_4_rate,
+        'total_net_profit': net_profit,
+        'avg_net_profit_rate': avg_net_profit_rate,
+        'goods_count': store_data['goods_count'],
+        'order_count': store_data['order_count'],
+        'creator': 'system',
+        'last_order_time': store_data['last_order_time'],
+        'created_at': datetime.now(),
+        'updated_at': datetime.now()
+    }
+
+
+STORE_INSERT_BATCH_SIZE = 500
+
+
+def _replace_store_days(stores_data_list, sync_date, progress=None):
+    """
+    在单个事务中替换店铺日汇总：删除涉及日期的旧数据，再批量插入新数据
+    - 涉及日期 = 同步日期 + 本次数据中出现的订单日期
+    - 事务提交前其他连接读到的仍是旧数据，提交后一次性切换到新数据
+    - 任意一批插入失败时整体回滚，保留旧数据，不再逐条插入
+    """
+    dates_to_replace = set()
+    if sync_date:
+        dates_to_replace.add(sync_date.date() if isinstance(sync_date, datetime) else sync_date)
+    for item in stores_data_list:
+        item_date = item['order_date']
+        dates_to_replace.add(item_date.date() if isinstance(item_date, datetime) else item_date)
+
+    if not dates_to_replace:
+        print("没有需要写入的店铺数据")
+        return 0, 0
+
+    with models_database.atomic():
+        deleted = Store.delete().where(Store.order_date.in_(sorted(dates_to_replace))).execute()
+        print(f"删除 {len(dates_to_replace)} 个日期的店铺数据：{deleted} 条")
+
+        inserted_count = 0
+        for i in range(0, len(stores_data_list), STORE_INSERT_BATCH_SIZE):
+            batch = stores_data_list[i:i + STORE_INSERT_BATCH_SIZE]
+            Store.insert_many(batch).execute()
+            inserted_count += len(batch)
+            print(f"成功插入批次 {i // STORE_INSERT_BATCH_SIZE + 1}: {len(batch)} 条店铺记录，进度 {inserted_count}/{len(stores_data_list)}")
+
+        # 补全广告费、退款和利润列，和插入在同一个事务里提交
+        enrich_store_days({(item['store_id'], item['order_date']) for item in stores_data_list})
+
+    if progress:
+        progress.add_rows(inserted_count)
+    print(f"店铺记录替换完成：删除 {deleted} 条，插入 {inserted_count} 条")
+    return deleted, inserted_count
+
+
 # 批量新增店铺表数据
-def sync_stores(sync_date):
+def sync_stores(sync_date, snapshot=None, progress=None):
     """
     同步订单数据中的店铺信息到stores表
-    - 从两个不同的API获取销售金额和销售成本数据
-    - 按shopId聚合店铺数据
+    - 使用订单快照中按 (shopId, 订单日期) 聚合好的店铺数据（未传入时自行构建）
     - 计算各种利润指标和汇总数据
+    - 在单个事务中替换涉及日期的数据，并补全广告费、退款和利润列
     - 支持按指定日期同步数据
     """
     
     try:
-        
-        
         # 同步店铺数据
         print("开始拉取店铺数据，并同步至数据库...")
-        
-        # 获取销售金额数据（包含所有状态）
-        print(f"正在获取店铺销售金额数据，日期: {sync_date}")
-        # 获取销售成本数据（不包含已取消和被拆分）
-        print(f"正在获取店铺销售成本数据，日期: {sync_date}")
-
-        sales_amount_data, sales_cost_data = get_sales_amount_data_and_sales_cost_data(sync_date=sync_date)
-        
-        if not sales_amount_data or 'data' not in sales_amount_data:
-            raise HTTPException(status_code=400, detail="获取店铺销售金额数据失败")
-        
-        if not sales_cost_data or 'data' not in sales_cost_data:
-            raise HTTPException(status_code=400, detail="获取店铺销售成本数据失败")
+        if snapshot is None:
+            snapshot = build_order_snapshot(sync_date, progress=progress)
+        if progress:
+            progress.set_phase('writing_stores')
         
         # 用于存储店铺数据的字典，以 (store_id, order_date) 为唯一键
-        stores_dict = {}
+        stores_dict = snapshot['stores']
         
-        # 处理销售金额数据
-        for order in sales_amount_data.get('data', []):
-            try:
-                store_id = order.get('shopId')
-                store_name = order.get('shopName', '未知店铺')
-                
-                if not store_id:
-                    continue
-                
-                # 获取订单日期（只取日期部分）
-                order_time_str = order.get('orderTime')
-                order_date = None
-                if order_time_str:
-                    try:
-                        order_datetime = datetime.strptime(order_time_str, '%Y-%m-%d %H:%M:%S')
-                        order_date = order_datetime.date()
-                    except:
-                        pass
-                
-                # 如果没有订单日期，使用同步日期
-                if not order_date and sync_date:
-                    order_date = sync_date
-                
-                if not order_date:
-                    continue
-                
-                # 使用 (store_id, order_date) 作为唯一键
-                unique_key = (store_id, order_date)
-                
-                payAmount = float(order.get('payAmount', 0) or 0)
-                
-                # 解析商品列表
-                goods_list_raw = order.get('disInnerOrderGoodsViewList')
-                try:
-                    if isinstance(goods_list_raw, str):
-                        goods_list = json.loads(goods_list_raw)
-                    else:
-                        goods_list = goods_list_raw
-                except json.JSONDecodeError:
-                    continue
-                
-                if not isinstance(goods_list, list):
-                    if goods_list is None:
-                        goods_list = []
-                    else:
-                        goods_list = [goods_list]
-                
-                # 获取订单时间
-                order_datetime = None
-                if order_time_str:
-                    try:
-                        if 'T' in order_time_str:
-                            order_datetime = datetime.fromisoformat(order_time_str.replace('Z', '+00:00'))
-                        else:
-                            order_datetime = datetime.strptime(order_time_str, '%Y-%m-%d %H:%M:%S')
-                    except ValueError:
-                        try:
-                            order_datetime = datetime.strptime(order_time_str, '%Y-%m-%d')
-                        except ValueError:
-                            order_datetime = datetime.now()
-                else:
-                    # 如果没有订单时间，则使用同步日期并转换为年月日时分秒
-                    if sync_date:
-                        order_datetime = datetime.combine(sync_date, datetime.min.time())
-                    else:
-                        order_datetime = datetime.now()
-            
-                
-                # 初始化或累加店铺数据
-                if unique_key not in stores_dict:
-                    stores_dict[unique_key] = {
-                        'store_id': store_id,
-                        'store_name': store_name,
-                        'order_date': order_date,
-                        'total_payment_amount': 0.0,
-                        'total_sales_amount': 0.0,
-                        'total_refund_amount': 0.0,
-                        'total_sales_cost': 0.0,
-                        'total_gross_profit_1_occurred': 0.0,
-                        'total_advertising_expenses': 0.0,
-                        'total_gross_profit_3': 0.0,
-                        'total_gross_profit_4': 0.0,
-                        'total_net_profit': 0.0,
-                        'goods_count': 0,
-                        'order_count': 0,
-                        'creator': 'system',
-                        'last_order_time': order_datetime if order_datetime else datetime.combine(order_date, datetime.min.time()),
-                        'created_at': datetime.now(),
-                        'updated_at': datetime.now()
-                    }
-                
-                # 累加销售金额
-                store_data = stores_dict[unique_key]
-                store_data['total_sales_amount'] += payAmount
-                store_data['goods_count'] += len(goods_list)
-                store_data['order_count'] += 1
-                
-                # 更新最后订单时间
-                if order_datetime and (not store_data['last_order_time'] or order_datetime > store_data['last_order_time']):
-                    store_data['last_order_time'] = order_datetime
-                
-            except Exception as e:
-                print(f"处理店铺销售金额订单时出错: {e}")
-                continue
+        # 合并销售成本（只累加有销售金额的店铺日期）
+        for unique_key, sales_cost in snapshot['store_sales_cost'].items():
+            if unique_key in stores_dict:
+                stores_dict[unique_key]['total_sales_cost'] = sales_cost
         
-        # 处理销售成本数据
-        for order in sales_cost_data.get('data', []):
-            try:
-                store_id = order.get('shopId')
-                
-                if not store_id:
-                    continue
-                
-                # 获取订单日期
-                order_time_str = order.get('orderTime')
-                order_date = None
-                if order_time_str:
-                    try:
-                        order_datetime = datetime.strptime(order_time_str, '%Y-%m-%d %H:%M:%S')
-                        order_date = order_datetime.date()
-                    except:
-                        pass
-                
-                # 如果没有订单日期，使用同步日期
-                if not order_date and sync_date:
-                    order_date = sync_date
-                
-                if not order_date:
-                    continue
-                
-                # 使用 (store_id, order_date) 作为唯一键
-                unique_key = (store_id, order_date)
-                
-                drpAmount = float(order.get('drpAmount', 0) or 0)
-                
-                # 累加销售成本
-                if unique_key in stores_dict:
-                    stores_dict[unique_key]['total_sales_cost'] += drpAmount
-                
-            except Exception as e:
-                print(f"处理店铺销售成本订单时出错：{e}")
-                continue
-        
-        # 删除之前同步的相同日期的数据（避免重复）
-        if sync_date:
-            # 确保 sync_date 是 date 对象类型
-            from datetime import date as date_type, time as time_type
-            # 使用 datetime.date() 方法转换
-            if isinstance(sync_date, str):
-                target_date = datetime.strptime(sync_date, '%Y-%m-%d').date()
-            elif hasattr(sync_date, 'date') and callable(getattr(sync_date, 'date')):
-                # datetime 对象
-                target_date = sync_date.date()
-            elif isinstance(sync_date, date_type):
-                target_date = sync_date
-            else:
-                target_date = sync_date
-            
-            # 使用日期范围删除，确保删除当天的所有数据（兼容 datetime 和 date 类型）
-            start_of_day = datetime.combine(target_date, time_type.min)
-            end_of_day = datetime.combine(target_date, time_type.max)
-            
-            deleted = (Store.delete().where(
-                (Store.order_date >= start_of_day) & 
-                (Store.order_date <= end_of_day)
-            ).execute())
-            
-            print(f"已删除 {target_date} 的店铺数据，共 {deleted} 条记录")
-        else:
-            Store.delete().execute()
-            print("已清空所有店铺数据")
-
-        # 使用 insert_many 批量插入新的店铺记录
-        # 合并两个映射表，构建最终的店铺数据（在插入前计算好利润指标）
+        # 合并两个映射表，构建最终的店铺数据（在写入前计算好利润指标）
         stores_data_list = []
         
         # 检查是否有重复的 unique_key
@@ -753,134 +1217,21 @@ def sync_stores(sync_date):
             else:
                 seen_keys.add(key_tuple)
             
-            # 确保所有数值字段都不为 None
-            sales_amount = store_data['total_sales_amount'] or 0.0
-            cost_amount = store_data['total_sales_cost'] or 0.0
-            
-            # 计算各种利润指标
-            gross_profit_1_occurred = sales_amount - cost_amount
-            avg_gross_profit_1_rate = round(((sales_amount - cost_amount) / sales_amount) * 100, 2) if sales_amount > 0 else 0
-            
-            # 广告费用暂时为 0（后续可以从 PDD 表关联获取）
-            ad_cost = 0.0
-            avg_advertising_ratio = round((ad_cost / sales_amount) * 100, 2) if sales_amount > 0 else 0
-            
-            gross_profit_3 = sales_amount - cost_amount - ad_cost
-            avg_gross_profit_3_rate = round(((sales_amount - cost_amount - ad_cost) / sales_amount) * 100, 2) if sales_amount > 0 else 0
-            
-            gross_profit_4 = sales_amount - cost_amount - ad_cost
-            avg_gross_profit_4_rate = round(((sales_amount - cost_amount - ad_cost) / sales_amount) * 100, 2) if sales_amount > 0 else 0
-            
-            net_profit = sales_amount - cost_amount - ad_cost
-            avg_net_profit_rate = round(((sales_amount - cost_amount - ad_cost) / sales_amount) * 100, 2) if sales_amount > 0 else 0
-            
-            # 构建完整的店铺记录
-            store_record = {
-                'store_id': str(store_data['store_id']),  # 确保是字符串
-                'store_name': store_data['store_name'],
-                'order_date': store_data['order_date'],
-                'total_payment_amount': store_data['total_payment_amount'] or 0.0,
-                'total_sales_amount': sales_amount,
-                'total_refund_amount': store_data['total_refund_amount'] or 0.0,
-                'total_sales_cost': cost_amount,
-                'total_gross_profit_1_occurred': gross_profit_1_occurred,
-                'avg_gross_profit_1_rate': avg_gross_profit_1_rate,
-                'total_advertising_expenses': ad_cost,
-                'avg_advertising_ratio': avg_advertising_ratio,
-                'total_gross_profit_3': gross_profit_3,
-                'avg_gross_profit_3_rate': avg_gross_profit_3_rate,
-                'total_gross_profit_4': gross_profit_4,
-                'avg_gross_profit_4_rate': avg_gross_profit_4_rate,
-                'total_net_profit': net_profit,
-                'avg_net_profit_rate': avg_net_profit_rate,
-                'goods_count': store_data['goods_count'],
-                'order_count': store_data['order_count'],
-                'creator': 'system',
-                'last_order_time': store_data['last_order_time'],
-                'created_at': datetime.now(),
-                'updated_at': datetime.now()
-            }
-            
-            stores_data_list.append(store_record)
+            stores_data_list.append(_build_store_record(store_data))
         
         # 输出重复检查结果
         print(f"\n=== stores_dict 检查 ===")
         print(f"stores_dict 共有 {len(stores_dict)} 个 unique_key")
-        print(f"去重后：{len(seen_keys)} 个")
-        if duplicate_keys:
-            print(f"发现 {len(duplicate_keys)} 个重复 key:")
-            for dk in duplicate_keys[:5]:
-                print(f"  - {dk}")
-        print("======================\n")
-
-        # 删除之前同步的相同日期的数据（避免重复）
-        if sync_date:
-            # 确保 sync_date 是 date 对象类型
-            from datetime import date as date_type, time as time_type
-            
-            # 转换 sync_date 为 date 对象
-            if isinstance(sync_date, str):
-                target_date = datetime.strptime(sync_date, '%Y-%m-%d').date()
-            elif hasattr(sync_date, 'date') and callable(getattr(sync_date, 'date')):
-                target_date = sync_date.date()
-            elif isinstance(sync_date, date_type):
-                target_date = sync_date
-            else:
-                target_date = sync_date
-            
-            # 收集所有需要删除的日期（从待插入数据中提取）
-            dates_to_delete = set()
-            for item in stores_data_list:
-                item_date = item['order_date']
-                if isinstance(item_date, datetime):
-                    item_date = item_date.date()
-                dates_to_delete.add(item_date)
-            
-            # 删除这些日期的所有数据
-            total_deleted = 0
-            for del_date in dates_to_delete:
-                start_of_day = datetime.combine(del_date, time_type.min)
-                end_of_day = datetime.combine(del_date, time_type.max)
-                
-                deleted = (Store.delete().where(
-                    (Store.order_date >= start_of_day) & 
-                    (Store.order_date <= end_of_day)
-                ).execute())
-                
-                total_deleted += deleted
-                if deleted > 0:
-                    print(f"删除 {del_date} 的数据：{deleted} 条")
-            
-            if total_deleted > 0:
-                print(f"共删除 {total_deleted} 条历史数据")
-        else:
-            Store.delete().execute()
-            print("已清空所有店铺数据")
-
-
-
-        # 使用 insert_many 批量插入新的店铺记录（已包含利润指标）
-        if stores_data_list:
-            print(f"开始插入 {len(stores_data_list)} 条店铺记录...")
-            batch_size = 500
-            inserted_count = 0
-            for i in range(0, len(stores_data_list), batch_size):
-                batch = stores_data_list[i:i + batch_size]
-                try:
-                    Store.insert_many(batch).execute()
-                    inserted_count += len(batch)
-                    print(f"成功插入批次 {i//batch_size + 1}: {len(batch)} 条店铺记录，进度 {inserted_count}/{len(stores_data_list)}")
-                except Exception as e:
-                    print(f"批量插入店铺失败，尝试逐条插入：{e}")
-                    for item in batch:
-                        try:
-                            Store.create(**item)
-                            inserted_count += 1
-                        except Exception as create_error:
-                            print(f"插入单条店铺记录失败：{create_error}")
-                            continue
-            print(f"店铺记录插入完成，总计 {inserted_count} 条")
+        print(f"去重后：{len(seen_keys)} 个")
+        if duplicate_keys:
+            print(f"发现 {len(duplicate_keys)} 个重复 key:")
+            for dk in duplicate_keys[:5]:
+                print(f"  - {dk}")
+        print("======================\n")
 
+        # 在一个事务内替换涉及日期的店铺数据，读接口不会看到删了一半的日期
+        _replace_store_days(stores_data_list, sync_date, progress=progress)
+        bump_data_version()
 
         # 统计处理结果
         processed_count = len(stores_dict)
@@ -908,21 +1259,296 @@ def sync_stores(sync_date):
 
 
 
+# 增量同步：sync_watermarks 中的数据源名称
+INCREMENTAL_SOURCE = 'jushuitan_orders'
+# 订单台账保留天数：更早的订单有修改时只更新商品台账，店铺汇总需要按天全量同步
+INCREMENTAL_LEDGER_DAYS = int(os.getenv("JST_INCREMENTAL_LEDGER_DAYS", 31))
+ORDER_RECORD_BATCH_SIZE = 500
+# 订单台账命中唯一键冲突时需要覆盖的字段
+ORDER_RECORD_UPSERT_FIELDS = (
+    'so_id', 'store_id', 'store_name', 'order_date', 'order_time', 'sales_amount', 'sales_cost',
+    'goods_count', 'goods_valid', 'updated', 'updated_at'
+)
+
+
+def _merge_order_records(snapshot):
+    """合并增量快照中两个订单流的订单数据：不在销售成本订单里的订单（已取消、被拆分）成本为 0"""
+    records = {}
+    for oid, amount_data in snapshot['order_amounts'].items():
+        cost_data = snapshot['order_costs'].get(oid)
+        record = dict(amount_data)
+        record['sales_cost'] = cost_data['sales_cost'] if cost_data else 0.0
+        if cost_data and cost_data['updated'] and (not record['updated'] or cost_data['updated'] > record['updated']):
+            record['updated'] = cost_data['updated']
+        record['updated_at'] = datetime.now()
+        records[oid] = record
+    return records
+
+
+def _upsert_order_records(records):
+    """
+    写入订单台账，返回受影响的 (store_id, order_date)：
+    包括订单修改前后所属的店铺日期（订单日期或店铺变化时两边都要重算）
+    """
+    affected_keys = set()
+    oids = list(records.keys())
+    for i in range(0, len(oids), ORDER_RECORD_BATCH_SIZE):
+        batch_oids = oids[i:i + ORDER_RECORD_BATCH_SIZE]
+        old_rows = (JushuitanOrderRecord
+                    .select(JushuitanOrderRecord.store_id, JushuitanOrderRecord.order_date)
+                    .where(JushuitanOrderRecord.oid.in_(batch_oids))
+                    .tuples())
+        affected_keys.update(old_rows)
+
+        batch = [records[oid] for oid in batch_oids]
+        affected_keys.update((record['store_id'], record['order_date']) for record in batch)
+        (JushuitanOrderRecord
+         .insert_many(batch)
+         .on_conflict(preserve=[getattr(JushuitanOrderRecord, field) for field in ORDER_RECORD_UPSERT_FIELDS])
+         .execute())
+
+    return {(store_id, order_date) for store_id, order_date in affected_keys if store_id and order_date}
+
+
+def _delete_order_records(oids):
+    """删除已不计入销售金额的订单的台账记录，返回它们原来所属的 (store_id, order_date)"""
+    affected_keys = set()
+    oids = list(oids)
+    for i in range(0, len(oids), ORDER_RECORD_BATCH_SIZE):
+        batch_oids = oids[i:i + ORDER_RECORD_BATCH_SIZE]
+        affected_keys.update(JushuitanOrderRecord
+                             .select(JushuitanOrderRecord.store_id, JushuitanOrderRecord.order_date)
+                             .where(JushuitanOrderRecord.oid.in_(batch_oids))
+                             .tuples())
+        JushuitanOrderRecord.delete().where(JushuitanOrderRecord.oid.in_(batch_oids)).execute()
+    return {(store_id, order_date) for store_id, order_date in affected_keys if store_id and order_date}
+
+
+def _rebuild_store_days(store_keys, progress=None):
+    """
+    用订单台账重算指定 (store_id, order_date) 的店铺汇总并替换 stores 表中的对应行
+    口径与 _fold_sales_amount_batch / _fold_sales_cost_batch 一致：
+    商品列表有效的订单才计入销售额、商品数和订单数，销售成本按店铺日期全部累加
+    """
+    if not store_keys:
+        return 0
+
+    store_ids = {store_id for store_id, _ in store_keys}
+    order_dates = {order_date for _, order_date in store_keys}
+    rows = (JushuitanOrderRecord
+            .select()
+            .where(JushuitanOrderRecord.store_id.in_(list(store_ids)) &
+                   JushuitanOrderRecord.order_date.in_(sorted(order_dates)))
+            .dicts())
+
+    stores = {}
+    store_costs = {}
+    for row in rows:
+        unique_key = (row['store_id'], row['order_date'])
+        if unique_key not in store_keys:
+            continue
+        store_costs[unique_key] = store_costs.get(unique_key, 0.0) + (row['sales_cost'] or 0.0)
+        if not row['goods_valid']:
+            continue
+        order_datetime = row['order_time'] or datetime.combine(row['order_date'], datetime.min.time())
+        if unique_key not in stores:
+            stores[unique_key] = _new_store_data(row['store_id'], row['store_name'], row['order_date'], order_datetime)
+        store_data = stores[unique_key]
+        store_data['total_sales_amount'] += row['sales_amount'] or 0.0
+        store_data['goods_count'] += row['goods_count'] or 0
+        store_data['order_count'] += 1
+        if order_datetime > store_data['last_order_time']:
+            store_data['last_order_time'] = order_datetime
+
+    for unique_key, store_data in stores.items():
+        store_data['total_sales_cost'] = store_costs.get(unique_key, 0.0)
+    stores_data_list = [_build_store_record(store_data) for store_data in stores.values()]
+
+    # 订单都已失效的店铺日期只删除不插入
+    keys = sorted(store_keys)
+    for i in range(0, len(keys), STORE_INSERT_BATCH_SIZE):
+        Store.delete().where(
+            Tuple(Store.store_id, Store.order_date).in_(keys[i:i + STORE_INSERT_BATCH_SIZE])
+        ).execute()
+    for i in range(0, len(stores_data_list), STORE_INSERT_BATCH_SIZE):
+        Store.insert_many(stores_data_list[i:i + STORE_INSERT_BATCH_SIZE]).execute()
+    enrich_store_days(store_keys)
+
+    if progress:
+        progress.add_rows(len(stores_data_list))
+    print(f"重算店铺汇总 {len(store_keys)} 个店铺日期，写入 {len(stores_data_list)} 条")
+    return len(stores_data_list)
+
+
+def run_incremental_sync(progress=None):
+    """
+    按聚水潭订单的 updated 水位增量同步
+    - 只拉取上次水位之后有修改的订单，不再整天重新拉取
+    - 商品台账只更新这些订单对应的行
+    - 店铺汇总先更新订单台账，再只重算受影响的 (店铺, 日期)
+    - 订单改成不计入销售金额的状态后，删除它的订单台账和商品台账，所在的店铺日期一并重算
+    - 首次运行没有水位时从今天零点开始，今天起的订单台账是完整的；
+      早于台账起始日期的订单只更新商品台账，店铺汇总需按天全量同步
+    """
+    until = datetime.now()
+    watermark_row = SyncWatermark.get_or_none(SyncWatermark.source == INCREMENTAL_SOURCE)
+    if watermark_row and watermark_row.watermark:
+        since = watermark_row.watermark
+        baseline_date = watermark_row.baseline_date or until.date()
+    else:
+        since = datetime.combine(until.date(), datetime.min.time())
+        baseline_date = until.date()
+    # 台账只保留最近 INCREMENTAL_LEDGER_DAYS 天
+    baseline_date = max(baseline_date, until.date() - timedelta(days=INCREMENTAL_LEDGER_DAYS))
+
+    snapshot = build_order_snapshot(None, progress=progress, modified_window=(since, until))
+    records = _merge_order_records(snapshot)
+    excluded_orders = {oid: updated for oid, updated in snapshot['excluded_orders'].items() if oid not in records}
+    oids = list(records.keys()) + list(excluded_orders.keys())
+
+    # 只处理有订单ID的订单，商品台账按订单ID限定比较范围；已不计入销售金额的订单不在 goods_dict 中，它们的行会被删除
+    goods_dict = {key: row for key, row in _build_goods_rows(snapshot).items() if key[2] in records}
+    goods_scopes = [
+        Goods.order_id.in_(oids[i:i + ORDER_RECORD_BATCH_SIZE])
+        for i in range(0, len(oids), ORDER_RECORD_BATCH_SIZE)
+    ]
+
+    seen_updated = [record['updated'] for record in records.values() if record['updated']]
+    seen_updated += [updated for updated in excluded_orders.values() if updated]
+    new_watermark = max(seen_updated + [since])
+
+    with models_database.atomic():
+        if progress:
+            progress.set_phase('writing_goods')
+        goods_stats = _upsert_goods_rows(goods_dict, goods_scopes, progress=progress)
+
+        if progress:
+            progress.set_phase('writing_stores')
+        affected_keys = _upsert_order_records(records) | _delete_order_records(excluded_orders)
+        store_keys = {key for key in affected_keys if key[1] >= baseline_date}
+        skipped_keys = affected_keys - store_keys
+        stores_processed_count = _rebuild_store_days(store_keys, progress=progress)
+
+        JushuitanOrderRecord.delete().where(JushuitanOrderRecord.order_date < baseline_date).execute()
+
+        # 水位和数据在同一个事务里提交，失败时下次从原水位重新拉取
+        if watermark_row:
+            watermark_row.watermark = new_watermark
+            watermark_row.baseline_date = baseline_date
+            watermark_row.updated_at = datetime.now()
+            watermark_row.save()
+        else:
+            SyncWatermark.create(source=INCREMENTAL_SOURCE, watermark=new_watermark, baseline_date=baseline_date)
+
+    # 事务提交后再更新数据版本号，避免缓存刷新读到提交前的数据
+    bump_data_version()
+
+    if skipped_keys:
+        skipped_dates = sorted({order_date.strftime('%Y-%m-%d') for _, order_date in skipped_keys})
+        print(f"⚠️ {len(skipped_keys)} 个店铺日期早于台账起始日期 {baseline_date}，未重算店铺汇总: {', '.join(skipped_dates)}")
+
+    print(f"增量同步完成：{len(records)} 个订单有修改，{len(excluded_orders)} 个订单已不计入销售金额，水位 {since} -> {new_watermark}")
+
+    return {
+        "since": since.strftime('%Y-%m-%d %H:%M:%S'),
+        "until": until.strftime('%Y-%m-%d %H:%M:%S'),
+        "watermark": new_watermark.strftime('%Y-%m-%d %H:%M:%S'),
+        "orders_count": len(records),
+        "excluded_orders_count": len(excluded_orders),
+        "goods": goods_stats,
+        "stores_processed_count": stores_processed_count,
+        "skipped_store_dates": sorted({order_date.strftime('%Y-%m-%d') for _, order_date in skipped_keys}),
+        "streams": snapshot['streams']
+    }
+
+
+# 增量同步：只拉取上次同步之后有修改的订单
+@router.post("/sync_jushuitan_incremental")
+@run_in_lane(sync_lane)
+def sync_jushuitan_incremental():
+    """按订单修改时间水位增量同步商品台账和店铺汇总，适合每隔几分钟调用一次"""
+    try:
+        result = run_incremental_sync()
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"增量同步时发生错误: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"增量同步失败: {str(e)}")
+
+    return {
+        "message": f"增量同步完成，{result['orders_count']} 个订单有修改",
+        **result
+    }
+
+
+# 分组查询时每条 SQL 最多带的键数，避免 IN 列表过长
+ENRICH_KEY_BATCH_SIZE = 500
+
+
+# 店铺汇总中按行累加的字段：汇总字段名 -> 行字段名
+STORE_SUMMARY_FIELDS = (
+    ('total_payment_amount', 'payment_amount'),
+    ('total_sales_amount', 'sales_amount'),
+    ('total_sales_cost', 'sales_cost'),
+    ('total_refund_amount', 'refund_amount'),
+    ('total_gross_profit_1_occurred', 'gross_profit_1_occurred'),
+    ('total_advertising_expenses', 'advertising_expenses'),
+    ('total_gross_profit_3', 'gross_profit_3'),
+    ('total_gross_profit_4', 'gross_profit_4'),
+    ('total_net_profit', 'net_profit'),
+    ('total_goods', 'goods_count'),
+    ('total_orders', 'order_count'),
+)
+
+
+def _new_store_summary():
+    summary = {summary_field: 0 for summary_field, _ in STORE_SUMMARY_FIELDS}
+    summary['total_stores'] = 0
+    return summary
+
+
+def _add_to_store_summary(summary, item):
+    """在构建店铺列表的同一个循环里累加汇总，不再单独遍历"""
+    for summary_field, item_field in STORE_SUMMARY_FIELDS:
+        summary[summary_field] += item[item_field] or 0
+    summary['total_stores'] += 1
+
+
+def _finish_store_summary(summary):
+    """根据汇总金额计算总体比率"""
+    total_sales_amount = summary['total_sales_amount']
+    for rate_field, total_field in (
+        ('avg_gross_profit_1_rate', 'total_gross_profit_1_occurred'),
+        ('avg_advertising_ratio', 'total_advertising_expenses'),
+        ('avg_gross_profit_3_rate', 'total_gross_profit_3'),
+        ('avg_gross_profit_4_rate', 'total_gross_profit_4'),
+        ('avg_net_profit_rate', 'total_net_profit'),
+    ):
+        summary[rate_field] = round(summary[total_field] / total_sales_amount * 100, 2) if total_sales_amount != 0 else 0
+    return summary
+
+
 # 商品台账查询接口 - 支持分页和模糊查询
 @router.get("/goods/")
+@run_in_lane(db_lane)
 def get_goods_list(
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(10, ge=1, le=100, description="返回的记录数"),
-    search: str = Query("", description="商品名称模糊查询")
+    search: str = Query("", description="商品名称模糊查询"),
+    cursor: str = Query(None, description="游标分页：传上一页返回的 next_cursor，传了之后忽略 skip"),
+    count: str = Query("exact", description="总数统计方式：exact / cached / approx / none")
 ):
     """
     获取商品列表，支持分页和商品名称模糊查询
-    关联 pdd_ads 表获取广告费，关联 pdd_bill_records 表获取退款金额
+    广告费、退款金额和利润列读取商品台账中补全好的值（见 services/profit_enrichment.py）
+    按 (created_at, id) 降序排列，每页都返回 next_cursor，翻到深页时传 cursor 可以避免 OFFSET 扫描
     """
+    if count not in COUNT_MODES:
+        raise HTTPException(status_code=400, detail=f"count 只能是 {' / '.join(COUNT_MODES)}")
     
     try:
-        from backend.models.database import PddTable, PddBillRecord
-        
         # 构建查询
         query = Goods.select()
         
@@ -932,63 +1558,16 @@ def get_goods_list(
         
         # 排除已删除的记录
         query = query.where(Goods.is_del == False)
-        
-        # 按创建时间降序排列
-        query = query.order_by(Goods.created_at.desc())
 
         # 获取总数
-        total_count = query.count()
-        
-        # 应用分页
-        goods_list = query.offset(skip).limit(limit).execute()
+        total_count = count_rows(query, Goods, mode=count, filtered=bool(search))
         
-        # 转换为字典列表，并关联广告费和退款金额
+        # 应用分页（按创建时间降序排列）
+        goods_list, next_cursor = paginate(query, Goods, skip=skip, limit=limit, cursor=cursor)
+
+        # 广告费、退款金额和利润列已在同步和拼多多数据保存时写入商品台账，直接读取
         result = []
         for good in goods_list:
-            # 关联 pdd_ads 表获取广告费（按 goods_id 和 store_id 匹配）
-            advertising_expenses = 0.0
-            if good.goods_id and good.store_id:
-                # 查询该商品的广告费总和
-                pdd_ads = PddTable.select(fn.SUM(PddTable.orderSpendNetCostPerOrder).alias('total_ad_cost')).where(
-                    (PddTable.goods_id == good.goods_id) &
-                    (PddTable.store_id == good.store_id) &
-                    (PddTable.is_del == False)
-                ).scalar()
-                advertising_expenses = float(pdd_ads) if pdd_ads else 0.0
-            
-            # 关联 pdd_bill_records 表获取退款金额（按 shop_id 和 order_sn 匹配）
-            refund_amount = 0.0
-            if good.store_id and good.order_id:
-                # 查询该订单的退款金额总和
-                bill_refund = PddBillRecord.select(fn.SUM(PddBillRecord.amount).alias('total_refund')).where(
-                    (PddBillRecord.shop_id == good.store_id) &
-                    (PddBillRecord.order_sn == good.order_id) &
-                    (PddBillRecord.is_del == False)
-                ).scalar()
-                refund_amount = float(bill_refund) if bill_refund else 0.0
-            
-            # 使用关联查询的值，如果没有则使用商品表中的值
-            final_advertising_expenses = advertising_expenses if advertising_expenses > 0 else (good.advertising_expenses or 0.0)
-            final_refund_amount = refund_amount if refund_amount > 0 else (good.refund_amount or 0.0)
-            
-            # 重新计算利润指标（使用关联后的广告费和退款金额）
-            sales_amount = good.sales_amount or 0.0
-            sales_cost = good.sales_cost or 0.0
-            
-            gross_profit_1_occurred = sales_amount - sales_cost
-            gross_profit_1_rate = (gross_profit_1_occurred / sales_amount * 100) if sales_amount > 0 else 0.0
-            
-            advertising_ratio = (final_advertising_expenses / sales_amount * 100) if sales_amount > 0 else 0.0
-            
-            gross_profit_3 = sales_amount - sales_cost - final_advertising_expenses
-            gross_profit_3_rate = (gross_profit_3 / sales_amount * 100) if sales_amount > 0 else 0.0
-            
-            gross_profit_4 = gross_profit_3  # 可以根据需要添加其他费用
-            gross_profit_4_rate = (gross_profit_4 / sales_amount * 100) if sales_amount > 0 else 0.0
-            
-            net_profit = gross_profit_3  # 净利润
-            net_profit_rate = (net_profit / sales_amount * 100) if sales_amount > 0 else 0.0
-            
             good_dict = {
                 'id': good.id,
                 'goods_id': good.goods_id,
@@ -997,34 +1576,30 @@ def get_goods_list(
                 'store_name': good.store_name,
                 'order_id': good.order_id,
                 'payment_amount': good.payment_amount,
-                'sales_amount': sales_amount,
-                'refund_amount': round(final_refund_amount, 2),  # 使用关联查询的退款金额
-                'sales_cost': sales_cost,
-                'gross_profit_1_occurred': round(gross_profit_1_occurred, 2),
-                'gross_profit_1_rate': round(gross_profit_1_rate, 2),
-                'advertising_expenses': round(final_advertising_expenses, 2),  # 使用关联查询的广告费
-                'advertising_ratio': round(advertising_ratio, 2),
-                'gross_profit_3': round(gross_profit_3, 2),
-                'gross_profit_3_rate': round(gross_profit_3_rate, 2),
-                'gross_profit_4': round(gross_profit_4, 2),
-                'gross_profit_4_rate': round(gross_profit_4_rate, 2),
-                'net_profit': round(net_profit, 2),
-                'net_profit_rate': round(net_profit_rate, 2),
+                'sales_amount': good.sales_amount or 0.0,
+                'refund_amount': good.refund_amount or 0.0,
+                'sales_cost': good.sales_cost or 0.0,
+                **{metric: getattr(good, metric) or 0.0 for metric in PROFIT_METRICS},
                 'is_del': good.is_del,
                 'creator': good.creator,
-                'goodorder_time': good.goodorder_time.strftime("%Y-%m-%d %H:%M:%S") if good.goodorder_time else "",
-                'created_at': good.created_at.strftime("%Y-%m-%d %H:%M:%S") if good.created_at else "",
-                'updated_at': good.updated_at.strftime("%Y-%m-%d %H:%M:%S") if good.updated_at else ""
+                # 时间列由 FastJSONResponse 序列化为 YYYY-MM-DD HH:MM:SS
+                'goodorder_time': good.goodorder_time or "",
+                'created_at': good.created_at or "",
+                'updated_at': good.updated_at or ""
             }
             result.append(good_dict)
         
-        return {
+        # 直接返回响应对象，跳过 FastAPI 的 jsonable_encoder
+        return FastJSONResponse({
             "data": result,
             "total": total_count,
             "skip": skip,
-            "limit": limit
-        }
+            "limit": limit,
+            "next_cursor": next_cursor
+        })
         
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"获取商品列表时发生错误: {str(e)}")
         import traceback
@@ -1038,21 +1613,28 @@ def get_goods_list(
 
 # 店铺管理分页查询接口
 @router.get("/stores_data/")
+@run_in_lane(db_lane)
+@cached_response("stores_data")
 def get_store_goods(
     start_date: str = Query(None, description="开始日期，格式：YYYY-MM-DD"),
     end_date: str = Query(None, description="结束日期，格式：YYYY-MM-DD"),
+    limit: int = Query(None, ge=1, le=1000, description="分页时每页的记录数，不传则返回全部"),
+    cursor: str = Query(None, description="游标分页：传上一页返回的 next_cursor"),
+    count: str = Query("none", description="分页时的总数统计方式：exact / cached / approx / none"),
     current_user = Depends(get_current_user)
 ):
     """
     根据当前登录用户的goods_stores字段查询店铺数据
     管理员可查看所有数据，普通用户只能查看自己的数据
     直接查询店铺表，返回汇总数据
-    关联 pdd_ads 表获取广告费，关联 pdd_bill_records 表获取退款金额
+    广告费、退款金额和利润列读取店铺汇总中补全好的值（见 services/profit_enrichment.py）
     返回包含销售金额、成本、利润等统计信息的数据
     支持按日期范围查询
+    传 limit 或 cursor 时按 (created_at, id) 降序游标分页，返回 next_cursor，summary 只汇总当前页
     """
-    
-    from backend.models.database import PddTable, PddBillRecord
+    paged = limit is not None or cursor is not None
+    if count not in COUNT_MODES:
+        raise HTTPException(status_code=400, detail=f"count 只能是 {' / '.join(COUNT_MODES)}")
 
     # 判断是否为管理员
     is_admin = current_user.role == 'admin'
@@ -1117,138 +1699,171 @@ def get_store_goods(
         query_conditions.append(Store.store_id.in_(user_store_ids))
         store_records = Store.select().where(*query_conditions)
     
-    # 构建返回数据，并关联PDD表
+    page_info = {}
+    if paged:
+        try:
+            total_count = count_rows(store_records, Store, mode=count,
+                                     filtered=not is_admin or bool(start_date and end_date))
+            store_records, next_cursor = paginate(store_records, Store, limit=limit or 100, cursor=cursor)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        page_info = {"total": total_count, "limit": limit or 100, "next_cursor": next_cursor}
+
+    # 广告费、退款金额和利润列已在同步和拼多多数据保存时写入店铺汇总，直接读取
     store_data = []
+    summary = _new_store_summary()
     for store in store_records:
-        # 提取真实的店铺ID（去掉日期后缀）
-        # Store表中的ID格式: shopId_YYYYMMDD (如: 18582224_20260126)
-        real_store_id = store.store_id.split('_')[0] if '_' in store.store_id else store.store_id
-        
-        # 关联 pdd_ads 表获取该店铺的总广告费（按日期匹配）
-        advertising_expenses_from_pdd = 0.0
-        if store.last_order_time:
-            # 提取 last_order_time 的日期部分 (YYYY-MM-DD)
-            order_date = store.last_order_time.date()
-            # 查询同一天的广告费
-            pdd_ads = PddTable.select(fn.SUM(PddTable.orderSpendNetCostPerOrder).alias('total_ad_cost')).where(
-                (PddTable.store_id == real_store_id) &
-                (PddTable.data_date == order_date) &
-                (PddTable.is_del == False)
-            ).scalar()
-            advertising_expenses_from_pdd = float(pdd_ads) if pdd_ads else 0.0
-        
-        # 关联 pdd_bill_records 表获取该店铺的总退款金额
-        # 店铺级别：按 shop_id 和日期匹配（bill_date = last_order_time的日期部分）
-        refund_amount_from_pdd = 0.0
-        if store.last_order_time:
-            # 提取 last_order_time 的日期部分 (YYYY-MM-DD)
-            order_date = store.last_order_time.date()
-            # 查询同一天的退款金额，使用 ABS 转换为正数
-            bill_refund = PddBillRecord.select(fn.SUM(fn.ABS(PddBillRecord.amount)).alias('total_refund')).where(
-                (PddBillRecord.shop_id == real_store_id) &
-                (PddBillRecord.bill_date == order_date) &
-                (PddBillRecord.is_del == False)
-            ).scalar()
-            refund_amount_from_pdd = float(bill_refund) if bill_refund else 0.0
-        
-        # 使用关联查询的值，如果没有则使用Store表中的值
-        final_advertising_expenses = advertising_expenses_from_pdd if advertising_expenses_from_pdd > 0 else (store.total_advertising_expenses or 0.0)
-        final_refund_amount = refund_amount_from_pdd if refund_amount_from_pdd > 0 else (store.total_refund_amount or 0.0)
-        
-        # 重新计算利润指标（使用关联后的广告费和退款金额）
-        sales_amount = store.total_sales_amount or 0.0
-        sales_cost = store.total_sales_cost or 0.0
-        
-        gross_profit_1_occurred = sales_amount - sales_cost
-        gross_profit_1_rate = (gross_profit_1_occurred / sales_amount * 100) if sales_amount > 0 else 0.0
-        
-        advertising_ratio = (final_advertising_expenses / sales_amount * 100) if sales_amount > 0 else 0.0
-        
-        gross_profit_3 = sales_amount - sales_cost - final_advertising_expenses
-        gross_profit_3_rate = (gross_profit_3 / sales_amount * 100) if sales_amount > 0 else 0.0
-        
-        gross_profit_4 = gross_profit_3
-        gross_profit_4_rate = (gross_profit_4 / sales_amount * 100) if sales_amount > 0 else 0.0
-        
-        net_profit = gross_profit_3
-        net_profit_rate = (net_profit / sales_amount * 100) if sales_amount > 0 else 0.0
-        
-        store_data.append({
+        item = {
             'store_id': store.store_id,
             'store_name': store.store_name,
             'goods_count': store.goods_count,
             'order_count': store.order_count,
             'payment_amount': store.total_payment_amount,
-            'sales_amount': sales_amount,
-            'refund_amount': round(final_refund_amount, 2),  # 使用关联查询的退款金额
-            'sales_cost': sales_cost,
-            'gross_profit_1_occurred': round(gross_profit_1_occurred, 2),
-            'gross_profit_1_rate': round(gross_profit_1_rate, 2),
-            'advertising_expenses': round(final_advertising_expenses, 2),  # 使用关联查询的广告费
-            'advertising_ratio': round(advertising_ratio, 2),
-            'gross_profit_3': round(gross_profit_3, 2),
-            'gross_profit_3_rate': round(gross_profit_3_rate, 2),
-            'gross_profit_4': round(gross_profit_4, 2),
-            'gross_profit_4_rate': round(gross_profit_4_rate, 2),
-            'net_profit': round(net_profit, 2),
-            'net_profit_rate': round(net_profit_rate, 2),
-            'last_order_time': store.last_order_time.strftime("%Y-%m-%d %H:%M:%S") if store.last_order_time else "",
-            'created_at': store.created_at.strftime("%Y-%m-%d %H:%M:%S") if store.created_at else "",
-            'updated_at': store.updated_at.strftime("%Y-%m-%d %H:%M:%S") if store.updated_at else ""
-        })
-    
-    # 计算汇总统计数据
-    summary = {}
-    if store_data:
-        summary = {
-            'total_payment_amount': sum(item['payment_amount'] for item in store_data),
-            'total_sales_amount': sum(item['sales_amount'] for item in store_data),
-            'total_sales_cost': sum(item['sales_cost'] for item in store_data),
-            'total_refund_amount': sum(item['refund_amount'] for item in store_data),
-            'total_gross_profit_1_occurred': sum(item['gross_profit_1_occurred'] for item in store_data),
-            'total_advertising_expenses': sum(item['advertising_expenses'] for item in store_data),
-            'total_gross_profit_3': sum(item['gross_profit_3'] for item in store_data),
-            'total_gross_profit_4': sum(item['gross_profit_4'] for item in store_data),
-            'total_net_profit': sum(item['net_profit'] for item in store_data),
-            'total_stores': len(store_data),
-            'total_goods': sum(item['goods_count'] for item in store_data),
-            'total_orders': sum(item['order_count'] for item in store_data)
+            'sales_amount': store.total_sales_amount or 0.0,
+            'refund_amount': store.total_refund_amount or 0.0,
+            'sales_cost': store.total_sales_cost or 0.0,
+            **{metric: getattr(store, column) or 0.0 for metric, column in STORE_PROFIT_COLUMNS},
+            # 时间列由 FastJSONResponse 序列化为 YYYY-MM-DD HH:MM:SS
+            'last_order_time': store.last_order_time or "",
+            'created_at': store.created_at or "",
+            'updated_at': store.updated_at or ""
         }
-        
-        # 重新计算总体比率
-        total_sales_amount = summary['total_sales_amount']
-        if total_sales_amount != 0:
-            summary['avg_gross_profit_1_rate'] = round(summary['total_gross_profit_1_occurred'] / total_sales_amount * 100, 2)
-            summary['avg_advertising_ratio'] = round(summary['total_advertising_expenses'] / total_sales_amount * 100, 2)
-            summary['avg_gross_profit_3_rate'] = round(summary['total_gross_profit_3'] / total_sales_amount * 100, 2)
-            summary['avg_gross_profit_4_rate'] = round(summary['total_gross_profit_4'] / total_sales_amount * 100, 2)
-            summary['avg_net_profit_rate'] = round(summary['total_net_profit'] / total_sales_amount * 100, 2)
-        else:
-            summary['avg_gross_profit_1_rate'] = 0
-            summary['avg_advertising_ratio'] = 0
-            summary['avg_gross_profit_3_rate'] = 0
-            summary['avg_gross_profit_4_rate'] = 0
-            summary['avg_net_profit_rate'] = 0
+        store_data.append(item)
+        _add_to_store_summary(summary, item)
+    
+    # 计算汇总统计数据（没有数据时返回空对象）
+    summary = _finish_store_summary(summary) if store_data else {}
     
     # 根据是否有日期筛选添加适当的消息
     date_msg = f"（{start_date} 至 {end_date}）" if start_date and end_date else ""
-    return {
+    # 直接返回响应对象，跳过 FastAPI 的 jsonable_encoder；响应缓存中存的是序列化好的响应
+    return FastJSONResponse({
         "message": f"成功获取{'所有' if is_admin else '用户关联'}的店铺汇总数据{date_msg}",
         "data": store_data,
-        "summary": summary
-    }
+        "summary": summary,
+        **page_info
+    })
+
+
 
 
 
 
 
+def _group_store_goods_daily(store_id, target_date):
+    """
+    按店铺读取商品日汇总（(store_id, stat_date) 索引范围扫描），在内存中按商品合并各日期，
+    返回 (按最晚订单时间倒序的商品列表, {goods_id: 目标日期广告费}, {goods_id: 目标日期退款金额})
+    订单号按日期倒序拼接各天的列表，整体仍按订单时间倒序
+    """
+    grouped = {}
+    ad_costs = {}
+    refunds = {}
+    rows = (GoodsDaily
+            .select()
+            .where(GoodsDaily.store_id == store_id)
+            .order_by(GoodsDaily.stat_date.desc())
+            .dicts())
+    for row in rows:
+        good_id = row['goods_id']
+        if row['stat_date'] == target_date:
+            if row['pdd_ad_cost']:
+                ad_costs[good_id] = row['pdd_ad_cost']
+            if row['pdd_refund_amount']:
+                refunds[good_id] = row['pdd_refund_amount']
+        if not row['goods_rows']:
+            # 只有广告或退款、当天没有商品台账的行
+            continue
+
+        data = grouped.get(good_id)
+        if data is None:
+            data = grouped[good_id] = {
+                'good_id': good_id, 'id': row['max_goods_row_id'],
+                'good_name': row['goods_name'], 'store_name': row['store_name'],
+                'order_ids': [], 'so_ids': [], 'order_count': 0,
+                'payment_amount': 0.0, 'sales_amount': 0.0, 'sales_cost': 0.0,
+                'refund_amount': 0.0, 'advertising_expenses': 0.0,
+                'first_goodorder_time': row['first_order_time'], 'latest_goodorder_time': row['latest_order_time'],
+                'created_at': row['goods_created_at'], 'updated_at': row['goods_updated_at'],
+            }
+        else:
+            data['id'] = max(data['id'], row['max_goods_row_id'])
+            data['good_name'] = max(data['good_name'] or '', row['goods_name'] or '') or None
+            data['store_name'] = max(data['store_name'] or '', row['store_name'] or '') or None
+            data['first_goodorder_time'] = min(data['first_goodorder_time'], row['first_order_time'])
+            data['latest_goodorder_time'] = max(data['latest_goodorder_time'], row['latest_order_time'])
+            data['created_at'] = min(data['created_at'], row['goods_created_at'])
+            data['updated_at'] = max(data['updated_at'], row['goods_updated_at'])
+        if row['order_ids']:
+            data['order_ids'].append(row['order_ids'])
+        if row['so_ids']:
+            data['so_ids'].append(row['so_ids'])
+        data['order_count'] += row['goods_rows']
+        for field in ('payment_amount', 'sales_amount', 'sales_cost', 'refund_amount', 'advertising_expenses'):
+            data[field] += row[field]
+
+    grouped_goods = sorted(grouped.values(), key=lambda data: data['latest_goodorder_time'], reverse=True)
+    for data in grouped_goods:
+        data['order_ids'] = ', '.join(data['order_ids'])
+        data['so_ids'] = ', '.join(data['so_ids'])
+    return grouped_goods, ad_costs, refunds
+
+
+def _store_goods_so_ids(store_id):
+    """店铺下每个商品去重后的线上订单号，作为关联退款表的子查询"""
+    return (Goods
+            .select(Goods.goods_id, Goods.soId)
+            .where((Goods.store_id == store_id) & (Goods.is_del == False) &
+                   Goods.soId.is_null(False) & (Goods.soId != ''))
+            .distinct()
+            .alias('goods_so'))
+
+
+def _print_store_goods_diagnostics(store_id, target_date, missing_ad_goods, missing_refund_goods):
+    """调试模式：对当天没有匹配到广告费 / 退款的商品，查看它们在其他日期是否有记录"""
+    if missing_ad_goods:
+        ad_dates = {}
+        for goods_id, data_date in (PddTable
+                                    .select(PddTable.goods_id, PddTable.data_date)
+                                    .where((PddTable.store_id == store_id) &
+                                           PddTable.goods_id.in_(missing_ad_goods) &
+                                           (PddTable.is_del == False))
+                                    .distinct()
+                                    .tuples()):
+            ad_dates.setdefault(goods_id, []).append(data_date)
+        for goods_id in missing_ad_goods:
+            if goods_id in ad_dates:
+                print(f"  商品 {goods_id} 有其他日期的广告记录，但与 {target_date} 不匹配，日期示例: {sorted(ad_dates[goods_id])[:3]}")
+            else:
+                print(f"  商品 {goods_id} 在广告表中没有任何记录")
+
+    if missing_refund_goods:
+        goods_so = _store_goods_so_ids(store_id)
+        bill_dates = {}
+        for goods_id, bill_date in (PddBillRecord
+                                    .select(goods_so.c.goods_id, PddBillRecord.bill_date)
+                                    .join(goods_so, on=(PddBillRecord.order_sn == goods_so.c.soId))
+                                    .where((PddBillRecord.shop_id == store_id) &
+                                           goods_so.c.goods_id.in_(missing_refund_goods) &
+                                           (PddBillRecord.is_del == False))
+                                    .distinct()
+                                    .tuples()):
+            bill_dates.setdefault(goods_id, []).append(bill_date)
+        for goods_id in missing_refund_goods:
+            if goods_id in bill_dates:
+                print(f"  商品 {goods_id} 有其他日期的退款记录，但与 {target_date} 不匹配，日期示例: {sorted(bill_dates[goods_id])[:3]}")
+            else:
+                print(f"  商品 {goods_id} 在退款表中没有匹配的订单号记录")
 
 
 # 获取特定店铺的商品详情
 @router.get("/store_goods_detail/{store_id}")
+@run_in_lane(db_lane)
+@cached_response("store_goods_detail", bypass_params=("debug",))
 def get_store_goods_detail(
     store_id: str, 
     order_date: str = None,  # 订单日期参数（格式：YYYY-MM-DD）
+    debug: bool = Query(False, description="输出调试信息：空结果时的店铺ID诊断、未匹配到广告费/退款的商品"),
     current_user = Depends(get_current_user)
 ):
     """
@@ -1256,307 +1871,97 @@ def get_store_goods_detail(
     参数:
         store_id: 店铺ID
         order_date: 订单日期（必需，格式：YYYY-MM-DD），用于匹配PDD数据
+        debug: 是否输出调试信息（会额外执行诊断查询）
+    数据来自商品日汇总（goods_daily），一次按店铺的索引范围查询，与店铺的商品数和订单数无关
     """
-    
-    print(f"=== Debug: 查询店铺商品详情 ===")
-    print(f"店铺ID: {store_id}")
-    print(f"订单日期参数: {order_date}")
-    print(f"用户: {current_user.username}, 角色: {current_user.role}")
+    if debug:
+        print(f"=== Debug: 查询店铺商品详情 店铺ID: {store_id}, 订单日期: {order_date}, "
+              f"用户: {current_user.username}, 角色: {current_user.role} ===")
     
     # 解析订单日期
-    target_date = None
-    if order_date:
-        try:
-            from datetime import datetime
-            target_date = datetime.strptime(order_date, '%Y-%m-%d').date()
-            print(f"解析后的日期对象: {target_date}")
-        except ValueError as e:
-            print(f"日期解析失败: {e}")
-            return {"message": f"日期格式错误: {order_date}，应为 YYYY-MM-DD", "data": [], "error": True}
-    else:
+    if not order_date:
         return {"message": "缺少订单日期参数", "data": [], "error": True}
+    try:
+        target_date = datetime.strptime(order_date, '%Y-%m-%d').date()
+    except ValueError as e:
+        print(f"日期解析失败: {e}")
+        return {"message": f"日期格式错误: {order_date}，应为 YYYY-MM-DD", "data": [], "error": True}
 
-    # 判断是否为管理员
-    is_admin = current_user.role == 'admin'
-    
-    goods_data = []
-    
-    if is_admin:
-        # 管理员可以查看任意店铺的商品数据
-        print(f"管理员模式：查询店铺 {store_id} 的商品")
-        goods_records = Goods.select().where(
-            (Goods.store_id == store_id) & (Goods.is_del == False)
-        ).order_by(Goods.goodorder_time.desc())
-    else:
-        # 普通用户只能查看自己关联的店铺商品数据
+    # 普通用户只能查看自己关联的店铺商品数据，管理员可以查看任意店铺
+    if current_user.role != 'admin':
         user_goods_stores = current_user.get_goods_stores()
-        # 提取用户关联的店铺ID
         user_store_ids = [item.get('store_id') for item in user_goods_stores if item.get('store_id')]
-        
-        print(f"普通用户模式：用户关联的店铺IDs: {user_store_ids}")
-        
         if store_id not in user_store_ids:
-            print(f"权限检查失败：店铺 {store_id} 不在用户关联列表中")
+            print(f"权限检查失败：店铺 {store_id} 不在用户 {current_user.username} 的关联列表中")
             return {"message": "无权访问此店铺的商品详情", "data": [], "error": True}
-        
-        goods_records = Goods.select().where(
-            (Goods.store_id == store_id) & (Goods.is_del == False)
-        ).order_by(Goods.goodorder_time.desc())
-    
-    # 转换为列表以便调试
-    goods_records_list = list(goods_records)
-    print(f"查询到的商品记录数: {len(goods_records_list)}")
-    
-    # 如果没有记录，检查数据库中是否有该店铺的数据
-    if len(goods_records_list) == 0:
-        # 检查是否有该店铺的任何数据（包括已删除的）
-        all_records = Goods.select().where(Goods.store_id == real_store_id)
-        all_count = all_records.count()
+
+    # 从商品日汇总按商品合并，广告费和退款取目标日期的汇总值
+    grouped_goods, ad_costs, refunds = _group_store_goods_daily(store_id, target_date)
+
+    if not grouped_goods:
+        if not debug:
+            return {"message": "该店铺暂无商品数据", "data": []}
+
+        # 调试模式：检查该店铺是否有任何数据（包括已删除的），以及数据库中的店铺ID格式
+        all_count = Goods.select().where(Goods.store_id == store_id).count()
+        store_ids_in_db = [s.store_id for s in Goods.select(Goods.store_id).distinct().limit(10) if s.store_id]
         print(f"该店铺在数据库中的总记录数（包括已删除）: {all_count}")
-        
-        # 检查数据库中所有不同的店铺ID
-        distinct_stores = Goods.select(Goods.store_id).distinct()
-        store_ids_in_db = [s.store_id for s in distinct_stores if s.store_id]
-        print(f"数据库中存在的店铺IDs: {store_ids_in_db[:10]}...")  # 只显示前10个
-        
-        # 检查store_id的类型和格式
-        print(f"查询的store_id类型: {type(real_store_id)}, 值: '{real_store_id}'")
-        if store_ids_in_db:
-            print(f"数据库中第一个store_id类型: {type(store_ids_in_db[0])}, 值: '{store_ids_in_db[0]}'")
-        
+        print(f"数据库中存在的店铺IDs: {store_ids_in_db}...")
         return {
             "message": f"该店铺暂无商品数据。数据库中该店铺总记录数: {all_count}",
             "data": [],
             "debug": {
                 "original_store_id": store_id,
-                "real_store_id": real_store_id,
-                "store_id_type": str(type(real_store_id)),
+                "real_store_id": store_id,
+                "store_id_type": str(type(store_id)),
                 "total_records_in_db": all_count,
                 "sample_store_ids": store_ids_in_db[:5]
             }
         }
 
-    # 导入PDD相关表
-    from backend.models.database import PddTable, PddBillRecord
-    
-    # 按good_id进行分组并汇总数据
-    grouped_goods = {}
-    for record in goods_records_list:
-        good_id = record.goods_id
-        
-        if good_id not in grouped_goods:
-            # 初始化商品数据
-            grouped_goods[good_id] = {
-                'id': record.id,
-                'good_id': record.goods_id,
-                'good_name': record.goods_name,
-                'store_id': record.store_id,
-                'store_name': record.store_name,
-                'order_ids': [record.order_id] if record.order_id else [],
-                'so_ids': [record.soId] if record.soId else [],  # 收集线上订单号
-                'payment_amount': record.payment_amount or 0.0,
-                'sales_amount': record.sales_amount or 0.0,
-                'sales_cost': record.sales_cost or 0.0,
-                'refund_amount': record.refund_amount or 0.0,
-                'gross_profit_1_occurred': record.gross_profit_1_occurred or 0.0,
-                'gross_profit_1_rate': record.gross_profit_1_rate or 0.0,
-                'advertising_expenses': record.advertising_expenses or 0.0,
-                'advertising_ratio': record.advertising_ratio or 0.0,
-                'gross_profit_3': record.gross_profit_3 or 0.0,
-                'gross_profit_3_rate': record.gross_profit_3_rate or 0.0,
-                'gross_profit_4': record.gross_profit_4 or 0.0,
-                'gross_profit_4_rate': record.gross_profit_4_rate or 0.0,
-                'net_profit': record.net_profit or 0.0,
-                'net_profit_rate': record.net_profit_rate or 0.0,
-                'first_goodorder_time': record.goodorder_time,
-                'latest_goodorder_time': record.goodorder_time,
-                'created_at': record.created_at,
-                'updated_at': record.updated_at,
-                'order_count': 1
-            }
-        else:
-            # 累加数值字段
-            existing = grouped_goods[good_id]
-            existing['payment_amount'] += record.payment_amount or 0.0
-            existing['sales_amount'] += record.sales_amount or 0.0
-            existing['sales_cost'] += record.sales_cost or 0.0
-            existing['refund_amount'] += record.refund_amount or 0.0
-            existing['gross_profit_1_occurred'] += record.gross_profit_1_occurred or 0.0
-            existing['advertising_expenses'] += record.advertising_expenses or 0.0
-            existing['advertising_ratio'] += record.advertising_ratio or 0.0
-            existing['gross_profit_3'] += record.gross_profit_3 or 0.0
-            existing['gross_profit_4'] += record.gross_profit_4 or 0.0
-            existing['net_profit'] += record.net_profit or 0.0
-            
-            # 更新订单ID列表
-            if record.order_id:
-                existing['order_ids'].append(record.order_id)
-            # 更新线上订单号列表
-            if record.soId:
-                existing['so_ids'].append(record.soId)
-            
-            # 更新时间范围
-            if record.goodorder_time and (not existing['latest_goodorder_time'] or record.goodorder_time > existing['latest_goodorder_time']):
-                existing['latest_goodorder_time'] = record.goodorder_time
-            if record.goodorder_time and (not existing['first_goodorder_time'] or record.goodorder_time < existing['first_goodorder_time']):
-                existing['first_goodorder_time'] = record.goodorder_time
-            
-            # 更新更新时间
-            if record.updated_at > existing['updated_at']:
-                existing['updated_at'] = record.updated_at
-            
-            existing['order_count'] += 1
-    
-    print(f"分组后的商品数量: {len(grouped_goods)}")
-    
-    # 将分组结果转换为前端需要的格式，并关联PDD表数据
-    for good_id, data in grouped_goods.items():
-        # 关联 pdd_ads 表获取广告费（按 goods_id、store_id 和日期匹配）
-        advertising_expenses_from_pdd = 0.0
-        if good_id and data['store_id'] and target_date:
-            print(f"\n=== 查询商品 {good_id} 的广告费 ===")
-            print(f"  goods_id: {good_id}")
-            print(f"  store_id: {data['store_id']}")
-            print(f"  target_date: {target_date}")
-            
-            # 查询该商品在指定日期的广告费记录
-            pdd_ads_records = PddTable.select().where(
-                (PddTable.goods_id == good_id) &
-                (PddTable.store_id == data['store_id']) &
-                (PddTable.data_date == target_date) &
-                (PddTable.is_del == False)
-            )
-            
-            pdd_ads_list = list(pdd_ads_records)
-            print(f"  找到 {len(pdd_ads_list)} 条广告记录")
-            
-            if pdd_ads_list:
-                # 计算总广告费
-                advertising_expenses_from_pdd = sum(
-                    float(ad.orderSpendNetCostPerOrder or 0) for ad in pdd_ads_list
-                )
-                print(f"  总广告费: {advertising_expenses_from_pdd}")
-                # 打印前3条记录的详情
-                for i, ad in enumerate(pdd_ads_list[:3]):
-                    print(f"    记录{i+1}: ad_id={ad.ad_id}, 费用={ad.orderSpendNetCostPerOrder}, 日期={ad.data_date}")
-            else:
-                # 检查是否有该商品的其他日期的广告记录
-                any_ads = PddTable.select().where(
-                    (PddTable.goods_id == good_id) &
-                    (PddTable.store_id == data['store_id']) &
-                    (PddTable.is_del == False)
-                ).limit(3)
-                any_ads_list = list(any_ads)
-                if any_ads_list:
-                    print(f"  该商品有其他日期的广告记录，但日期不匹配")
-                    print(f"  数据库中的日期示例: {[ad.data_date for ad in any_ads_list]}")
-                else:
-                    print(f"  该商品在广告表中没有任何记录")
-        elif not target_date:
-            print(f"\n⚠️ 未提供订单日期，跳过商品 {good_id} 的广告费查询")
-        
-        # 关联 pdd_bill_records 表获取退款金额（按 shop_id、so_ids 和日期匹配）
-        refund_amount_from_pdd = 0.0
-        if data['store_id'] and data['so_ids'] and target_date:
-            print(f"\n=== 查询商品 {good_id} 的退款金额 ===")
-            print(f"  shop_id: {data['store_id']}")
-            print(f"  so_ids数量: {len(data['so_ids'])}")
-            print(f"  so_ids前3个: {data['so_ids'][:3]}")
-            print(f"  target_date: {target_date}")
-            
-            # 查询指定日期的退款金额总和，使用ABS转换为正数
-            bill_records = PddBillRecord.select().where(
-                (PddBillRecord.shop_id == data['store_id']) &
-                (PddBillRecord.order_sn.in_(data['so_ids'])) &
-                (PddBillRecord.bill_date == target_date) &
-                (PddBillRecord.is_del == False)
-            )
-            
-            bill_list = list(bill_records)
-            print(f"  找到 {len(bill_list)} 条退款记录")
-            
-            if bill_list:
-                # 计算总退款金额（取绝对值）
-                refund_amount_from_pdd = sum(
-                    abs(float(bill.amount or 0)) for bill in bill_list
-                )
-                print(f"  总退款金额: {refund_amount_from_pdd}")
-                # 打印前3条记录的详情
-                for i, bill in enumerate(bill_list[:3]):
-                    print(f"    记录{i+1}: order_sn={bill.order_sn}, 金额={bill.amount}, 日期={bill.bill_date}")
-            else:
-                # 如果没找到，检查是否有该店铺的其他日期的退款记录
-                any_bills = PddBillRecord.select().where(
-                    (PddBillRecord.shop_id == data['store_id']) &
-                    (PddBillRecord.order_sn.in_(data['so_ids'])) &
-                    (PddBillRecord.is_del == False)
-                ).limit(3)
-                any_bills_list = list(any_bills)
-                if any_bills_list:
-                    print(f"  该店铺有其他日期的退款记录，但日期不匹配")
-                    print(f"  数据库中的日期示例: {[b.bill_date for b in any_bills_list]}")
-                else:
-                    print(f"  该店铺在退款表中没有匹配的订单号记录")
-        elif not target_date:
-            print(f"\n⚠️ 未提供订单日期，跳过商品 {good_id} 的退款金额查询")
-        
+    if debug:
+        print(f"分组后的商品数量: {len(grouped_goods)}，匹配到广告费的商品: {len(ad_costs)}，匹配到退款的商品: {len(refunds)}")
+        _print_store_goods_diagnostics(
+            store_id, target_date,
+            [data['good_id'] for data in grouped_goods if data['good_id'] and not ad_costs.get(data['good_id'])],
+            [data['good_id'] for data in grouped_goods if data['so_ids'] and not refunds.get(data['good_id'])]
+        )
+
+    goods_data = []
+    for data in grouped_goods:
+        good_id = data['good_id']
         # 使用关联查询的值，如果没有则使用累加的值
+        advertising_expenses_from_pdd = ad_costs.get(good_id, 0.0) if good_id else 0.0
+        refund_amount_from_pdd = refunds.get(good_id, 0.0)
         final_advertising_expenses = advertising_expenses_from_pdd if advertising_expenses_from_pdd > 0 else data['advertising_expenses']
         final_refund_amount = refund_amount_from_pdd if refund_amount_from_pdd > 0 else data['refund_amount']
-        
-        # 重新计算利润指标（使用关联后的广告费和退款金额）
+
         sales_amount = data['sales_amount']
         sales_cost = data['sales_cost']
-        
-        gross_profit_1_occurred = sales_amount - sales_cost
-        gross_profit_1_rate = (gross_profit_1_occurred / sales_amount * 100) if sales_amount > 0 else 0.0
-        
-        advertising_ratio = (final_advertising_expenses / sales_amount * 100) if sales_amount > 0 else 0.0
-        
-        gross_profit_3 = sales_amount - sales_cost - final_advertising_expenses
-        gross_profit_3_rate = (gross_profit_3 / sales_amount * 100) if sales_amount > 0 else 0.0
-        
-        gross_profit_4 = gross_profit_3
-        gross_profit_4_rate = (gross_profit_4 / sales_amount * 100) if sales_amount > 0 else 0.0
-        
-        net_profit = gross_profit_3
-        net_profit_rate = (net_profit / sales_amount * 100) if sales_amount > 0 else 0.0
-        
-        # 格式化时间
-        first_time_str = data['first_goodorder_time'].strftime("%Y-%m-%d %H:%M:%S") if data['first_goodorder_time'] else ""
-        latest_time_str = data['latest_goodorder_time'].strftime("%Y-%m-%d %H:%M:%S") if data['latest_goodorder_time'] else ""
-        
+        first_time = data['first_goodorder_time']
+        latest_time = data['latest_goodorder_time']
+
         goods_data.append({
             'id': data['id'],
-            'good_id': data['good_id'],
+            'good_id': good_id,
             'good_name': data['good_name'],
-            'store_id': data['store_id'],
+            'store_id': store_id,
             'store_name': data['store_name'],
-            'order_ids': ', '.join([oid for oid in data['order_ids'] if oid]),
-            'so_ids': ', '.join([sid for sid in data['so_ids'] if sid]),  # 线上订单号
+            'order_ids': data['order_ids'] or '',
+            'so_ids': data['so_ids'] or '',  # 线上订单号
             'order_count': data['order_count'],
             'payment_amount': round(data['payment_amount'], 2),
             'sales_amount': round(sales_amount, 2),
             'sales_cost': round(sales_cost, 2),
             'refund_amount': round(final_refund_amount, 2),  # 使用关联查询的退款金额
-            'gross_profit_1_occurred': round(gross_profit_1_occurred, 2),
-            'gross_profit_1_rate': round(gross_profit_1_rate, 2),
-            'advertising_expenses': round(final_advertising_expenses, 2),  # 使用关联查询的广告费
-            'advertising_ratio': round(advertising_ratio, 2),
-            'gross_profit_3': round(gross_profit_3, 2),
-            'gross_profit_3_rate': round(gross_profit_3_rate, 2),
-            'gross_profit_4': round(gross_profit_4, 2),
-            'gross_profit_4_rate': round(data['gross_profit_4_rate'], 2),
-            'net_profit': round(data['net_profit'], 2),
-            'net_profit_rate': round(data['net_profit_rate'], 2),
-            'first_order_time': first_time_str,
-            'latest_order_time': latest_time_str,
+            # 使用关联后的广告费重新计算利润指标
+            **compute_profit_metrics(sales_amount, sales_cost, final_advertising_expenses),
+            'first_order_time': first_time.strftime("%Y-%m-%d %H:%M:%S") if first_time else "",
+            'latest_order_time': latest_time.strftime("%Y-%m-%d %H:%M:%S") if latest_time else "",
             'created_at': data['created_at'].strftime("%Y-%m-%d %H:%M:%S") if data['created_at'] else "",
             'updated_at': data['updated_at'].strftime("%Y-%m-%d %H:%M:%S") if data['updated_at'] else ""
         })
-    
-    print(f"最终返回的商品数据数量: {len(goods_data)}")
-    
+
     return {
         "message": "成功获取店铺商品详情",
         "data": goods_data
@@ -1599,8 +2004,72 @@ def debug_store_ids(current_user = Depends(get_current_user)):
 
 
 
+# 用户商品汇总中按行累加的金额字段
+USER_GOODS_SUM_FIELDS = (
+    'payment_amount', 'sales_amount', 'refund_amount', 'sales_cost', 'gross_profit_1_occurred',
+    'advertising_expenses', 'gross_profit_3', 'gross_profit_4', 'net_profit',
+)
+# 用户汇总中取各商品比率平均值的字段：比率字段 -> 金额字段
+USER_GOODS_RATE_FIELDS = (
+    ('gross_profit_1_rate', 'gross_profit_1_occurred'),
+    ('advertising_ratio', 'advertising_expenses'),
+    ('gross_profit_3_rate', 'gross_profit_3'),
+    ('gross_profit_4_rate', 'gross_profit_4'),
+    ('net_profit_rate', 'net_profit'),
+)
+
+
+def _aggregate_goods_by_id(goods_ids, start_date=None, end_date=None):
+    """
+    按 goods_id 汇总商品日汇总（所有用户关联商品的并集只查一次，按 goods_id 前缀的唯一索引范围扫描），
+    返回 {goods_id: 汇总数据}，比率按汇总金额重新计算
+    """
+    goods_by_id = {}
+    goods_ids = list(goods_ids)
+    conditions = [GoodsDaily.goods_rows > 0]
+    if start_date and end_date:
+        conditions.append(GoodsDaily.stat_date.between(start_date, end_date))
+    for i in range(0, len(goods_ids), ENRICH_KEY_BATCH_SIZE):
+        rows = (GoodsDaily
+                .select(GoodsDaily.goods_id,
+                        fn.MIN(GoodsDaily.store_id).alias('store_id'),
+                        fn.SUM(GoodsDaily.order_count).alias('orders_count'),
+                        *[fn.SUM(getattr(GoodsDaily, field)).alias(field) for field in USER_GOODS_SUM_FIELDS])
+                .where(GoodsDaily.goods_id.in_(goods_ids[i:i + ENRICH_KEY_BATCH_SIZE]), *conditions)
+                .group_by(GoodsDaily.goods_id)
+                .dicts())
+        for row in rows:
+            sales_amount = row['sales_amount']
+            for rate_field, amount_field in USER_GOODS_RATE_FIELDS:
+                row[rate_field] = round(row[amount_field] / sales_amount * 100, 2) if sales_amount != 0 else 0
+            goods_by_id[row['goods_id']] = row
+    return goods_by_id
+
+
+def _build_user_goods_summary(user, goods_data):
+    """把一个用户关联商品的汇总数据合并成一行用户汇总，没有商品数据时各项为 0"""
+    summary = {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'role': user.role,
+        'goods_count': len(goods_data),  # 汇总后的商品种类数量
+        'stores_count': len(set(item['store_id'] for item in goods_data if item['store_id'])),
+        'orders_count': sum(item['orders_count'] for item in goods_data),  # 总订单数量
+    }
+    for field in USER_GOODS_SUM_FIELDS:
+        summary[field] = sum(item[field] for item in goods_data) if goods_data else 0.0
+    for rate_field, _ in USER_GOODS_RATE_FIELDS:
+        summary[rate_field] = sum(item[rate_field] for item in goods_data) / len(goods_data) if goods_data else 0.0
+    summary['created_at'] = user.created_at.strftime("%Y-%m-%d %H:%M:%S") if user.created_at else ""
+    summary['updated_at'] = user.updated_at.strftime("%Y-%m-%d %H:%M:%S") if user.updated_at else ""
+    return summary
+
+
 # 用户-商品 接口（根据当前登录的用户 ，去查他关联的所有商品的数据， 管理员查看所有用户和商品的数据）
 @router.get("/user_goods_summary/")
+@run_in_lane(db_lane)
+@cached_response("user_goods_summary")
 def get_user_goods_summary(
     start_date: str = Query(None, description="开始日期，格式：YYYY-MM-DD"),
     end_date: str = Query(None, description="结束日期，格式：YYYY-MM-DD"),
@@ -1611,255 +2080,44 @@ def get_user_goods_summary(
     管理员可查看所有用户的数据，普通用户只能查看自己的数据
     返回每个用户的关联商品和店铺的汇总信息
     支持按日期范围查询
+    所有用户关联商品的并集从商品日汇总按 goods_id 一次分组汇总，再在内存中分摊到各个用户，
+    查询次数与用户数无关
     """
     
     # 判断是否为管理员
     is_admin = current_user.role == 'admin'
     
-    users_summary = []
-    
     if is_admin:
         # 管理员查看所有用户
-        users = User.select().where(User.is_del == False)
+        users = list(User.select().where(User.is_del == False))
     else:
         # 普通用户只能查看自己的信息
         users = [current_user]
-    
+
+    # 提取每个用户关联的商品ID（去重），以及所有用户关联商品的并集
+    user_goods_ids = {}
+    all_goods_ids = set()
     for user in users:
-        # 获取用户关联的商品和店铺信息
-        user_goods_stores = user.get_goods_stores()
-        
-        if not user_goods_stores:
-            # 如果用户没有关联任何商品和店铺，仍需返回用户基本信息
-            users_summary.append({
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'role': user.role,
-                'goods_count': 0,
-                'stores_count': 0,
-                'orders_count': 0,  # 订单数量
-                'payment_amount': 0.0,
-                'refund_amount': 0.0,
-                'sales_amount': 0.0,
-                'sales_cost': 0.0,
-                'gross_profit_1_occurred': 0.0,
-                'gross_profit_1_rate': 0.0,
-                'advertising_expenses': 0.0,
-                'advertising_ratio': 0.0,
-                'gross_profit_3': 0.0,
-                'gross_profit_3_rate': 0.0,
-                'gross_profit_4': 0.0,
-                'gross_profit_4_rate': 0.0,
-                'net_profit': 0.0,
-                'net_profit_rate': 0.0,
-                'created_at': user.created_at.strftime("%Y-%m-%d %H:%M:%S") if user.created_at else "",
-                'updated_at': user.updated_at.strftime("%Y-%m-%d %H:%M:%S") if user.updated_at else ""
-            })
-            continue
-        
-        # 提取用户关联的商品ID列表
-        user_associated_goods_ids = [item.get('good_id') for item in user_goods_stores if item.get('good_id')]
-        
-        # 如果用户没有关联任何商品ID，返回空结果
-        if not user_associated_goods_ids:
-            users_summary.append({
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'role': user.role,
-                'goods_count': 0,
-                'stores_count': 0,
-                'orders_count': 0,
-                'payment_amount': 0.0,
-                'refund_amount': 0.0,
-                'sales_amount': 0.0,
-                'sales_cost': 0.0,
-                'gross_profit_1_occurred': 0.0,
-                'gross_profit_1_rate': 0.0,
-                'advertising_expenses': 0.0,
-                'advertising_ratio': 0.0,
-                'gross_profit_3': 0.0,
-                'gross_profit_3_rate': 0.0,
-                'gross_profit_4': 0.0,
-                'gross_profit_4_rate': 0.0,
-                'net_profit': 0.0,
-                'net_profit_rate': 0.0,
-                'created_at': user.created_at.strftime("%Y-%m-%d %H:%M:%S") if user.created_at else "",
-                'updated_at': user.updated_at.strftime("%Y-%m-%d %H:%M:%S") if user.updated_at else ""
-            })
-            continue
-        
-        # 构建查询条件
-        query_conditions = [
-            Goods.is_del == False,
-            Goods.goods_id.in_(user_associated_goods_ids)  # 限制为用户关联的商品ID
-        ]
-        
-        # 如果提供了日期范围，则添加日期筛选条件
-        if start_date and end_date:
-            try:
-                # 正确解析 YYYY-MM-DD 格式的日期
-                start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-                end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-                # 将开始日期设置为当天的开始（00:00:00）
-                start_dt = start_dt.replace(hour=0, minute=0, second=0)
-                # 将结束日期设置为当天的结束（23:59:59），以包含整个结束日期
-                end_dt = end_dt.replace(hour=0, minute=0, second=0)
-                # 使用goodorder_time字段进行日期筛选（这是实际的订单时间）
-                query_conditions.append((Goods.goodorder_time >= start_dt) & (Goods.goodorder_time <= end_dt))
-            except ValueError:
-                raise HTTPException(status_code=400, detail="日期格式不正确，请使用 YYYY-MM-DD 格式")
-        
-        # 查询用户关联的商品数据
-        goods_records = Goods.select().where(*query_conditions)
-        
-        # 按商品ID分组，汇总相同商品的数据
-        goods_by_id = {}
-        for record in goods_records:
-            goods_id = record.goods_id
-            if goods_id not in goods_by_id:
-                goods_by_id[goods_id] = {
-                    'good_id': record.goods_id,
-                    'good_name': record.goods_name,
-                    'store_id': record.store_id,
-                    'store_name': record.store_name,
-                    'payment_amount': 0.0,
-                    'sales_amount': 0.0,
-                    'refund_amount': 0.0,
-                    'sales_cost': 0.0,
-                    'gross_profit_1_occurred': 0.0,
-                    'gross_profit_1_rate': 0.0,
-                    'advertising_expenses': 0.0,
-                    'advertising_ratio': 0.0,
-                    'gross_profit_3': 0.0,
-                    'gross_profit_3_rate': 0.0,
-                    'gross_profit_4': 0.0,
-                    'gross_profit_4_rate': 0.0,
-                    'net_profit': 0.0,
-                    'net_profit_rate': 0.0,
-                    'order_ids': set(),  # 记录涉及的订单ID集合
-                    'created_at': record.created_at,
-                    'updated_at': record.updated_at
-                }
-            
-            # 累加数值字段
-            goods_by_id[goods_id]['payment_amount'] += record.payment_amount or 0.0
-            goods_by_id[goods_id]['sales_amount'] += record.sales_amount or 0.0
-            goods_by_id[goods_id]['refund_amount'] += record.refund_amount or 0.0
-            goods_by_id[goods_id]['sales_cost'] += record.sales_cost or 0.0
-            goods_by_id[goods_id]['gross_profit_1_occurred'] += record.gross_profit_1_occurred or 0.0
-            goods_by_id[goods_id]['advertising_expenses'] += record.advertising_expenses or 0.0
-            goods_by_id[goods_id]['gross_profit_3'] += record.gross_profit_3 or 0.0
-            goods_by_id[goods_id]['gross_profit_4'] += record.gross_profit_4 or 0.0
-            goods_by_id[goods_id]['net_profit'] += record.net_profit or 0.0
-            
-            # 记录订单ID
-            if record.order_id:
-                goods_by_id[goods_id]['order_ids'].add(record.order_id)
-        
-        # 转换为列表格式
-        goods_data = []
-        for goods_info in goods_by_id.values():
-            # 重新计算比率
-            sales_amount = goods_info['sales_amount']
-            if sales_amount != 0:
-                goods_info['gross_profit_1_rate'] = round(goods_info['gross_profit_1_occurred'] / sales_amount * 100, 2)
-                goods_info['advertising_ratio'] = round(goods_info['advertising_expenses'] / sales_amount * 100, 2)
-                goods_info['gross_profit_3_rate'] = round(goods_info['gross_profit_3'] / sales_amount * 100, 2)
-                goods_info['gross_profit_4_rate'] = round(goods_info['gross_profit_4'] / sales_amount * 100, 2)
-                goods_info['net_profit_rate'] = round(goods_info['net_profit'] / sales_amount * 100, 2)
-            else:
-                goods_info['gross_profit_1_rate'] = 0
-                goods_info['advertising_ratio'] = 0
-                goods_info['gross_profit_3_rate'] = 0
-                goods_info['gross_profit_4_rate'] = 0
-                goods_info['net_profit_rate'] = 0
-            
-            goods_info['orders_count'] = len(goods_info['order_ids'])  # 订单数量
-            del goods_info['order_ids']  # 删除临时字段
-            goods_data.append(goods_info)
-
-        # 计算汇总数据
-        if goods_data:
-            total_payment_amount = sum(item['payment_amount'] for item in goods_data)
-            total_sales_amount = sum(item['sales_amount'] for item in goods_data)
-            total_refund_amount = sum(item['refund_amount'] for item in goods_data)
-            total_sales_cost = sum(item['sales_cost'] for item in goods_data)
-            total_gross_profit_1_occurred = sum(item['gross_profit_1_occurred'] for item in goods_data)
-            avg_gross_profit_1_rate = (
-                sum(item['gross_profit_1_rate'] for item in goods_data) / len(goods_data) 
-                if goods_data else 0
-            )
-            total_advertising_expenses = sum(item['advertising_expenses'] for item in goods_data)
-            avg_advertising_ratio = (
-                sum(item['advertising_ratio'] for item in goods_data) / len(goods_data) 
-                if goods_data else 0
-            )
-            total_gross_profit_3 = sum(item['gross_profit_3'] for item in goods_data)
-            avg_gross_profit_3_rate = (
-                sum(item['gross_profit_3_rate'] for item in goods_data) / len(goods_data) 
-                if goods_data else 0
-            )
-            total_gross_profit_4 = sum(item['gross_profit_4'] for item in goods_data)
-            avg_gross_profit_4_rate = (
-                sum(item['gross_profit_4_rate'] for item in goods_data) / len(goods_data) 
-                if goods_data else 0
-            )
-            total_net_profit = sum(item['net_profit'] for item in goods_data)
-            avg_net_profit_rate = (
-                sum(item['net_profit_rate'] for item in goods_data) / len(goods_data) 
-                if goods_data else 0
-            )
-            
-            # 统计不同的店铺数量
-            store_ids = set(item['store_id'] for item in goods_data if item['store_id'])
-            
-            # 统计总的订单数量（所有商品涉及的订单总数）
-            total_orders_count = sum(item.get('orders_count', 0) for item in goods_data)
-        else:
-            total_payment_amount = 0.0
-            total_sales_amount = 0.0
-            total_refund_amount = 0.0
-            total_sales_cost = 0.0
-            total_gross_profit_1_occurred = 0.0
-            avg_gross_profit_1_rate = 0.0
-            total_advertising_expenses = 0.0
-            avg_advertising_ratio = 0.0
-            total_gross_profit_3 = 0.0
-            avg_gross_profit_3_rate = 0.0
-            total_gross_profit_4 = 0.0
-            avg_gross_profit_4_rate = 0.0
-            total_net_profit = 0.0
-            avg_net_profit_rate = 0.0
-            store_ids = set()
-            total_orders_count = 0
-
-        users_summary.append({
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'role': user.role,
-            'goods_count': len(goods_data),  # 汇总后的商品种类数量
-            'stores_count': len(store_ids),
-            'orders_count': total_orders_count,  # 总订单数量
-            'payment_amount': total_payment_amount,
-            'sales_amount': total_sales_amount,
-            'refund_amount': total_refund_amount,
-            'sales_cost': total_sales_cost,
-            'gross_profit_1_occurred': total_gross_profit_1_occurred,
-            'gross_profit_1_rate': avg_gross_profit_1_rate,
-            'advertising_expenses': total_advertising_expenses,
-            'advertising_ratio': avg_advertising_ratio,
-            'gross_profit_3': total_gross_profit_3,
-            'gross_profit_3_rate': avg_gross_profit_3_rate,
-            'gross_profit_4': total_gross_profit_4,
-            'gross_profit_4_rate': avg_gross_profit_4_rate,
-            'net_profit': total_net_profit,
-            'net_profit_rate': avg_net_profit_rate,
-            'created_at': user.created_at.strftime("%Y-%m-%d %H:%M:%S") if user.created_at else "",
-            'updated_at': user.updated_at.strftime("%Y-%m-%d %H:%M:%S") if user.updated_at else ""
-        })
+        goods_ids = set(item.get('good_id') for item in user.get_goods_stores() if item.get('good_id'))
+        user_goods_ids[user.id] = goods_ids
+        all_goods_ids |= goods_ids
+
+    # 如果提供了日期范围，则按订单日期筛选（包含结束日期当天）
+    start_day = end_day = None
+    if start_date and end_date and all_goods_ids:
+        try:
+            # 正确解析 YYYY-MM-DD 格式的日期
+            start_day = datetime.strptime(start_date, "%Y-%m-%d").date()
+            end_day = datetime.strptime(end_date, "%Y-%m-%d").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="日期格式不正确，请使用 YYYY-MM-DD 格式")
+
+    goods_by_id = _aggregate_goods_by_id(all_goods_ids, start_day, end_day)
+
+    users_summary = []
+    for user in users:
+        goods_data = [goods_by_id[goods_id] for goods_id in user_goods_ids[user.id] if goods_id in goods_by_id]
+        users_summary.append(_build_user_goods_summary(user, goods_data))
     
     # 根据是否有日期筛选添加适当的消息
     date_msg = f"（{start_date} 至 {end_date}）" if start_date and end_date else ""
@@ -1872,6 +2130,8 @@ def get_user_goods_summary(
 
 # 用户商品详情
 @router.get("/user_goods_detail/{user_id}")
+@run_in_lane(db_lane)
+@cached_response("user_goods_detail")
 def get_user_goods_detail(
     user_id: int, 
     start_date: str = Query(None, description="开始日期，格式：YYYY-MM-DD"),
@@ -2050,6 +2310,8 @@ def get_user_goods_detail(
 
 # 用户去关联商品的字典 接口
 @router.get("/goods_dict/")
+@run_in_lane(db_lane)
+@cached_response("goods_dict")
 def get_goods_dict():
     """
     查询goods表形成字典接口
@@ -2116,6 +2378,7 @@ def get_goods_dict():
 
 # 拼多多推广数据相关路由
 @router.post("/pdd/promotion")
+@run_in_lane(sync_lane)
 def get_pdd_promotion(request: dict):
     """
     获取拼多多推广数据
@@ -2,6 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from typing import List
 from .. import schemas
 from ..services import user_service
+from ..services.pagination import paginate, count_rows, COUNT_MODES, InvalidCursorError
+from ..services.response_cache import bump_data_version
 from ..database import get_db
 from .auth import get_current_user
 from ..models.database import User as UserModel, Goods
@@ -36,6 +38,8 @@ def create_new_user(user: schemas.UserCreate, current_user: UserModel = Depends(
             role=user.role or "user",
             goods_stores=json.dumps(processed_goods_stores, ensure_ascii=False)  # 以JSON字符串形式存储
         )
+        # 用户汇总等报表的缓存需要包含新用户
+        bump_data_version()
         
         # 使用model_to_dict_safe函数转换数据格式
         user_dict = user_service.model_to_dict_safe(created_user)
@@ -50,13 +54,18 @@ def read_users(
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     search: str = Query(None, min_length=1),
+    cursor: str = Query(None, description="游标分页：传上一页返回的 next_cursor，传了之后忽略 skip"),
+    count: str = Query("exact", description="总数统计方式：exact / cached / approx / none"),
     current_user: UserModel = Depends(get_current_user)
 ):
     """
     获取用户列表（包含总数）
+    按 (created_at, id) 升序排列，每页都返回 next_cursor
     """
     if current_user.role != 'admin':
         raise HTTPException(status_code=403, detail="只有管理员可以查看用户列表")
+    if count not in COUNT_MODES:
+        raise HTTPException(status_code=400, detail=f"count 只能是 {' / '.join(COUNT_MODES)}")
     
     query = UserModel.select().where(UserModel.is_del == 0)  # 主查询中过滤掉已删除的用户
     
@@ -67,10 +76,13 @@ def read_users(
         )
     
     # 获取总数
-    total = query.count()
+    total = count_rows(query, UserModel, mode=count, filtered=bool(search))
     
     # 获取分页数据
-    users = query.offset(skip).limit(limit)
+    try:
+        users, next_cursor = paginate(query, UserModel, skip=skip, limit=limit, cursor=cursor, descending=False)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     result = []
     for user in users:
@@ -80,7 +92,7 @@ def read_users(
         user_dict["goods_stores"] = user.get_goods_stores()
         result.append(user_dict)
     
-    return {"data": result, "total": total}
+    return {"data": result, "total": total, "next_cursor": next_cursor}
 
 
 
@@ -139,6 +151,9 @@ def update_user(
         query = UserModel.update(**update_data).where(UserModel.id == user_id)
         query.execute()
     
+    # 用户关联的商品可能变化，报表缓存失效
+    bump_data_version()
+
     # 获取更新后的用户数据
     updated_user = UserModel.get_or_none(UserModel.id == user_id)
     user_dict = user_service.model_to_dict_safe(updated_user)
@@ -168,6 +183,7 @@ def delete_existing_user(user_id: int, current_user: UserModel = Depends(get_cur
         result = user_service.delete_user(db, user_id=user_id)
         if not result:
             raise HTTPException(status_code=404, detail="用户不存在")
+        bump_data_version()
         return {"message": "用户删除成功"}
 
 
@@ -199,6 +215,7 @@ def update_user_goods_stores(
     user.set_goods_stores(goods_stores_list)
     user.updated_at = datetime.now()
     user.save()
+    bump_data_version()
     
     return {"message": "用户商品店铺关联信息更新成功"}
 
@@ -0,0 +1,117 @@
+"""
+订单展开基准测试：构造一天 10 万个订单，比较逐单解析和列式展开的吞吐（订单/秒）
+
+用法（在 backend 目录下执行）:
+    python benchmarks/order_explode_benchmark.py [订单数]
+
+不访问聚水潭接口和数据库，只测试解析和聚合
+"""
+import sys
+import json
+import time
+import random
+from pathlib import Path
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PROJECT_ROOT = BACKEND_DIR.parent
+for path in (str(PROJECT_ROOT), str(BACKEND_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from backend.services import order_explode
+from backend.api.products import _new_order_snapshot, _fold_sales_amount_batch, _fold_sales_cost_batch, ORDER_EXPLODE_BATCH_SIZE
+
+SYNC_DATE = date(2026, 1, 15)
+
+
+def build_synthetic_orders(order_count, seed=42):
+    """构造一天的订单：30 个店铺、2000 个商品，每单 1~4 个商品，下单时间按秒随机（会有重复）"""
+    rng = random.Random(seed)
+    day_start = datetime.combine(SYNC_DATE, datetime.min.time())
+    orders = []
+    for i in range(order_count):
+        order_time = day_start + timedelta(seconds=rng.randrange(86400))
+        goods = [
+            {"shopIid": f"{rng.randrange(2000):06d}", "itemName": f"商品{i % 97}", "qty": rng.randint(1, 3)}
+            for _ in range(rng.randint(1, 4))
+        ]
+        orders.append({
+            "oid": str(10000000 + i),
+            "soId": f"SO{i:08d}",
+            "shopId": str(rng.randrange(30)),
+            "shopName": f"店铺{i % 30}",
+            "orderTime": order_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "updated": order_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "payAmount": f"{rng.uniform(5, 500):.2f}",
+            "drpAmount": f"{rng.uniform(2, 300):.2f}",
+            "disInnerOrderGoodsViewList": json.dumps(goods, ensure_ascii=False),
+        })
+    return orders
+
+
+def legacy_aggregate(orders, amount_field):
+    """改造前的写法：每个商品都重新解析订单时间，并用 strftime 拼接字符串键"""
+    goods_map = {}
+    stores = {}
+    for order in orders:
+        amount = float(order.get(amount_field, 0) or 0)
+        try:
+            goods_list = json.loads(order['disInnerOrderGoodsViewList'])
+        except json.JSONDecodeError:
+            continue
+        for goods_item in goods_list:
+            order_time = datetime.strptime(order['orderTime'], '%Y-%m-%d %H:%M:%S')
+            unique_key = f"{goods_item['shopIid']}_{order_time.strftime('%Y%m%d%H%M%S')}"
+            goods_map[unique_key] = goods_map.get(unique_key, 0.0) + amount
+        order_time = datetime.strptime(order['orderTime'], '%Y-%m-%d %H:%M:%S')
+        store_key = (order['shopId'], order_time.date())
+        stores[store_key] = stores.get(store_key, 0.0) + amount
+    return goods_map, stores
+
+
+def explode_and_fold(orders):
+    """改造后的写法：按批展开成列式数组，两个聚合共用"""
+    snapshot = _new_order_snapshot(SYNC_DATE)
+    for i in range(0, len(orders), ORDER_EXPLODE_BATCH_SIZE):
+        chunk = orders[i:i + ORDER_EXPLODE_BATCH_SIZE]
+        _fold_sales_amount_batch(snapshot, order_explode.explode_orders(chunk, 'payAmount'))
+        _fold_sales_cost_batch(snapshot, order_explode.explode_orders(chunk, 'drpAmount'))
+    return snapshot
+
+
+def run_case(name, func, orders):
+    order_explode.parse_order_time.cache_clear()
+    started = time.perf_counter()
+    func(orders)
+    elapsed = time.perf_counter() - started
+    # 两个订单集合各处理一遍
+    processed = len(orders) * 2
+    print(f"{name:<28} {elapsed:8.3f} 秒  {processed / elapsed:12,.0f} 订单/秒")
+    return elapsed
+
+
+def main():
+    order_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f"构造 {order_count} 个订单...")
+    orders = build_synthetic_orders(order_count)
+
+    print(f"orjson: {'已安装' if order_explode.orjson else '未安装，使用标准库 json'}\n")
+    baseline = run_case("逐单解析（改造前）", lambda o: (legacy_aggregate(o, 'payAmount'), legacy_aggregate(o, 'drpAmount')), orders)
+
+    json_loads = order_explode._json_loads
+    order_explode._json_loads = json.loads
+    try:
+        stdlib = run_case("列式展开（标准库 json）", explode_and_fold, orders)
+    finally:
+        order_explode._json_loads = json_loads
+
+    fast = run_case("列式展开（orjson）", explode_and_fold, orders) if order_explode.orjson else stdlib
+
+    print(f"\n列式展开（标准库 json）相对改造前: {baseline / stdlib:.2f}x")
+    if order_explode.orjson:
+        print(f"列式展开（orjson）相对改造前:     {baseline / fast:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
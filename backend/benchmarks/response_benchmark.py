@@ -0,0 +1,153 @@
+"""
+响应序列化和压缩基准测试：比较 /goods/、/stores_data/ 改造前后的序列化耗时和传输字节数
+- 改造前：逐行 strftime 格式化时间，FastAPI jsonable_encoder 转换后用标准库 json 序列化
+- 改造后：时间列直接交给 FastJSONResponse（orjson）序列化，跳过 jsonable_encoder
+- 传输字节数分别统计不压缩、gzip、brotli（压缩级别和 utils/compression.py 相同）
+
+用法（在 backend 目录下执行）:
+    python benchmarks/response_benchmark.py [商品行数] [店铺行数]
+
+不访问数据库，按接口的字段构造数据
+"""
+import sys
+import gzip
+import time
+import random
+from pathlib import Path
+from datetime import datetime, timedelta
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PROJECT_ROOT = BACKEND_DIR.parent
+for path in (str(PROJECT_ROOT), str(BACKEND_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+from backend.utils import responses
+from backend.utils.responses import FastJSONResponse
+from backend.utils.compression import brotli, GZIP_COMPRESS_LEVEL, BROTLI_QUALITY
+from backend.services.profit_enrichment import PROFIT_METRICS, STORE_PROFIT_COLUMNS
+
+# 每种写法重复执行的次数，取最快的一次
+REPEAT = 5
+START_TIME = datetime(2026, 1, 1)
+
+
+def _random_time(rng):
+    return START_TIME + timedelta(seconds=rng.randrange(86400 * 90))
+
+
+def build_goods_rows(row_count, seed=42):
+    """构造商品台账的行，字段和 /goods/ 接口相同，时间列为 datetime"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(row_count):
+        amount = round(rng.uniform(5, 500), 2)
+        rows.append({
+            'id': i + 1,
+            'goods_id': f"{rng.randrange(2000):06d}",
+            'goods_name': f"商品{i % 97} 夏季新款 加厚",
+            'store_id': str(rng.randrange(30)),
+            'store_name': f"店铺{i % 30}",
+            'order_id': str(10000000 + i),
+            'payment_amount': amount,
+            'sales_amount': amount,
+            'refund_amount': 0.0,
+            'sales_cost': round(amount * rng.uniform(0.3, 0.7), 2),
+            **{metric: round(rng.uniform(-50, 200), 2) for metric in PROFIT_METRICS},
+            'is_del': False,
+            'creator': 'system',
+            'goodorder_time': _random_time(rng),
+            'created_at': _random_time(rng),
+            'updated_at': _random_time(rng),
+        })
+    return rows
+
+
+def build_store_rows(row_count, seed=7):
+    """构造店铺汇总的行，字段和 /stores_data/ 接口相同，时间列为 datetime"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(row_count):
+        amount = round(rng.uniform(500, 50000), 2)
+        rows.append({
+            'store_id': str(i % 30),
+            'store_name': f"店铺{i % 30}",
+            'goods_count': rng.randint(1, 300),
+            'order_count': rng.randint(1, 2000),
+            'payment_amount': amount,
+            'sales_amount': amount,
+            'refund_amount': round(rng.uniform(0, 500), 2),
+            'sales_cost': round(amount * rng.uniform(0.3, 0.7), 2),
+            **{metric: round(rng.uniform(-500, 20000), 2) for metric, _ in STORE_PROFIT_COLUMNS},
+            'last_order_time': _random_time(rng),
+            'created_at': _random_time(rng),
+            'updated_at': _random_time(rng),
+        })
+    return rows
+
+
+def _strftime_rows(rows):
+    """改造前接口里的逐行时间格式化"""
+    return [
+        {key: value.strftime("%Y-%m-%d %H:%M:%S") if isinstance(value, datetime) else value
+         for key, value in row.items()}
+        for row in rows
+    ]
+
+
+def legacy_render(rows):
+    """改造前：strftime + jsonable_encoder + 标准库 json"""
+    payload = {"data": _strftime_rows(rows), "total": len(rows)}
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def fast_render(rows):
+    """改造后：时间列直接交给 FastJSONResponse"""
+    return FastJSONResponse({"data": rows, "total": len(rows)}).body
+
+
+def _best_time(func, *args):
+    best = None
+    result = None
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_endpoint(name, rows):
+    print(f"\n{name}（{len(rows)} 行）")
+    legacy_time, legacy_body = _best_time(legacy_render, rows)
+    fast_time, fast_body = _best_time(fast_render, rows)
+    if legacy_body != fast_body:
+        raise AssertionError(f"{name} 改造前后的响应内容不一致")
+
+    print(f"  {'改造前（strftime + jsonable_encoder + json）':<44} {legacy_time * 1000:8.1f} ms")
+    print(f"  {'改造后（FastJSONResponse）':<44} {fast_time * 1000:8.1f} ms  {legacy_time / fast_time:6.1f}x")
+
+    encodings = [("不压缩", lambda body: body),
+                 (f"gzip（级别 {GZIP_COMPRESS_LEVEL}）", lambda body: gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL))]
+    if brotli is not None:
+        encodings.append((f"brotli（级别 {BROTLI_QUALITY}）", lambda body: brotli.compress(body, quality=BROTLI_QUALITY)))
+    for label, compress in encodings:
+        compress_time, compressed = _best_time(compress, fast_body)
+        ratio = len(compressed) / len(fast_body) * 100
+        print(f"  {label:<44} {len(compressed):10,} 字节 {ratio:6.1f}%  压缩 {compress_time * 1000:6.1f} ms")
+
+
+def main():
+    goods_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    store_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    print(f"orjson: {'已安装' if responses.orjson else '未安装，使用标准库 json'}")
+    print(f"brotli: {'已安装' if brotli else '未安装，只测试 gzip'}")
+    run_endpoint("/goods/ 一页", build_goods_rows(goods_count))
+    run_endpoint("/stores_data/ 不分页", build_store_rows(store_count))
+
+
+if __name__ == "__main__":
+    main()
@@ -32,6 +32,8 @@ database = PooledMySQLDatabase(
     connect_timeout=300,  # 增加连接超时时间
     read_timeout=300,  # 5 分钟读取超时，适应大数据量查询
     write_timeout=300, # 5 分钟写入超时，适应批量插入
+    # GROUP_CONCAT 默认只返回 1024 字节，店铺商品详情按商品拼接订单号时会被截断
+    init_command="SET SESSION group_concat_max_len = 1048576",
 )
 
 
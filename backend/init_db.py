@@ -1,6 +1,6 @@
 import logging
 from backend.database import database
-from backend.models.database import User, JushuitanProduct, Goods, Store, PddTable, PddBillRecord
+from backend.models.database import User, JushuitanProduct, Goods, Store, PddTable, PddBillRecord, JushuitanOrderRecord, SyncWatermark, GoodsDaily
 
 
 def init_db():
@@ -17,7 +17,10 @@ def init_db():
         Goods,
         Store,
         PddTable,
-        PddBillRecord
+        PddBillRecord,
+        JushuitanOrderRecord,
+        SyncWatermark,
+        GoodsDaily
         ], safe=True)
 
         logging.info("Database initialized successfully")
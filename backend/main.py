@@ -18,7 +18,13 @@ from backend.api.users import router as users_router
 from backend.api.products import router as products_router
 from backend.api.auth import router as auth_router
 from backend.init_db import init_db
+from backend.utils.etag import ETagMiddleware
+from backend.utils.compression import CompressionMiddleware
+from backend.utils.responses import FastJSONResponse
+from backend.services.executors import configure_interactive_pool
+from backend.utils.query_stats import QueryStatsMiddleware, instrument_database
 from backend.database import database, ensure_connection
+from backend.models.database import database as models_database
 import logging
 
 # 配置日志
@@ -31,12 +37,19 @@ logger = logging.getLogger(__name__)
 # 初始化数据库，创建所有表
 init_db()
 
-app = FastAPI(title="聚水潭和拼多多数据管理系统", version="1.0.0")
+# 按请求统计 SQL 次数和耗时（见 utils/query_stats.py）；模型使用的数据库实例和 get_db() 的实例都要统计
+instrument_database(models_database)
+instrument_database(database)
+
+# 默认用 orjson 序列化响应（见 utils/responses.py）
+app = FastAPI(title="聚水潭和拼多多数据管理系统", version="1.0.0", default_response_class=FastJSONResponse)
 
 # 应用启动时连接数据库
 @app.on_event("startup")
 async def startup():
     logger.info("Application starting up...")
+    # 限制默认线程池的线程数，报表和同步接口在各自的执行通道中运行（见 services/executors.py）
+    configure_interactive_pool()
     if ensure_connection():
         logger.info("✅ Database connected successfully on startup")
     else:
@@ -50,6 +63,15 @@ async def shutdown():
         database.close()
         logger.info("Database connection closed on shutdown")
 
+# 响应压缩（brotli / gzip），最先注册、位于最内层，直接处理接口返回的完整响应体
+app.add_middleware(CompressionMiddleware)
+
+# 报表接口的条件请求（ETag / 304），注册在跨域中间件之前，304 响应也会带上跨域响应头
+app.add_middleware(ETagMiddleware)
+
+# 每个请求的 SQL 次数和耗时，写入 X-Query-Count / Server-Timing 响应头
+app.add_middleware(QueryStatsMiddleware)
+
 # 允许跨域请求
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,107 @@
+"""
+数据库迁移脚本：创建商品日汇总表 goods_daily，并用已有的商品台账、推广数据和账单数据回填
+- goods 表添加 (store_id, goodorder_time) 索引，按店铺日期重算汇总时使用
+- 回填按 (店铺, 日期) 分批重算，可以重复执行
+"""
+import os
+import sys
+from peewee import fn
+
+# 项目根目录加入路径，和同步接口共用 backend.services.goods_daily
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.models.database import database, Goods, GoodsDaily, PddTable, PddBillRecord
+from backend.services.goods_daily import refresh_goods_daily, _as_date
+
+# 与 Peewee 根据 Goods.Meta.indexes 自动生成的索引名一致
+GOODS_INDEX_NAME = 'goods_store_id_goodorder_time'
+# 每批回填的店铺日期数
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _all_store_dates():
+    """三张源表中出现过的所有 (店铺, 日期)"""
+    keys = set()
+    keys.update(Goods
+                .select(Goods.store_id, fn.DATE(Goods.goodorder_time))
+                .where((Goods.is_del == False) & Goods.goodorder_time.is_null(False))
+                .distinct()
+                .tuples())
+    keys.update(PddTable
+                .select(PddTable.store_id, PddTable.data_date)
+                .where(PddTable.is_del == False)
+                .distinct()
+                .tuples())
+    keys.update(PddBillRecord
+                .select(PddBillRecord.shop_id, PddBillRecord.bill_date)
+                .where(PddBillRecord.is_del == False)
+                .distinct()
+                .tuples())
+    return sorted({(store_id, _as_date(stat_date)) for store_id, stat_date in keys if store_id and stat_date})
+
+
+def migrate():
+    """执行迁移"""
+    print("开始迁移商品日汇总...")
+
+    try:
+        with database:
+            # 1. 创建 goods_daily 表（包括索引）
+            print("1. 创建 goods_daily 表...")
+            GoodsDaily.create_table(safe=True)
+            print("   ✅ goods_daily 表已就绪")
+
+            # 2. goods 表添加 (store_id, goodorder_time) 索引
+            print("2. 添加 goods 表的店铺日期索引...")
+            cursor = database.execute_sql(f"SHOW INDEX FROM goods WHERE Key_name = '{GOODS_INDEX_NAME}'")
+            if cursor.fetchone():
+                print("   索引已存在，跳过")
+            else:
+                database.execute_sql(f"ALTER TABLE goods ADD INDEX {GOODS_INDEX_NAME} (store_id, goodorder_time)")
+                print("   ✅ 索引添加成功")
+
+            # 3. 回填
+            print("3. 回填商品日汇总...")
+            keys = _all_store_dates()
+            written_count = 0
+            for i in range(0, len(keys), BACKFILL_BATCH_SIZE):
+                written_count += refresh_goods_daily(keys[i:i + BACKFILL_BATCH_SIZE])
+                print(f"   进度 {min(i + BACKFILL_BATCH_SIZE, len(keys))}/{len(keys)} 个店铺日期")
+            print(f"   ✅ 写入 {written_count} 条汇总")
+
+            print("\n✅ 迁移完成！")
+            return True
+
+    except Exception as e:
+        print(f"\n❌ 迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def rollback():
+    """回滚迁移"""
+    print("开始回滚...")
+
+    try:
+        with database:
+            print("删除 goods_daily 表...")
+            GoodsDaily.drop_table(safe=True)
+            print(f"删除 goods.{GOODS_INDEX_NAME} 索引...")
+            database.execute_sql(f"ALTER TABLE goods DROP INDEX {GOODS_INDEX_NAME}")
+
+            print("✅ 回滚完成！")
+            return True
+
+    except Exception as e:
+        print(f"❌ 回滚失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "rollback":
+        rollback()
+    else:
+        migrate()
@@ -0,0 +1,80 @@
+"""
+数据库迁移脚本：为 goods 表添加自然键唯一索引 (goods_id, store_id, order_id, goodorder_time)
+同步改为 INSERT ... ON DUPLICATE KEY UPDATE 增量写入后，依赖这个索引判断记录是否已存在
+"""
+from models.database import database
+import sys
+
+# 与 Peewee 根据 Goods.Meta.indexes 自动生成的索引名一致
+INDEX_NAME = 'goods_goods_id_store_id_order_id_goodorder_time'
+
+
+def migrate():
+    """执行迁移"""
+    print("开始迁移 goods 表...")
+
+    try:
+        with database:
+            # 1. 检查索引是否已存在
+            cursor = database.execute_sql(f"SHOW INDEX FROM goods WHERE Key_name = '{INDEX_NAME}'")
+            if cursor.fetchone():
+                print("   唯一索引已存在，跳过")
+                return True
+
+            # 2. 空值统一为空字符串（MySQL 唯一索引不约束 NULL）
+            print("1. 填充自然键中的空值...")
+            for column in ('goods_id', 'store_id', 'order_id'):
+                cursor = database.execute_sql(f"UPDATE goods SET {column} = '' WHERE {column} IS NULL")
+                print(f"   {column}: 更新了 {cursor.rowcount} 条记录")
+
+            # 3. 删除自然键重复的记录，保留 id 最大的一条
+            print("2. 删除自然键重复的记录...")
+            cursor = database.execute_sql(
+                "DELETE g1 FROM goods g1 JOIN goods g2 "
+                "ON g1.goods_id = g2.goods_id AND g1.store_id = g2.store_id "
+                "AND g1.order_id = g2.order_id AND g1.goodorder_time <=> g2.goodorder_time "
+                "AND g1.id < g2.id"
+            )
+            print(f"   ✅ 删除了 {cursor.rowcount} 条重复记录")
+
+            # 4. 添加唯一索引
+            print("3. 添加自然键唯一索引...")
+            database.execute_sql(
+                f"ALTER TABLE goods ADD UNIQUE INDEX {INDEX_NAME} (goods_id, store_id, order_id, goodorder_time)"
+            )
+            print("   ✅ 唯一索引添加成功")
+
+            print("\n✅ 迁移完成！")
+            return True
+
+    except Exception as e:
+        print(f"\n❌ 迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def rollback():
+    """回滚迁移"""
+    print("开始回滚...")
+
+    try:
+        with database:
+            print("删除自然键唯一索引...")
+            database.execute_sql(f"ALTER TABLE goods DROP INDEX {INDEX_NAME}")
+
+            print("✅ 回滚完成！")
+            return True
+
+    except Exception as e:
+        print(f"❌ 回滚失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "rollback":
+        rollback()
+    else:
+        migrate()
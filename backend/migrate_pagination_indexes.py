@@ -0,0 +1,68 @@
+"""
+数据库迁移脚本：为 goods、stores、jushuitan_products、users 表添加 (created_at, id) 索引
+列表的游标分页按 (created_at, id) 排序和定位，依赖这个索引避免全表排序；
+仪表盘按 created_at 统计最近几天的销售额和订单数时也走这个索引
+"""
+from models.database import database
+import sys
+
+# 表名 -> 与 Peewee 根据 Meta.indexes 自动生成的索引名一致
+INDEXES = {
+    'goods': 'goods_created_at_id',
+    'stores': 'store_created_at_id',
+    'jushuitan_products': 'jushuitanproduct_created_at_id',
+    'users': 'user_created_at_id',
+}
+
+
+def migrate():
+    """执行迁移"""
+    print("开始添加游标分页索引...")
+
+    try:
+        with database:
+            for table, index_name in INDEXES.items():
+                cursor = database.execute_sql(f"SHOW INDEX FROM {table} WHERE Key_name = '{index_name}'")
+                if cursor.fetchone():
+                    print(f"   {table}.{index_name} 已存在，跳过")
+                    continue
+
+                print(f"添加 {table}.{index_name} ...")
+                database.execute_sql(f"ALTER TABLE {table} ADD INDEX {index_name} (created_at, id)")
+                print(f"   ✅ {index_name} 添加成功")
+
+            print("\n✅ 迁移完成！")
+            return True
+
+    except Exception as e:
+        print(f"\n❌ 迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def rollback():
+    """回滚迁移"""
+    print("开始回滚...")
+
+    try:
+        with database:
+            for table, index_name in INDEXES.items():
+                print(f"删除 {table}.{index_name} ...")
+                database.execute_sql(f"ALTER TABLE {table} DROP INDEX {index_name}")
+
+            print("✅ 回滚完成！")
+            return True
+
+    except Exception as e:
+        print(f"❌ 回滚失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "rollback":
+        rollback()
+    else:
+        migrate()
@@ -0,0 +1,83 @@
+"""
+数据迁移脚本：用已有的推广数据和账单数据补全商品台账、店铺汇总的广告费、退款和利润列
+- 列表接口不再在读取时关联 pdd_ads / pdd_bill_records，上线前需要执行一次
+- 商品台账按 (店铺, 订单日期) 分批补全，补全后重算这些日期的商品日汇总
+- 店铺汇总按 id 分批补全（包括店铺ID为 shopId_YYYYMMDD 的旧数据）
+- 只更新数值有变化的行，可以重复执行
+"""
+import os
+import sys
+from peewee import fn
+
+# 项目根目录加入路径，和同步接口共用 backend.services.profit_enrichment
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.models.database import database, Goods, Store
+from backend.services.goods_daily import refresh_goods_daily, _as_date
+from backend.services.profit_enrichment import (
+    enrich_goods_days, enrich_store_rows, STORE_ENRICH_COLUMNS, ENRICH_QUERY_BATCH_SIZE
+)
+
+# 每批补全的店铺日期数
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _goods_store_dates():
+    """商品台账中出现过的所有 (店铺, 订单日期)"""
+    keys = (Goods
+            .select(Goods.store_id, fn.DATE(Goods.goodorder_time))
+            .where((Goods.is_del == False) & Goods.goodorder_time.is_null(False))
+            .distinct()
+            .tuples())
+    return sorted({(store_id, _as_date(stat_date)) for store_id, stat_date in keys if store_id and stat_date})
+
+
+def migrate():
+    """执行迁移"""
+    print("开始补全广告费、退款和利润列...")
+
+    try:
+        with database:
+            # 1. 商品台账
+            print("1. 补全商品台账...")
+            keys = _goods_store_dates()
+            changed_count = 0
+            for i in range(0, len(keys), BACKFILL_BATCH_SIZE):
+                with database.atomic():
+                    changed_keys = enrich_goods_days(keys[i:i + BACKFILL_BATCH_SIZE])
+                    refresh_goods_daily(changed_keys)
+                changed_count += len(changed_keys)
+                print(f"   进度 {min(i + BACKFILL_BATCH_SIZE, len(keys))}/{len(keys)} 个店铺日期")
+            print(f"   ✅ {changed_count} 个店铺日期有更新")
+
+            # 2. 店铺汇总
+            print("2. 补全店铺汇总...")
+            last_id = 0
+            updated_count = 0
+            while True:
+                stores = list(Store
+                              .select(Store.id, Store.store_id, Store.order_date, Store.last_order_time,
+                                      Store.total_sales_amount, Store.total_sales_cost,
+                                      *[getattr(Store, column) for column in STORE_ENRICH_COLUMNS])
+                              .where((Store.id > last_id) & (Store.is_del == False))
+                              .order_by(Store.id)
+                              .limit(ENRICH_QUERY_BATCH_SIZE))
+                if not stores:
+                    break
+                with database.atomic():
+                    updated_count += enrich_store_rows(stores)
+                last_id = stores[-1].id
+            print(f"   ✅ 更新 {updated_count} 条店铺汇总")
+
+            print("\n✅ 迁移完成！")
+            return True
+
+    except Exception as e:
+        print(f"\n❌ 迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    migrate()
@@ -35,6 +35,10 @@ class User(BaseModel):
             
     class Meta:
         table_name = 'users'
+        indexes = (
+            # 用户列表按 (created_at, id) 游标分页
+            (('created_at', 'id'), False),
+        )
     
     def __data__(self):
         """自定义序列化方法，将datetime转换为字符串"""
@@ -142,6 +146,10 @@ class JushuitanProduct(BaseModel):
 
     class Meta:
         table_name = 'jushuitan_products'
+        indexes = (
+            # 列表按 (created_at, id) 游标分页；仪表盘按 created_at 统计最近几天的订单数
+            (('created_at', 'id'), False),
+        )
 
 
 
@@ -176,6 +184,14 @@ class Goods(BaseModel):
 
     class Meta:
         table_name = 'goods'
+        indexes = (
+            # 自然键唯一索引，同步时按此键做 INSERT ... ON DUPLICATE KEY UPDATE
+            (('goods_id', 'store_id', 'order_id', 'goodorder_time'), True),
+            # 列表按 (created_at, id) 游标分页
+            (('created_at', 'id'), False),
+            # 按店铺日期重算商品日汇总
+            (('store_id', 'goodorder_time'), False),
+        )
 
 
 # 店铺表：以店铺为主键，聚合所有金额字段
@@ -210,6 +226,7 @@ class Store(BaseModel):
         table_name = 'stores'
         indexes = (
             (('store_id', 'order_date'), True),  # store_id + order_date 唯一索引
+            (('created_at', 'id'), False),  # 列表按 (created_at, id) 游标分页
         )
 
 
@@ -292,3 +309,88 @@ class PddBillRecord(BaseModel):
 
 
 
+
+
+class JushuitanOrderRecord(BaseModel):
+    """
+    聚水潭订单台账 - 每个订单一行，记录参与店铺汇总的金额
+    增量同步时按订单更新这里的数据，再用它重算受影响的 (店铺, 日期) 汇总
+    """
+    id = AutoField(primary_key=True)
+    oid = CharField(max_length=64, unique=True, verbose_name="订单ID")  # 订单ID
+    so_id = CharField(null=True, verbose_name="线上订单号")  # 线上订单号
+    store_id = CharField(max_length=64, null=True, verbose_name="店铺ID")  # 店铺ID
+    store_name = CharField(null=True, verbose_name="店铺名称")  # 店铺名称
+    order_date = DateField(null=True, index=True, verbose_name="订单日期")  # 订单日期
+    order_time = DateTimeField(null=True, verbose_name="订单时间")  # 订单时间
+    sales_amount = FloatField(default=0, verbose_name="销售金额")  # 销售金额（payAmount）
+    sales_cost = FloatField(default=0, verbose_name="销售成本")  # 销售成本（drpAmount，不计成本的状态为 0）
+    goods_count = IntegerField(default=0, verbose_name="商品数量")  # 商品数量
+    goods_valid = BooleanField(default=True, verbose_name="商品列表是否有效")  # 商品列表是合法 JSON 时才计入店铺销售额
+    updated = DateTimeField(null=True, verbose_name="上游更新时间")  # 聚水潭订单的 updated 字段
+    created_at = DateTimeField(default=datetime.now, verbose_name="创建时间")  # 创建时间
+    updated_at = DateTimeField(default=datetime.now, verbose_name="更新时间")  # 更新时间
+
+    class Meta:
+        table_name = 'jushuitan_order_records'
+        indexes = (
+            (('store_id', 'order_date'), False),  # 按店铺和日期重算汇总
+        )
+
+
+class SyncWatermark(BaseModel):
+    """
+    增量同步水位表 - 每个数据源一行，记录已处理到的上游更新时间
+    """
+    id = AutoField(primary_key=True)
+    source = CharField(max_length=64, unique=True, verbose_name="数据源")  # 数据源，如 jushuitan_orders
+    watermark = DateTimeField(null=True, verbose_name="水位")  # 已处理到的最大 updated 时间
+    baseline_date = DateField(null=True, verbose_name="台账起始日期")  # 从这一天起订单台账是完整的
+    created_at = DateTimeField(default=datetime.now, verbose_name="创建时间")  # 创建时间
+    updated_at = DateTimeField(default=datetime.now, verbose_name="更新时间")  # 更新时间
+
+    class Meta:
+        table_name = 'sync_watermarks'
+
+
+class GoodsDaily(BaseModel):
+    """
+    商品日汇总表 - 按 (goods_id, store_id, 日期) 预聚合商品台账、广告费和退款
+    商品同步、推广数据保存、账单保存时只重算受影响的 (店铺, 日期)，查询接口直接按索引范围读取
+    日期口径：商品台账按订单日期，广告费按数据日期，退款按账单日期
+    """
+    id = AutoField(primary_key=True)
+    goods_id = CharField(max_length=64, verbose_name="商品ID")  # 商品ID
+    store_id = CharField(max_length=64, verbose_name="店铺ID")  # 店铺ID
+    stat_date = DateField(verbose_name="日期")  # 日期
+    goods_name = CharField(null=True, verbose_name="商品名称")  # 商品名称
+    store_name = CharField(null=True, verbose_name="店铺名称")  # 店铺名称
+    goods_rows = IntegerField(default=0, verbose_name="商品台账行数")  # 当天的商品台账行数
+    order_count = IntegerField(default=0, verbose_name="订单数")  # 当天不同的订单数
+    order_ids = TextField(null=True, verbose_name="订单号")  # 订单号，按订单时间倒序，', ' 分隔
+    so_ids = TextField(null=True, verbose_name="线上订单号")  # 线上订单号，按订单时间倒序，', ' 分隔
+    payment_amount = FloatField(default=0, verbose_name="付款金额")  # 以下为商品台账对应字段之和
+    sales_amount = FloatField(default=0, verbose_name="销售金额")
+    sales_cost = FloatField(default=0, verbose_name="销售成本")
+    refund_amount = FloatField(default=0, verbose_name="退款金额")
+    advertising_expenses = FloatField(default=0, verbose_name="广告费")
+    gross_profit_1_occurred = FloatField(default=0, verbose_name="毛一利润(发生)")
+    gross_profit_3 = FloatField(default=0, verbose_name="毛三利润")
+    gross_profit_4 = FloatField(default=0, verbose_name="毛四利润")
+    net_profit = FloatField(default=0, verbose_name="净利润")
+    pdd_ad_cost = FloatField(default=0, verbose_name="拼多多广告费")  # pdd_ads 当天的广告费
+    pdd_refund_amount = FloatField(default=0, verbose_name="拼多多退款金额")  # pdd_bill_records 当天账单的退款（取绝对值）
+    max_goods_row_id = IntegerField(null=True, verbose_name="最大商品台账ID")  # 当天商品台账的最大 id
+    first_order_time = DateTimeField(null=True, verbose_name="最早订单时间")  # 当天最早的订单时间
+    latest_order_time = DateTimeField(null=True, verbose_name="最晚订单时间")  # 当天最晚的订单时间
+    goods_created_at = DateTimeField(null=True, verbose_name="台账最早创建时间")  # 当天商品台账最早的创建时间
+    goods_updated_at = DateTimeField(null=True, verbose_name="台账最晚更新时间")  # 当天商品台账最晚的更新时间
+    created_at = DateTimeField(default=datetime.now, verbose_name="创建时间")  # 创建时间
+    updated_at = DateTimeField(default=datetime.now, verbose_name="更新时间")  # 更新时间
+
+    class Meta:
+        table_name = 'goods_daily'
+        indexes = (
+            (('goods_id', 'store_id', 'stat_date'), True),  # 按商品查询
+            (('store_id', 'stat_date'), False),  # 按店铺查询、按店铺日期重算
+        )
@@ -0,0 +1,103 @@
+"""
+仪表盘数据缓存：仪表盘的数据只在同步或抓取后变化，不需要每次打开都重新聚合
+- 缓存未过期（DASHBOARD_CACHE_TTL 秒内）直接返回
+- 过期但仍在 DASHBOARD_CACHE_STALE 秒内：先返回旧数据，同时在后台线程重新计算（同一个键只算一次）
+- 没有缓存或旧数据太久：当前请求计算，同一个键的并发请求等待这一次计算的结果，不重复查询数据库
+- 同步、拼多多数据保存后调用 bump_data_version()（见 response_cache.py），数据版本号变化后
+  已有的缓存都视为过期，下次读取时先返回旧数据并在后台刷新
+- 缓存只在当前进程内有效；在其他进程里运行的抓取脚本无法通知到这里，由 TTL 兜底
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ..models.database import database
+from .response_cache import get_data_version
+
+logger = logging.getLogger(__name__)
+
+# 缓存的有效期（秒）
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", 60))
+# 过期后仍可先返回旧数据的时长（秒），超过后当前请求同步计算
+DASHBOARD_CACHE_STALE = float(os.getenv("DASHBOARD_CACHE_STALE", 600))
+# 后台刷新的线程数（每个线程刷新时占用一个数据库连接，计入 executors.py 的连接预算）
+DASHBOARD_REFRESH_WORKERS = 1
+
+
+class DashboardCache:
+    """线程安全：缓存项在锁内读写，每个键一把计算锁，保证同一时间只有一个线程在计算"""
+
+    def __init__(self, ttl=DASHBOARD_CACHE_TTL, stale=DASHBOARD_CACHE_STALE):
+        self.ttl = ttl
+        self.stale = stale
+        self._entries = {}  # 键 -> (数据, 计算完成时间, 计算时的版本号)
+        self._key_locks = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=DASHBOARD_REFRESH_WORKERS, thread_name_prefix="dashboard-cache")
+
+    def get(self, key, compute):
+        """读取缓存，compute 为无参数的计算函数，返回可以直接作为接口响应的数据"""
+        with self._lock:
+            entry = self._entries.get(key)
+        version = get_data_version()
+        if entry:
+            data, computed_at, entry_version = entry
+            age = time.time() - computed_at
+            if age < self.ttl and entry_version == version:
+                return data
+            if age < self.ttl + self.stale:
+                self._refresh_in_background(key, compute)
+                return data
+        return self._compute(key, compute, version)
+
+    def _compute(self, key, compute, version):
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # 等锁期间其他线程可能已经算好了
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry and entry[2] >= version and time.time() - entry[1] < self.ttl:
+                return entry[0]
+
+            version = get_data_version()
+            data = compute()
+            with self._lock:
+                self._entries[key] = (data, time.time(), version)
+            return data
+
+    def _refresh_in_background(self, key, compute):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        version = get_data_version()
+
+        def _refresh():
+            try:
+                # 后台线程用完即归还自己的数据库连接
+                with database.connection_context():
+                    self._compute(key, compute, version)
+            except Exception:
+                logger.exception(f"后台刷新仪表盘缓存 {key} 失败")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(_refresh)
+
+    def get_stats(self):
+        """各缓存项的数据年龄（秒），供排查使用"""
+        now = time.time()
+        with self._lock:
+            return {
+                "data_version": get_data_version(),
+                "entries": {key: round(now - computed_at, 1) for key, (_, computed_at, _) in self._entries.items()},
+                "refreshing": sorted(self._refreshing),
+            }
+
+
+# 全进程共用的仪表盘缓存
+dashboard_cache = DashboardCache()
@@ -0,0 +1,196 @@
+"""
+接口执行通道：按负载类型把同步（def）接口分到不同的线程池，互不占用
+- interactive：Starlette 默认线程池（登录、用户管理、依赖项 get_current_user 等轻量接口），
+  启动时把线程数限制为 INTERACTIVE_THREADS
+- db：报表、列表等查询量大的接口，DB_LANE_WORKERS 个线程
+- sync：聚水潭同步、拼多多推广等长时间任务（包括 /sync_jobs 提交的后台任务），SYNC_LANE_WORKERS 个线程
+  同步任务再多也只会在 sync 通道里排队，不会占用登录和仪表盘的线程
+- 每个通道的排队数有上限，超出时接口返回 503，不在内存里无限堆积请求
+- 通道里的任务在 connection_context 中执行，结束后连接归还连接池
+- 连接预算：模型使用的连接池最多被 interactive + db + sync × (1 + SYNC_FANOUT_WORKERS) + 仪表盘后台刷新线程
+  同时占用，不能超过它的 max_connections；sync 通道的任务（如按日期范围回补）自己再开线程并发时，
+  每个任务最多 SYNC_FANOUT_WORKERS 个线程，每个线程占用一个连接
+- get_db()（backend/database.py）是另一个连接池，只在登录、用户管理和 get_current_user 依赖项中使用，
+  都在 interactive 线程池里执行，最多占用 INTERACTIVE_THREADS 个连接；通道里执行的代码不使用 get_db()。
+  两个连接池对 MySQL 的总连接数见 TOTAL_CONNECTION_BUDGET。导入时检查，任一连接池超出预算直接报错
+- 按通道统计排队数、执行中任务数、等待时间等，见 get_lane_stats()
+- 提交任务时复制当前的 contextvars（和默认线程池一致），请求级的统计（见 utils/query_stats.py）在通道线程里也能取到
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+import anyio.to_thread
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from ..models.database import database
+from ..database import database as request_database
+from .dashboard_cache import DASHBOARD_REFRESH_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# 默认线程池（interactive）的线程数
+INTERACTIVE_THREADS = int(os.getenv("INTERACTIVE_THREADS", 10))
+# 查询通道的线程数、最多排队的请求数
+DB_LANE_WORKERS = int(os.getenv("DB_LANE_WORKERS", 12))
+DB_LANE_MAX_QUEUE = int(os.getenv("DB_LANE_MAX_QUEUE", 100))
+# 同步通道的线程数、最多排队的任务数
+SYNC_LANE_WORKERS = int(os.getenv("SYNC_LANE_WORKERS", 2))
+SYNC_LANE_MAX_QUEUE = int(os.getenv("SYNC_LANE_MAX_QUEUE", 10))
+# sync 通道的每个任务内部最多再开的数据库线程数（回补同步按天并发）
+SYNC_FANOUT_WORKERS = int(os.getenv("SYNC_FANOUT_WORKERS", 2))
+
+# 最多同时占用的数据库连接数，不能超过连接池大小
+CONNECTION_BUDGET = (INTERACTIVE_THREADS + DB_LANE_WORKERS
+                     + SYNC_LANE_WORKERS * (1 + SYNC_FANOUT_WORKERS) + DASHBOARD_REFRESH_WORKERS)
+if CONNECTION_BUDGET > database._max_connections:
+    raise RuntimeError(
+        f"线程配置最多需要 {CONNECTION_BUDGET} 个数据库连接，超过连接池的 max_connections={database._max_connections}："
+        f"INTERACTIVE_THREADS={INTERACTIVE_THREADS} + DB_LANE_WORKERS={DB_LANE_WORKERS} "
+        f"+ SYNC_LANE_WORKERS={SYNC_LANE_WORKERS} × (1 + SYNC_FANOUT_WORKERS={SYNC_FANOUT_WORKERS}) "
+        f"+ 仪表盘刷新 {DASHBOARD_REFRESH_WORKERS}"
+    )
+
+# get_db() 的连接池：只在 interactive 线程中使用；和模型是同一个实例时连接也是同一个，不另外占用
+REQUEST_CONNECTION_BUDGET = 0 if request_database is database else INTERACTIVE_THREADS
+if REQUEST_CONNECTION_BUDGET > request_database._max_connections:
+    raise RuntimeError(
+        f"INTERACTIVE_THREADS={INTERACTIVE_THREADS} 超过 get_db() 连接池的 "
+        f"max_connections={request_database._max_connections}"
+    )
+# 两个连接池对 MySQL 最多同时占用的连接数
+TOTAL_CONNECTION_BUDGET = CONNECTION_BUDGET + REQUEST_CONNECTION_BUDGET
+logger.info(f"数据库连接预算：模型连接池 {CONNECTION_BUDGET}，get_db() 连接池 {REQUEST_CONNECTION_BUDGET}，"
+            f"共 {TOTAL_CONNECTION_BUDGET}")
+
+# 启动时记录的默认线程池限流器，用于统计 interactive 通道
+_interactive_limiter = None
+
+
+class LaneBusyError(Exception):
+    """通道排队数已满"""
+
+    def __init__(self, lane):
+        self.lane = lane
+        super().__init__(f"{lane.name} 通道繁忙，排队数已达上限 {lane.max_queue}")
+
+
+class ExecutorLane:
+    """固定线程数的执行通道，排队数有上限；统计数据在锁内读写"""
+
+    def __init__(self, name, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-lane")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._peak_queued = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def submit(self, func, *args, **kwargs):
+        """提交任务，返回 concurrent.futures.Future；排队数已满时抛出 LaneBusyError"""
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise LaneBusyError(self)
+            self._queued += 1
+            self._submitted += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._run, time.time(), func, args, kwargs)
+
+    def _run(self, queued_at, func, args, kwargs):
+        wait = time.time() - queued_at
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        failed = True
+        try:
+            # 任务结束后连接归还连接池，线程不长期占用连接
+            with database.connection_context():
+                result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            with self._lock:
+                self._active -= 1
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+
+    async def run(self, func, *args, **kwargs):
+        """在事件循环中等待通道执行完成"""
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def get_stats(self):
+        with self._lock:
+            started = self._completed + self._failed + self._active
+            return {
+                "workers": self.max_workers,
+                "active": self._active,
+                "queued": self._queued,
+                "max_queue": self.max_queue,
+                "peak_queued": self._peak_queued,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._total_wait / started * 1000, 1) if started else 0,
+                "max_wait_ms": round(self._max_wait * 1000, 1),
+            }
+
+
+# 全进程共用的执行通道
+db_lane = ExecutorLane("db", DB_LANE_WORKERS, DB_LANE_MAX_QUEUE)
+sync_lane = ExecutorLane("sync", SYNC_LANE_WORKERS, SYNC_LANE_MAX_QUEUE)
+
+
+def run_in_lane(lane):
+    """
+    接口装饰器：把同步接口放到指定通道执行，通道排队数已满时返回 503
+    放在 @router.get / @router.post 之下（其他装饰器之上），FastAPI 通过 functools.wraps 读取原函数的参数声明；
+    包装后是 async 函数，FastAPI 不再把它放进默认线程池
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await lane.run(func, *args, **kwargs)
+            except LaneBusyError as e:
+                logger.warning(str(e))
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        return wrapper
+    return decorator
+
+
+def configure_interactive_pool():
+    """在应用启动时（事件循环内）调用，限制 Starlette 默认线程池的线程数"""
+    global _interactive_limiter
+    _interactive_limiter = anyio.to_thread.current_default_thread_limiter()
+    _interactive_limiter.total_tokens = INTERACTIVE_THREADS
+
+
+def get_lane_stats():
+    """各通道的线程数、执行中、排队中的任务数等"""
+    stats = {"db": db_lane.get_stats(), "sync": sync_lane.get_stats()}
+    if _interactive_limiter is not None:
+        limiter_stats = _interactive_limiter.statistics()
+        stats["interactive"] = {
+            "workers": int(limiter_stats.total_tokens),
+            "active": limiter_stats.borrowed_tokens,
+            "queued": limiter_stats.tasks_waiting,
+        }
+    return stats
@@ -0,0 +1,173 @@
+"""
+商品日汇总（goods_daily）的维护
+- 以 (店铺, 日期) 为单位重算：删除这些店铺日期的汇总行，再从商品台账、pdd_ads、pdd_bill_records 重新聚合写入
+- 商品同步、推广数据保存、账单保存后只重算受影响的店铺日期，不做全表重建
+- 退款按线上订单号关联到商品：商品台账的线上订单号变化时，对应账单日期的汇总也要重算（so_keys）
+- 订单时间为空的商品台账行不进入汇总（同步写入的行都有订单时间）
+"""
+from datetime import date, datetime, timedelta
+from peewee import fn, Tuple, NodeList, SQL
+from ..models.database import Goods, GoodsDaily, PddTable, PddBillRecord, database
+
+# 每批重算的店铺日期数
+GOODS_DAILY_KEY_BATCH_SIZE = 200
+# 每批写入的汇总行数
+GOODS_DAILY_INSERT_BATCH_SIZE = 500
+# 汇总的商品台账金额字段
+GOODS_DAILY_SUM_FIELDS = (
+    'payment_amount', 'sales_amount', 'sales_cost', 'refund_amount', 'advertising_expenses',
+    'gross_profit_1_occurred', 'gross_profit_3', 'gross_profit_4', 'net_profit',
+)
+
+
+def group_concat_desc(field, order_field):
+    """GROUP_CONCAT(NULLIF(field, '') ORDER BY order_field DESC SEPARATOR ', ')，空值不参与拼接"""
+    return fn.GROUP_CONCAT(NodeList((
+        fn.NULLIF(field, ''),
+        SQL('ORDER BY'), order_field.desc(),
+        SQL("SEPARATOR ', '")
+    )))
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def _goods_day_condition(keys):
+    """商品台账中属于这些 (店铺, 日期) 的行（按订单时间范围，能用上 (store_id, goodorder_time) 索引）"""
+    condition = None
+    for store_id, stat_date in keys:
+        day_start = datetime.combine(stat_date, datetime.min.time())
+        part = ((Goods.store_id == store_id) &
+                (Goods.goodorder_time >= day_start) &
+                (Goods.goodorder_time < day_start + timedelta(days=1)))
+        condition = part if condition is None else (condition | part)
+    return condition
+
+
+def _new_daily_row(goods_id, store_id, stat_date):
+    row = {
+        'goods_id': goods_id, 'store_id': store_id, 'stat_date': stat_date,
+        'goods_name': None, 'store_name': None, 'goods_rows': 0, 'order_count': 0,
+        'order_ids': None, 'so_ids': None, 'pdd_ad_cost': 0.0, 'pdd_refund_amount': 0.0,
+        'max_goods_row_id': None, 'first_order_time': None, 'latest_order_time': None,
+        'goods_created_at': None, 'goods_updated_at': None,
+    }
+    row.update({field: 0.0 for field in GOODS_DAILY_SUM_FIELDS})
+    return row
+
+
+def _compute_goods_daily(keys):
+    """从三张源表聚合一批 (店铺, 日期) 的汇总行，返回 {(goods_id, store_id, 日期): 汇总行}"""
+    rows = {}
+
+    def row_for(goods_id, store_id, stat_date):
+        unique_key = (goods_id, store_id, _as_date(stat_date))
+        if unique_key not in rows:
+            rows[unique_key] = _new_daily_row(*unique_key)
+        return rows[unique_key]
+
+    # 1. 商品台账：按订单日期分组
+    order_day = fn.DATE(Goods.goodorder_time)
+    goods_query = (Goods
+                   .select(Goods.goods_id, Goods.store_id, order_day.alias('stat_date'),
+                           fn.MAX(Goods.goods_name).alias('goods_name'),
+                           fn.MAX(Goods.store_name).alias('store_name'),
+                           fn.COUNT(Goods.id).alias('goods_rows'),
+                           fn.COUNT(fn.NULLIF(Goods.order_id, '').distinct()).alias('order_count'),
+                           group_concat_desc(Goods.order_id, Goods.goodorder_time).alias('order_ids'),
+                           group_concat_desc(Goods.soId, Goods.goodorder_time).alias('so_ids'),
+                           fn.MAX(Goods.id).alias('max_goods_row_id'),
+                           fn.MIN(Goods.goodorder_time).alias('first_order_time'),
+                           fn.MAX(Goods.goodorder_time).alias('latest_order_time'),
+                           fn.MIN(Goods.created_at).alias('goods_created_at'),
+                           fn.MAX(Goods.updated_at).alias('goods_updated_at'),
+                           *[fn.SUM(fn.COALESCE(getattr(Goods, field), 0)).alias(field) for field in GOODS_DAILY_SUM_FIELDS])
+                   .where((Goods.is_del == False) & Goods.goods_id.is_null(False) & _goods_day_condition(keys))
+                   .group_by(Goods.goods_id, Goods.store_id, order_day)
+                   .dicts())
+    for goods_row in goods_query:
+        row = row_for(goods_row.pop('goods_id'), goods_row.pop('store_id'), goods_row.pop('stat_date'))
+        row.update(goods_row)
+
+    # 2. 广告费：按数据日期
+    ad_query = (PddTable
+                .select(PddTable.goods_id, PddTable.store_id, PddTable.data_date,
+                        fn.SUM(PddTable.orderSpendNetCostPerOrder))
+                .where(Tuple(PddTable.store_id, PddTable.data_date).in_(keys) &
+                       PddTable.goods_id.is_null(False) & (PddTable.is_del == False))
+                .group_by(PddTable.goods_id, PddTable.store_id, PddTable.data_date)
+                .tuples())
+    for goods_id, store_id, data_date, total_ad_cost in ad_query:
+        row_for(goods_id, store_id, data_date)['pdd_ad_cost'] = float(total_ad_cost) if total_ad_cost else 0.0
+
+    # 3. 退款：按账单日期，通过店铺下每个商品的线上订单号关联（同一商品的重复订单号只算一次）
+    store_ids = sorted({store_id for store_id, _ in keys})
+    goods_so = (Goods
+                .select(Goods.goods_id, Goods.store_id, Goods.soId)
+                .where(Goods.store_id.in_(store_ids) & (Goods.is_del == False) &
+                       Goods.goods_id.is_null(False) & Goods.soId.is_null(False) & (Goods.soId != ''))
+                .distinct()
+                .alias('goods_so'))
+    refund_query = (PddBillRecord
+                    .select(goods_so.c.goods_id, PddBillRecord.shop_id, PddBillRecord.bill_date,
+                            fn.SUM(fn.ABS(PddBillRecord.amount)))
+                    .join(goods_so, on=((PddBillRecord.order_sn == goods_so.c.soId) &
+                                        (PddBillRecord.shop_id == goods_so.c.store_id)))
+                    .where(Tuple(PddBillRecord.shop_id, PddBillRecord.bill_date).in_(keys) &
+                           (PddBillRecord.is_del == False))
+                    .group_by(goods_so.c.goods_id, PddBillRecord.shop_id, PddBillRecord.bill_date)
+                    .tuples())
+    for goods_id, shop_id, bill_date, total_refund in refund_query:
+        row_for(goods_id, shop_id, bill_date)['pdd_refund_amount'] = float(total_refund) if total_refund else 0.0
+
+    return rows
+
+
+def _bill_keys_for_orders(so_keys):
+    """线上订单号 (店铺, 订单号) 对应的账单日期，返回 {(店铺, 账单日期)}"""
+    bill_keys = set()
+    so_keys = sorted(so_keys)
+    for i in range(0, len(so_keys), GOODS_DAILY_INSERT_BATCH_SIZE):
+        bill_keys.update(PddBillRecord
+                         .select(PddBillRecord.shop_id, PddBillRecord.bill_date)
+                         .where(Tuple(PddBillRecord.shop_id, PddBillRecord.order_sn).in_(so_keys[i:i + GOODS_DAILY_INSERT_BATCH_SIZE]) &
+                                (PddBillRecord.is_del == False))
+                         .distinct()
+                         .tuples())
+    return bill_keys
+
+
+def refresh_goods_daily(store_date_keys, so_keys=()):
+    """
+    重算指定 (店铺, 日期) 的商品日汇总，返回写入的汇总行数
+    so_keys: 本次新增、修改或删除的商品台账行的 (店铺, 线上订单号)，用于找出退款需要重新关联的账单日期
+    """
+    keys = {(store_id, _as_date(stat_date)) for store_id, stat_date in store_date_keys if store_id and stat_date}
+    so_keys = {(store_id, so_id) for store_id, so_id in so_keys if store_id and so_id}
+    if so_keys:
+        keys.update((shop_id, _as_date(bill_date)) for shop_id, bill_date in _bill_keys_for_orders(so_keys))
+    if not keys:
+        return 0
+
+    keys = sorted(keys)
+    written_count = 0
+    with database.atomic():
+        for i in range(0, len(keys), GOODS_DAILY_KEY_BATCH_SIZE):
+            batch_keys = keys[i:i + GOODS_DAILY_KEY_BATCH_SIZE]
+            rows = list(_compute_goods_daily(batch_keys).values())
+            GoodsDaily.delete().where(Tuple(GoodsDaily.store_id, GoodsDaily.stat_date).in_(batch_keys)).execute()
+            now = datetime.now()
+            for row in rows:
+                row['created_at'] = now
+                row['updated_at'] = now
+            for j in range(0, len(rows), GOODS_DAILY_INSERT_BATCH_SIZE):
+                GoodsDaily.insert_many(rows[j:j + GOODS_DAILY_INSERT_BATCH_SIZE]).execute()
+            written_count += len(rows)
+
+    print(f"重算商品日汇总 {len(keys)} 个店铺日期，写入 {written_count} 条")
+    return written_count
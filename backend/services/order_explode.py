@@ -0,0 +1,178 @@
+"""
+订单展开：把一批聚水潭订单展开成列式数组，供商品台账和店铺汇总两个聚合共用
+- 商品列表 disInnerOrderGoodsViewList 用 orjson 解析（未安装时回退到标准库 json）
+- 每个订单的时间只解析一次，相同的时间字符串直接复用缓存结果
+- 订单维度和商品维度各一组等长的列表，商品行通过 order_index 指回所在订单
+- 分页并发拉取时上游数据有变化，同一个订单可能出现在两页里，drop_repeated_orders 按订单ID去重
+"""
+import json
+from datetime import datetime
+from functools import lru_cache
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    JSON_DECODE_ERRORS = (orjson.JSONDecodeError, json.JSONDecodeError)
+except ImportError:
+    orjson = None
+    _json_loads = json.loads
+    JSON_DECODE_ERRORS = (json.JSONDecodeError,)
+
+# 订单时间缓存大小：一天内的不同时间字符串（按秒）最多 86400 个
+ORDER_TIME_CACHE_SIZE = 131072
+
+
+@lru_cache(maxsize=ORDER_TIME_CACHE_SIZE)
+def parse_order_time(order_time_str):
+    """
+    解析订单时间字符串，无法解析时返回 None（结果按字符串缓存）
+    返回不带时区、精确到秒的本地时间，和数据库中的 DATETIME 一致：
+    带时区的时间先换算成本地时间；毫秒舍去，否则和数据库中读出的自然键对不上
+    """
+    if not order_time_str:
+        return None
+    try:
+        if 'T' in order_time_str:
+            parsed = datetime.fromisoformat(order_time_str.replace('Z', '+00:00'))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone().replace(tzinfo=None)
+            return parsed.replace(microsecond=0)
+        return datetime.strptime(order_time_str, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        try:
+            return datetime.strptime(order_time_str, '%Y-%m-%d')
+        except ValueError:
+            return None
+
+
+def parse_goods_list(goods_list_raw):
+    """解析订单的商品列表，不是合法 JSON 时返回 None"""
+    if isinstance(goods_list_raw, (str, bytes)):
+        try:
+            goods_list = _json_loads(goods_list_raw)
+        except JSON_DECODE_ERRORS:
+            return None
+    else:
+        goods_list = goods_list_raw
+
+    if not isinstance(goods_list, list):
+        goods_list = [] if goods_list is None else [goods_list]
+    return goods_list
+
+
+def new_order_columns():
+    return {
+        # 订单维度：每个订单一行
+        'orders': {
+            'order_id': [], 'so_id': [], 'store_id': [], 'store_name': [], 'status': [],
+            'ts': [], 'updated': [], 'amount': [], 'goods_count': [], 'goods_valid': [],
+        },
+        # 商品维度：每个订单中的每个商品（有 shopIid 的）一行
+        'goods': {
+            'goods_id': [], 'item_name': [], 'order_index': [],
+            'store_id': [], 'order_id': [], 'so_id': [], 'ts': [], 'amount': [],
+        },
+        # 金额无法解析、或在 modified_since 之前就没再修改过而被跳过的订单数
+        'skipped': 0,
+    }
+
+
+def explode_orders(orders, amount_field, modified_since=None):
+    """
+    把一批原始订单展开成列式数组
+    - amount_field: 金额字段（销售金额用 payAmount，销售成本用 drpAmount）
+    - modified_since: 增量同步时传入，updated 早于它的订单跳过
+    - ts 为 None 表示订单时间无法解析，由调用方决定兜底时间
+    """
+    columns = new_order_columns()
+    order_cols = columns['orders']
+    goods_cols = columns['goods']
+
+    # 局部变量绑定，减少热循环中的属性查找
+    o_order_id, o_so_id, o_store_id, o_store_name = (
+        order_cols['order_id'], order_cols['so_id'], order_cols['store_id'], order_cols['store_name'])
+    o_ts, o_updated, o_amount, o_goods_count, o_goods_valid = (
+        order_cols['ts'], order_cols['updated'], order_cols['amount'], order_cols['goods_count'], order_cols['goods_valid'])
+    g_goods_id, g_item_name, g_order_index = goods_cols['goods_id'], goods_cols['item_name'], goods_cols['order_index']
+    g_store_id, g_order_id, g_so_id, g_ts, g_amount = (
+        goods_cols['store_id'], goods_cols['order_id'], goods_cols['so_id'], goods_cols['ts'], goods_cols['amount'])
+
+    for order in orders:
+        try:
+            amount = float(order.get(amount_field, 0) or 0)
+        except (TypeError, ValueError) as e:
+            print(f"解析订单金额时出错: {e}")
+            columns['skipped'] += 1
+            continue
+
+        updated = parse_order_time(order.get('updated'))
+        if modified_since and updated and updated < modified_since:
+            columns['skipped'] += 1
+            continue
+
+        order_index = len(o_order_id)
+        order_id = order.get('oid') or ''
+        so_id = order.get('soId') or ''
+        store_id = order.get('shopId')
+        ts = parse_order_time(order.get('orderTime'))
+        goods_list = parse_goods_list(order.get('disInnerOrderGoodsViewList'))
+
+        o_order_id.append(order_id)
+        o_so_id.append(so_id)
+        o_store_id.append(store_id)
+        o_store_name.append(order.get('shopName'))
+        order_cols['status'].append(order.get('orderStatus'))
+        o_ts.append(ts)
+        o_updated.append(updated)
+        o_amount.append(amount)
+        o_goods_valid.append(goods_list is not None)
+
+        if goods_list is None:
+            o_goods_count.append(0)
+            continue
+        o_goods_count.append(len(goods_list))
+
+        for goods_item in goods_list:
+            if not isinstance(goods_item, dict):
+                continue
+            goods_id = goods_item.get('shopIid')
+            if not goods_id:
+                continue
+            g_goods_id.append(goods_id)
+            g_item_name.append(goods_item.get('itemName', '未知商品'))
+            g_order_index.append(order_index)
+            g_store_id.append(store_id)
+            g_order_id.append(order_id)
+            g_so_id.append(so_id)
+            g_ts.append(ts)
+            g_amount.append(amount)
+
+    return columns
+
+
+def drop_repeated_orders(columns, seen_oids):
+    """
+    去掉已经累加过的订单（按订单ID），seen_oids 为这个订单流已出现的订单ID，会加入这一批的订单ID
+    没有重复订单时原样返回；否则返回去重后的列式数组，商品行的 order_index 指向新的下标
+    """
+    order_cols = columns['orders']
+    kept = []
+    for index, order_id in enumerate(order_cols['order_id']):
+        if order_id:
+            if order_id in seen_oids:
+                continue
+            seen_oids.add(order_id)
+        kept.append(index)
+    if len(kept) == len(order_cols['order_id']):
+        return columns
+
+    new_index = {old_index: index for index, old_index in enumerate(kept)}
+    goods_cols = columns['goods']
+    goods_kept = [i for i, order_index in enumerate(goods_cols['order_index']) if order_index in new_index]
+    deduped = {
+        'orders': {name: [values[i] for i in kept] for name, values in order_cols.items()},
+        'goods': {name: [values[i] for i in goods_kept] for name, values in goods_cols.items()},
+        'skipped': columns['skipped'],
+    }
+    deduped['goods']['order_index'] = [new_index[order_index] for order_index in deduped['goods']['order_index']]
+    return deduped
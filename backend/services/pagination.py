@@ -0,0 +1,124 @@
+"""
+列表分页的公共逻辑
+- 游标分页（keyset）：按 (created_at, id) 排序，下一页用 "created_at/id 小于（或大于）上一页最后一行" 的条件定位，
+  不再 OFFSET 扫过前面的所有行，深分页的耗时和第一页一样
+- 游标对调用方是不透明的字符串（base64 编码的 JSON），只能原样传回
+- 总数可选：exact 每次 COUNT(*)；cached 缓存一段时间；approx 读表统计信息（只适用于不带筛选条件的查询）；none 不统计
+"""
+import os
+import time
+import json
+import base64
+import threading
+from datetime import datetime
+
+# 总数统计方式
+COUNT_MODES = ("exact", "cached", "approx", "none")
+# cached / approx 模式下总数的缓存时间（秒）
+COUNT_CACHE_TTL = float(os.getenv("LIST_COUNT_CACHE_TTL", 60))
+# 缓存的查询条数上限，超出后清空（不同的搜索词会产生不同的缓存项）
+COUNT_CACHE_MAX_ENTRIES = 1024
+
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+
+class InvalidCursorError(ValueError):
+    """游标无法解析（被篡改或来自其他接口）"""
+
+
+def encode_cursor(created_at, row_id):
+    """把一行的 (created_at, id) 编码为不透明的游标字符串"""
+    payload = {"t": created_at.isoformat(), "id": row_id}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (created_at, id)；格式不对时抛出 InvalidCursorError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["t"]), int(payload["id"])
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidCursorError(f"无效的分页游标: {cursor}") from e
+
+
+def keyset_order(model, descending=True):
+    """游标分页的排序：(created_at, id)，id 保证同一时间的多行顺序稳定"""
+    if descending:
+        return (model.created_at.desc(), model.id.desc())
+    return (model.created_at.asc(), model.id.asc())
+
+
+def keyset_condition(model, cursor, descending=True):
+    """游标之后的行：降序时取 (created_at, id) 小于游标的行，升序时取大于游标的行（created_at 不为空）"""
+    created_at, row_id = decode_cursor(cursor)
+    if descending:
+        return (model.created_at < created_at) | ((model.created_at == created_at) & (model.id < row_id))
+    return (model.created_at > created_at) | ((model.created_at == created_at) & (model.id > row_id))
+
+
+def paginate(query, model, skip=0, limit=10, cursor=None, descending=True):
+    """
+    按 (created_at, id) 排序分页，返回 (当前页的行, next_cursor)
+    传了 cursor 时使用游标定位并忽略 skip；否则沿用 offset(skip)
+    query 可以是模型查询，也可以是 .dicts() 查询
+    多取一行判断是否还有下一页，没有下一页时 next_cursor 为 None
+    """
+    query = query.order_by(*keyset_order(model, descending))
+    if cursor:
+        query = query.where(keyset_condition(model, cursor, descending))
+    else:
+        query = query.offset(skip)
+
+    rows = list(query.limit(limit + 1))
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, encode_cursor(last['created_at'], last['id'])
+    return rows, encode_cursor(last.created_at, last.id)
+
+
+def _approximate_table_rows(model):
+    """从 information_schema 读取表的估算行数（InnoDB 统计信息，不扫描表）"""
+    cursor = model._meta.database.execute_sql(
+        "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (model._meta.table_name,)
+    )
+    row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+def count_rows(query, model, mode="exact", filtered=False):
+    """
+    按指定方式统计总数
+    - exact: 每次执行 COUNT(*)
+    - cached: 相同查询的 COUNT(*) 结果缓存 COUNT_CACHE_TTL 秒
+    - approx: 读表统计信息的估算行数；查询带筛选条件（filtered=True）时估算值没有意义，退回 cached
+    - none: 不统计，返回 None
+    """
+    if mode == "none":
+        return None
+    if mode == "exact":
+        return query.count()
+
+    use_table_stats = mode == "approx" and not filtered
+    sql, params = query.sql()
+    cache_key = ("approx", model._meta.table_name) if use_table_stats else (sql, tuple(params))
+    now = time.time()
+    with _count_cache_lock:
+        cached = _count_cache.get(cache_key)
+        if cached and now - cached[1] < COUNT_CACHE_TTL:
+            return cached[0]
+
+    total = _approximate_table_rows(model) if use_table_stats else None
+    if total is None:
+        total = query.count()
+
+    with _count_cache_lock:
+        if len(_count_cache) >= COUNT_CACHE_MAX_ENTRIES:
+            _count_cache.clear()
+        _count_cache[cache_key] = (total, now)
+    return total
@@ -0,0 +1,296 @@
+"""
+利润补全：把拼多多的广告费和退款写入商品台账（goods）和店铺汇总（stores），并重算利润列
+- 同步写入的行广告费为 0、利润列是占位值；推广数据或账单保存后，只重算受影响的 (店铺, 日期)
+- 商品台账：某商品当天的广告费按当天各行的销售额占比分摊（销售额都为 0 时平均分摊），
+  退款按线上订单号（soId）关联账单，取绝对值
+- 店铺汇总：广告费为店铺当天所有推广的花费，退款为店铺当天账单的退款（取绝对值）
+- 只更新数值有变化的行，用 CASE 语句分批批量更新
+- 商品台账的金额变化后，对应日期的商品日汇总一并重算
+"""
+from datetime import datetime
+from peewee import fn, Tuple
+from ..models.database import Goods, Store, PddTable, PddBillRecord
+from .goods_daily import refresh_goods_daily, _as_date, _goods_day_condition, GOODS_DAILY_KEY_BATCH_SIZE
+
+# 每条查询最多带的键数，避免 IN 列表过长
+ENRICH_QUERY_BATCH_SIZE = 500
+# 每条批量 UPDATE 更新的行数
+ENRICH_UPDATE_BATCH_SIZE = 200
+# 利润指标 -> stores 表的列
+STORE_PROFIT_COLUMNS = (
+    ('gross_profit_1_occurred', 'total_gross_profit_1_occurred'),
+    ('gross_profit_1_rate', 'avg_gross_profit_1_rate'),
+    ('advertising_expenses', 'total_advertising_expenses'),
+    ('advertising_ratio', 'avg_advertising_ratio'),
+    ('gross_profit_3', 'total_gross_profit_3'),
+    ('gross_profit_3_rate', 'avg_gross_profit_3_rate'),
+    ('gross_profit_4', 'total_gross_profit_4'),
+    ('gross_profit_4_rate', 'avg_gross_profit_4_rate'),
+    ('net_profit', 'total_net_profit'),
+    ('net_profit_rate', 'avg_net_profit_rate'),
+)
+# 利润指标（和 goods 表的列同名）
+PROFIT_METRICS = tuple(metric for metric, _ in STORE_PROFIT_COLUMNS)
+# 利润补全写入的列
+GOODS_ENRICH_COLUMNS = ('refund_amount',) + PROFIT_METRICS
+STORE_ENRICH_COLUMNS = ('total_refund_amount',) + tuple(column for _, column in STORE_PROFIT_COLUMNS)
+
+
+def compute_profit_metrics(sales_amount, sales_cost, advertising_expenses):
+    """根据销售额、销售成本和广告费计算利润指标（保留两位小数），商品和店铺共用"""
+    gross_profit_1_occurred = sales_amount - sales_cost
+    gross_profit_3 = sales_amount - sales_cost - advertising_expenses
+    gross_profit_4 = gross_profit_3  # 可以根据需要添加其他费用
+    net_profit = gross_profit_3  # 净利润
+
+    def _rate(value):
+        return round(value / sales_amount * 100, 2) if sales_amount > 0 else 0.0
+
+    return {
+        'gross_profit_1_occurred': round(gross_profit_1_occurred, 2),
+        'gross_profit_1_rate': _rate(gross_profit_1_occurred),
+        'advertising_expenses': round(advertising_expenses, 2),
+        'advertising_ratio': _rate(advertising_expenses),
+        'gross_profit_3': round(gross_profit_3, 2),
+        'gross_profit_3_rate': _rate(gross_profit_3),
+        'gross_profit_4': round(gross_profit_4, 2),
+        'gross_profit_4_rate': _rate(gross_profit_4),
+        'net_profit': round(net_profit, 2),
+        'net_profit_rate': _rate(net_profit),
+    }
+
+
+def _batches(items, size):
+    items = sorted(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _apply_values(instance, values):
+    """把新值写到模型实例上，返回是否有变化（按两位小数比较）"""
+    changed = False
+    for column, value in values.items():
+        current = getattr(instance, column)
+        if current is None or round(current, 2) != round(value, 2):
+            setattr(instance, column, value)
+            changed = True
+    return changed
+
+
+def _bulk_update(model, instances, columns):
+    now = datetime.now()
+    for instance in instances:
+        instance.updated_at = now
+    fields = [getattr(model, column) for column in columns] + [model.updated_at]
+    for i in range(0, len(instances), ENRICH_UPDATE_BATCH_SIZE):
+        model.bulk_update(instances[i:i + ENRICH_UPDATE_BATCH_SIZE], fields=fields)
+
+
+def bill_order_keys(store_date_keys):
+    """这些 (店铺, 账单日期) 的账单涉及的 (店铺, 订单号)；账单保存时在删除旧账单前后各取一次"""
+    order_keys = set()
+    for batch_keys in _batches({(store_id, _as_date(bill_date)) for store_id, bill_date in store_date_keys}, ENRICH_QUERY_BATCH_SIZE):
+        order_keys.update(PddBillRecord
+                          .select(PddBillRecord.shop_id, PddBillRecord.order_sn)
+                          .where(Tuple(PddBillRecord.shop_id, PddBillRecord.bill_date).in_(batch_keys) &
+                                 (PddBillRecord.is_del == False))
+                          .tuples())
+    return order_keys
+
+
+def _goods_days_for_orders(so_keys):
+    """线上订单号 (店铺, 订单号) 对应的商品台账行所在的 (店铺, 订单日期)"""
+    day_keys = set()
+    for batch_keys in _batches(so_keys, ENRICH_QUERY_BATCH_SIZE):
+        rows = (Goods
+                .select(Goods.store_id, Goods.goodorder_time)
+                .where(Tuple(Goods.store_id, Goods.soId).in_(batch_keys) &
+                       (Goods.is_del == False) & Goods.goodorder_time.is_null(False))
+                .tuples())
+        day_keys.update((store_id, order_time.date()) for store_id, order_time in rows)
+    return day_keys
+
+
+def _sum_goods_ad_costs(day_keys):
+    """按 (goods_id, store_id, 数据日期) 汇总广告费"""
+    ad_costs = {}
+    for batch_keys in _batches(day_keys, ENRICH_QUERY_BATCH_SIZE):
+        rows = (PddTable
+                .select(PddTable.goods_id, PddTable.store_id, PddTable.data_date,
+                        fn.SUM(PddTable.orderSpendNetCostPerOrder))
+                .where(Tuple(PddTable.store_id, PddTable.data_date).in_(batch_keys) &
+                       PddTable.goods_id.is_null(False) & (PddTable.is_del == False))
+                .group_by(PddTable.goods_id, PddTable.store_id, PddTable.data_date)
+                .tuples())
+        for goods_id, store_id, data_date, total_ad_cost in rows:
+            ad_costs[(goods_id, store_id, _as_date(data_date))] = float(total_ad_cost) if total_ad_cost else 0.0
+    return ad_costs
+
+
+def _sum_order_refunds(so_keys):
+    """按 (店铺, 订单号) 汇总账单退款（取绝对值）"""
+    refunds = {}
+    for batch_keys in _batches(so_keys, ENRICH_QUERY_BATCH_SIZE):
+        rows = (PddBillRecord
+                .select(PddBillRecord.shop_id, PddBillRecord.order_sn, fn.SUM(fn.ABS(PddBillRecord.amount)))
+                .where(Tuple(PddBillRecord.shop_id, PddBillRecord.order_sn).in_(batch_keys) &
+                       (PddBillRecord.is_del == False))
+                .group_by(PddBillRecord.shop_id, PddBillRecord.order_sn)
+                .tuples())
+        for shop_id, order_sn, total_refund in rows:
+            refunds[(shop_id, order_sn)] = float(total_refund) if total_refund else 0.0
+    return refunds
+
+
+def enrich_goods_days(store_date_keys, so_keys=()):
+    """
+    重算 (店铺, 订单日期) 内所有商品台账行的广告费、退款和利润列；
+    订单的退款按销售额分摊到订单的各个商品行，商品行的退款合计等于订单的退款；
+    so_keys 为退款有变化的 (店铺, 线上订单号)，它们所在的订单日期一并重算
+    返回有行被更新的 (店铺, 订单日期)
+    """
+    day_keys = {(store_id, _as_date(stat_date)) for store_id, stat_date in store_date_keys if store_id and stat_date}
+    so_keys = {(store_id, so_id) for store_id, so_id in so_keys if store_id and so_id}
+    if so_keys:
+        day_keys |= _goods_days_for_orders(so_keys)
+
+    changed_keys = set()
+    updated_count = 0
+    for batch_keys in _batches(day_keys, GOODS_DAILY_KEY_BATCH_SIZE):
+        goods_rows = list(Goods
+                          .select(Goods.id, Goods.goods_id, Goods.store_id, Goods.soId, Goods.goodorder_time,
+                                  Goods.sales_amount, Goods.sales_cost,
+                                  *[getattr(Goods, column) for column in GOODS_ENRICH_COLUMNS])
+                          .where((Goods.is_del == False) & _goods_day_condition(batch_keys)))
+        ad_costs = _sum_goods_ad_costs(batch_keys)
+        refunds = _sum_order_refunds({(row.store_id, row.soId) for row in goods_rows if row.soId})
+
+        # 同一商品同一天的行，用于按销售额分摊当天的广告费
+        goods_days = {}
+        for row in goods_rows:
+            goods_key = (row.goods_id, row.store_id, row.goodorder_time.date())
+            goods_days.setdefault(goods_key, []).append(row)
+
+        # 同一订单的行（下单时间相同，在同一批日期内），用于按销售额分摊订单的退款
+        order_sales = {}
+        order_row_counts = {}
+        for row in goods_rows:
+            if row.soId:
+                order_key = (row.store_id, row.soId)
+                order_sales[order_key] = order_sales.get(order_key, 0.0) + (row.sales_amount or 0.0)
+                order_row_counts[order_key] = order_row_counts.get(order_key, 0) + 1
+
+        changed_rows = []
+        for goods_key, rows in goods_days.items():
+            day_ad_cost = ad_costs.get(goods_key, 0.0)
+            day_sales = sum(row.sales_amount or 0.0 for row in rows)
+            for row in rows:
+                sales_amount = row.sales_amount or 0.0
+                share = sales_amount / day_sales if day_sales > 0 else 1 / len(rows)
+                values = compute_profit_metrics(sales_amount, row.sales_cost or 0.0, day_ad_cost * share)
+                order_key = (row.store_id, row.soId)
+                order_refund = refunds.get(order_key, 0.0)
+                if order_refund:
+                    total_sales = order_sales[order_key]
+                    refund_share = (sales_amount / total_sales if total_sales > 0
+                                    else 1 / order_row_counts[order_key])
+                    order_refund *= refund_share
+                values['refund_amount'] = round(order_refund, 2)
+                if _apply_values(row, values):
+                    changed_rows.append(row)
+                    changed_keys.add((row.store_id, goods_key[2]))
+
+        _bulk_update(Goods, changed_rows, GOODS_ENRICH_COLUMNS)
+        updated_count += len(changed_rows)
+
+    if day_keys:
+        print(f"补全商品台账利润 {len(day_keys)} 个店铺日期，更新 {updated_count} 行")
+    return changed_keys
+
+
+def _sum_store_ad_costs(day_keys):
+    """按 (店铺, 数据日期) 汇总广告费（包括没有商品ID的推广）"""
+    ad_costs = {}
+    for batch_keys in _batches(day_keys, ENRICH_QUERY_BATCH_SIZE):
+        rows = (PddTable
+                .select(PddTable.store_id, PddTable.data_date, fn.SUM(PddTable.orderSpendNetCostPerOrder))
+                .where(Tuple(PddTable.store_id, PddTable.data_date).in_(batch_keys) & (PddTable.is_del == False))
+                .group_by(PddTable.store_id, PddTable.data_date)
+                .tuples())
+        for store_id, data_date, total_ad_cost in rows:
+            ad_costs[(store_id, _as_date(data_date))] = float(total_ad_cost) if total_ad_cost else 0.0
+    return ad_costs
+
+
+def _sum_store_refunds(day_keys):
+    """按 (店铺, 账单日期) 汇总账单退款（取绝对值）"""
+    refunds = {}
+    for batch_keys in _batches(day_keys, ENRICH_QUERY_BATCH_SIZE):
+        rows = (PddBillRecord
+                .select(PddBillRecord.shop_id, PddBillRecord.bill_date, fn.SUM(fn.ABS(PddBillRecord.amount)))
+                .where(Tuple(PddBillRecord.shop_id, PddBillRecord.bill_date).in_(batch_keys) &
+                       (PddBillRecord.is_del == False))
+                .group_by(PddBillRecord.shop_id, PddBillRecord.bill_date)
+                .tuples())
+        for shop_id, bill_date, total_refund in rows:
+            refunds[(shop_id, _as_date(bill_date))] = float(total_refund) if total_refund else 0.0
+    return refunds
+
+
+def _store_day_key(store):
+    """店铺汇总行对应的 (店铺, 日期)：旧数据的店铺ID为 shopId_YYYYMMDD，取真实的店铺ID"""
+    real_store_id = store.store_id.split('_')[0] if '_' in store.store_id else store.store_id
+    stat_date = store.order_date or (store.last_order_time.date() if store.last_order_time else None)
+    return (real_store_id, stat_date) if stat_date else None
+
+
+def enrich_store_rows(stores):
+    """重算一批店铺汇总行的广告费、退款和利润列，只更新有变化的行，返回更新的行数"""
+    stores = [store for store in stores if _store_day_key(store)]
+    day_keys = {_store_day_key(store) for store in stores}
+    ad_costs = _sum_store_ad_costs(day_keys)
+    refunds = _sum_store_refunds(day_keys)
+
+    changed_rows = []
+    for store in stores:
+        day_key = _store_day_key(store)
+        metrics = compute_profit_metrics(store.total_sales_amount or 0.0, store.total_sales_cost or 0.0,
+                                         ad_costs.get(day_key, 0.0))
+        values = {column: metrics[metric] for metric, column in STORE_PROFIT_COLUMNS}
+        values['total_refund_amount'] = round(refunds.get(day_key, 0.0), 2)
+        if _apply_values(store, values):
+            changed_rows.append(store)
+
+    _bulk_update(Store, changed_rows, STORE_ENRICH_COLUMNS)
+    return len(changed_rows)
+
+
+def enrich_store_days(store_date_keys):
+    """重算 (店铺, 订单日期) 的店铺汇总行，返回更新的行数"""
+    day_keys = {(store_id, _as_date(stat_date)) for store_id, stat_date in store_date_keys if store_id and stat_date}
+    updated_count = 0
+    for batch_keys in _batches(day_keys, ENRICH_QUERY_BATCH_SIZE):
+        stores = list(Store
+                      .select(Store.id, Store.store_id, Store.order_date, Store.last_order_time,
+                              Store.total_sales_amount, Store.total_sales_cost,
+                              *[getattr(Store, column) for column in STORE_ENRICH_COLUMNS])
+                      .where(Tuple(Store.store_id, Store.order_date).in_(batch_keys) & (Store.is_del == False)))
+        updated_count += enrich_store_rows(stores)
+
+    if day_keys:
+        print(f"补全店铺汇总利润 {len(day_keys)} 个店铺日期，更新 {updated_count} 行")
+    return updated_count
+
+
+def enrich_pdd_changes(store_date_keys, so_keys=()):
+    """
+    推广数据或账单保存后的补全：在保存数据的同一个事务里调用
+    - store_date_keys: 本次写入的 (店铺, 推广数据日期 / 账单日期)
+    - so_keys: 本次删除的旧账单涉及的 (店铺, 订单号)（新账单的订单号在这里重新读取）
+    依次重算商品台账、店铺汇总和商品日汇总
+    """
+    so_keys = set(so_keys) | bill_order_keys(store_date_keys)
+    goods_keys = enrich_goods_days(store_date_keys, so_keys)
+    store_rows = enrich_store_days(store_date_keys)
+    daily_rows = refresh_goods_daily(set(store_date_keys) | goods_keys)
+    return {'goods_days': len(goods_keys), 'store_rows': store_rows, 'daily_rows': daily_rows}
@@ -0,0 +1,152 @@
+"""
+报表接口的进程内响应缓存
+- 数据版本号：同步、拼多多数据保存、用户关联商品修改后调用 bump_data_version() 加一，
+  缓存项记录计算时的版本号，版本号变化后旧缓存项全部失效（不需要逐个删除）
+- 缓存键为 (接口, 参数, 权限范围)：管理员共用一份，普通用户按用户ID和关联的商品区分
+- 按最近最少使用（LRU）淘汰，最多 RESPONSE_CACHE_MAX_ENTRIES 项
+- 在其他进程里运行的抓取脚本无法通知到这里，缓存项最多保留 RESPONSE_CACHE_TTL 秒
+- 按接口统计命中、未命中和淘汰次数，供调整缓存大小时参考
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from functools import wraps
+from collections import OrderedDict
+from starlette.responses import Response
+
+# 最多缓存的响应数
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 256))
+# 缓存项的最长保留时间（秒）
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 300))
+
+_data_version = 0
+_data_version_lock = threading.Lock()
+
+
+def bump_data_version():
+    """数据已变化（在事务提交之后调用），返回新的版本号"""
+    global _data_version
+    with _data_version_lock:
+        _data_version += 1
+        return _data_version
+
+
+def get_data_version():
+    return _data_version
+
+
+def permission_scope(user):
+    """
+    响应可以共用的范围：管理员看到的数据相同，共用一份；
+    普通用户按用户ID和关联的商品区分（关联的商品修改后自动换成新的缓存键）
+    """
+    if user is None:
+        return "public"
+    if user.role == 'admin':
+        return "admin"
+    goods_stores = json.dumps(user.get_goods_stores(), sort_keys=True, ensure_ascii=False)
+    return f"user:{user.id}:{hashlib.md5(goods_stores.encode()).hexdigest()}"
+
+
+class ResponseCache:
+    """线程安全：缓存项和统计数据都在锁内读写；同一个键并发未命中时各自计算，以后写入的为准"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # 键 -> (响应, 版本号, 写入时间)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _stat(self, endpoint):
+        return self._stats.setdefault(endpoint, {"hits": 0, "misses": 0, "evictions": 0})
+
+    def get(self, key):
+        """返回缓存的响应，没有或已失效时返回 None"""
+        version = get_data_version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] == version and time.time() - entry[2] < self.ttl:
+                self._entries.move_to_end(key)
+                self._stat(key[0])["hits"] += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+            self._stat(key[0])["misses"] += 1
+            return None
+
+    def set(self, key, response, version):
+        """写入响应；version 为开始计算前读取的版本号，计算期间数据有变化时这一项不会被命中"""
+        with self._lock:
+            self._entries[key] = (response, version, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted_key, _ = self._entries.popitem(last=False)
+                self._stat(evicted_key[0])["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """按接口返回命中、未命中、淘汰次数和命中率，以及当前缓存项数和数据版本号"""
+        with self._lock:
+            endpoints = {}
+            for endpoint, stat in self._stats.items():
+                lookups = stat["hits"] + stat["misses"]
+                endpoints[endpoint] = {
+                    **stat,
+                    "entries": sum(1 for key in self._entries if key[0] == endpoint),
+                    "hit_rate": round(stat["hits"] / lookups, 3) if lookups else 0,
+                }
+            return {
+                "data_version": get_data_version(),
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "endpoints": endpoints,
+            }
+
+
+# 全进程共用的响应缓存
+response_cache = ResponseCache()
+
+
+def _response_copy(response):
+    """缓存的是响应对象时返回副本，其他返回值原样返回"""
+    if not isinstance(response, Response):
+        return response
+    return Response(content=response.body, status_code=response.status_code,
+                    headers=dict(response.headers), media_type=response.media_type)
+
+
+def cached_response(endpoint, bypass_params=()):
+    """
+    接口装饰器：按 (接口, 参数, 权限范围) 缓存返回值
+    - 参数取除 current_user 以外的所有关键字参数；current_user 用于计算权限范围
+    - bypass_params 中的参数为真时（如 debug）不读写缓存
+    - 抛出异常的请求不缓存
+    - 接口直接返回响应对象（如 FastJSONResponse）时缓存的是序列化好的响应，命中时不再序列化；
+      中间件会直接修改响应头（ETag、Content-Encoding），每个请求返回一份副本
+    放在 @router.get 之下，FastAPI 通过 functools.wraps 读取原函数的参数声明
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if any(kwargs.get(param) for param in bypass_params):
+                return func(*args, **kwargs)
+
+            params = tuple(sorted((name, value) for name, value in kwargs.items() if name != 'current_user'))
+            key = (endpoint, params, permission_scope(kwargs.get('current_user')))
+            cached = response_cache.get(key)
+            if cached is not None:
+                return _response_copy(cached)
+
+            version = get_data_version()
+            response = func(*args, **kwargs)
+            response_cache.set(key, response, version)
+            return _response_copy(response)
+        return wrapper
+    return decorator
@@ -0,0 +1,185 @@
+"""
+同步任务队列：在进程内的 sync 通道（见 executors.py）里执行聚水潭同步，接口只负责提交任务和查询进度
+不依赖外部消息队列，服务重启后未完成的任务会丢失
+"""
+import time
+import uuid
+import logging
+import threading
+import traceback
+from datetime import datetime
+from .executors import sync_lane, LaneBusyError
+
+logger = logging.getLogger(__name__)
+
+# 最多保留的任务记录数，超出后清理最早结束的任务
+SYNC_JOB_HISTORY = 200
+
+
+class DuplicateSyncJobError(Exception):
+    """同一个日期已有未结束的同步任务"""
+
+    def __init__(self, job):
+        self.job = job
+        super().__init__(f"日期 {job.key} 已有同步任务正在执行: {job.id}")
+
+
+class SyncJob:
+    """一个同步任务的状态和进度，所有修改都在锁内进行"""
+
+    def __init__(self, key, description=""):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.description = description
+        self.status = "queued"  # queued / running / success / failed
+        self.phase = "queued"
+        self.rows_processed = 0
+        self.errors = []
+        self.result = None
+        self.streams = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self._started = None
+        self._finished = None
+        self._lock = threading.Lock()
+
+    # ---- 供同步流程调用的进度接口 ----
+    def set_phase(self, phase):
+        with self._lock:
+            self.phase = phase
+        logger.info(f"同步任务 {self.id} 进入阶段: {phase}")
+
+    def add_rows(self, count):
+        with self._lock:
+            self.rows_processed += count
+
+    def attach_streams(self, streams):
+        """关联订单流的实时统计（拉取阶段的订单数从这里读取）"""
+        with self._lock:
+            self.streams = streams
+
+    def add_error(self, message):
+        with self._lock:
+            self.errors.append(message)
+
+    # ---- 任务生命周期 ----
+    def _start(self):
+        with self._lock:
+            self.status = "running"
+            self.started_at = datetime.now()
+            self._started = time.time()
+
+    def _finish(self, status, result=None):
+        with self._lock:
+            self.status = status
+            self.phase = "done" if status == "success" else "failed"
+            self.result = result
+            self.finished_at = datetime.now()
+            self._finished = time.time()
+
+    @property
+    def is_active(self):
+        return self.status in ("queued", "running")
+
+    def to_dict(self):
+        with self._lock:
+            fetched_orders = sum(stream.get('orders', 0) for stream in self.streams.values()) if self.streams else 0
+            rows_processed = self.rows_processed + fetched_orders
+            if self._started:
+                elapsed = (self._finished or time.time()) - self._started
+            else:
+                elapsed = 0
+            return {
+                "job_id": self.id,
+                "key": self.key,
+                "description": self.description,
+                "status": self.status,
+                "phase": self.phase,
+                "rows_processed": rows_processed,
+                "fetched_orders": fetched_orders,
+                "written_rows": self.rows_processed,
+                "rows_per_second": round(rows_processed / elapsed, 2) if elapsed > 0 else 0,
+                "elapsed": round(elapsed, 3),
+                "errors": list(self.errors),
+                "streams": {name: dict(stream) for name, stream in self.streams.items()} if self.streams else None,
+                "result": self.result,
+                "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                "started_at": self.started_at.strftime("%Y-%m-%d %H:%M:%S") if self.started_at else "",
+                "finished_at": self.finished_at.strftime("%Y-%m-%d %H:%M:%S") if self.finished_at else ""
+            }
+
+
+class SyncJobManager:
+    """进程内同步任务管理：提交、去重、查询"""
+
+    def __init__(self, lane=sync_lane):
+        self._lane = lane
+        self._jobs = {}
+        self._active_by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, func, description=""):
+        """
+        提交同步任务，func(job) 在后台线程中执行，返回值记录为任务结果
+        同一个 key 已有未结束的任务时抛出 DuplicateSyncJobError，sync 通道排队已满时抛出 LaneBusyError
+        """
+        with self._lock:
+            existing = self._active_by_key.get(key)
+            if existing and existing.is_active:
+                raise DuplicateSyncJobError(existing)
+
+            job = SyncJob(key, description=description)
+            self._jobs[job.id] = job
+            self._active_by_key[key] = job
+            self._prune()
+
+        try:
+            self._lane.submit(self._run, job, func)
+        except LaneBusyError:
+            with self._lock:
+                del self._jobs[job.id]
+                if self._active_by_key.get(key) is job:
+                    del self._active_by_key[key]
+            raise
+        return job
+
+    def _run(self, job, func):
+        job._start()
+        try:
+            result = func(job)
+            job._finish("success", result)
+        except Exception as e:
+            detail = getattr(e, 'detail', None) or str(e)
+            job.add_error(str(detail))
+            job._finish("failed")
+            logger.error(f"同步任务 {job.id} 失败: {detail}")
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                if self._active_by_key.get(job.key) is job:
+                    del self._active_by_key[job.key]
+
+    def _prune(self):
+        """超出保留数量时，删除最早结束的任务记录（调用方持有锁）"""
+        if len(self._jobs) <= SYNC_JOB_HISTORY:
+            return
+        finished = sorted(
+            (job for job in self._jobs.values() if not job.is_active),
+            key=lambda job: job.created_at
+        )
+        for job in finished[:len(self._jobs) - SYNC_JOB_HISTORY]:
+            del self._jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, limit=20):
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+        return jobs[:limit]
+
+
+# 全局唯一的任务管理器
+sync_job_manager = SyncJobManager()
@@ -1,7 +1,11 @@
+import os
+import math
 import requests
 import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, date
-from spiders.jushuitan_api_auth import authorization
+from spiders.scm121_client import scm121_client
 
 
 # 销售金额 = 待推单审核+异常+待发货+已发货+被拆分+已取消
@@ -10,125 +14,202 @@ from spiders.jushuitan_api_auth import authorization
 
 
 
-# 获取销售金额订单数据（包含所有状态）
-def get_jushuitan_orders_for_sales_amount(sync_date=None):
-    """
-    获取用于计算销售金额的订单数据
-    orderStatus: ["WaitConfirm", "WaitOuterSent", "Sent", "Split", "Cancelled", "Question", "Delivering"]
-    """
-    url = "https://innerapi.scm121.com/api/inner/order/list"
-
-    headers = {
-        "authorization": authorization,
-        "content-type": "application/json;charset=UTF-8",
-        "origin": "https://innerorder.scm121.com",
-        "referer": "https://innerorder.scm121.com/distribute",
-        "user-agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 Chrome/144.0.0.0 Safari/537.36",
-        "appcode": "sc.scm121.com",
-        "app-version": "TOWER_20260207204353",
-        "source": "SUPPLIER"
-    }
+# 订单列表分页大小：单页过大容易超时或被上游截断，默认每页 500 条
+ORDER_LIST_PAGE_SIZE = int(os.getenv("JST_ORDER_PAGE_SIZE", 500))
+# 分页上限，防止上游总数异常时无限翻页
+ORDER_LIST_MAX_PAGES = int(os.getenv("JST_ORDER_MAX_PAGES", 1000))
+# 单个订单集合同时在途的分页请求数
+ORDER_LIST_PAGE_WORKERS = int(os.getenv("JST_ORDER_PAGE_WORKERS", 4))
+
+# 销售金额订单状态（包含所有状态）
+SALES_AMOUNT_ORDER_STATUS = ["WaitConfirm", "WaitOuterSent", "Sent", "Split", "Cancelled", "Question", "Delivering"]
+# 销售成本订单状态（不包含已取消和被拆分）
+SALES_COST_ORDER_STATUS = ["WaitConfirm", "WaitOuterSent", "Sent", "Question", "Delivering"]
+# 不计入销售金额的订单状态（可通过环境变量调整，逗号分隔）：增量同步时一并拉取，
+# 订单改成这些状态后从订单台账和商品台账中删除
+SALES_EXCLUDED_ORDER_STATUS = [
+    status.strip() for status in os.getenv("JST_SALES_EXCLUDED_ORDER_STATUS", "Refunded,Closed").split(",") if status.strip()
+]
+# 按订单修改时间查询时使用的 dateQueryType（增量同步用，可通过环境变量调整）
+ORDER_MODIFIED_QUERY_TYPE = os.getenv("JST_ORDER_MODIFIED_QUERY_TYPE", "ModifiedDate")
 
-    # 如果没有提供sync_date，则默认使用前一天的日期
+
+def _format_sync_date(sync_date):
+    """同步日期统一转换为 YYYY-MM-DD 字符串，未提供时默认前一天"""
     if sync_date is None:
         yesterday = datetime.now() - timedelta(days=1)
-        sync_date = yesterday.strftime("%Y-%m-%d")
-    elif isinstance(sync_date, date):
-        sync_date = sync_date.strftime("%Y-%m-%d")
+        return yesterday.strftime("%Y-%m-%d")
+    if isinstance(sync_date, date):
+        return sync_date.strftime("%Y-%m-%d")
+    return sync_date
 
-    # 设置当天的开始和结束时间
-    start_time = f"{sync_date} 00:00:00"
-    end_time = f"{sync_date} 23:59:59"
 
-    payload = {
-        "startTime": start_time,
-        "endTime": end_time,
-        "dateQueryType": "OrderDate",
+def _get_upstream_total(data):
+    """从接口响应中读取订单总数，没有时返回 None"""
+    for key in ("total", "totalCount", "count"):
+        value = data.get(key)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def _fetch_order_page(payload, page_num, page_size):
+    """请求订单列表的某一页，返回接口原始响应（超时和 5xx 由共享客户端重试）"""
+    page_payload = dict(payload, pageNum=page_num, pageSize=page_size)
+    return scm121_client.post("/api/inner/order/list", page_payload, referer="/distribute")
+
+
+def iter_jushuitan_order_pages(payload, page_size=None, label="订单", max_workers=None, stats=None):
+    """
+    按 pageNum 逐页拉取聚水潭订单列表，每拉到一页就 yield 该页的订单列表
+    - 以上游返回的总数判断结束；没有总数时，遇到空页或不满一页即结束
+    - 第一页拿到总数后，其余页用线程池并发拉取，同时在途的页数不超过 max_workers，
+      结果仍按页码顺序 yield
+    - 请求失败直接抛出异常，避免把不完整的数据当成完整数据
+    - stats: 可选的 dict，实时记录已拉取的页数和订单数，便于失败时报告部分结果
+    """
+    page_size = page_size or ORDER_LIST_PAGE_SIZE
+    max_workers = max_workers or ORDER_LIST_PAGE_WORKERS
+    if stats is None:
+        stats = {}
+    stats.setdefault('pages', 0)
+    stats.setdefault('orders', 0)
+
+    def _page_orders(page_num, data):
+        orders = data.get('data') or []
+        stats['pages'] += 1
+        stats['orders'] += len(orders)
+        total = _get_upstream_total(data)
+        print(f'获取{label}第{page_num}页，本页{len(orders)}条，累计{stats["orders"]}/{total if total is not None else "?"}条')
+        return orders, total
+
+    first_page, total = _page_orders(1, _fetch_order_page(payload, 1, page_size))
+    if first_page:
+        yield first_page
+    if not first_page or len(first_page) < page_size:
+        return
+    if total is not None and stats['orders'] >= total:
+        return
+
+    # 上游没有返回总数，无法预知页数，只能顺序翻页
+    if total is None or max_workers <= 1:
+        for page_num in range(2, ORDER_LIST_MAX_PAGES + 1):
+            orders, total = _page_orders(page_num, _fetch_order_page(payload, page_num, page_size))
+            if orders:
+                yield orders
+            if not orders or len(orders) < page_size:
+                return
+            if total is not None and stats['orders'] >= total:
+                return
+        print(f'⚠️ {label}已达到分页上限 {ORDER_LIST_MAX_PAGES} 页，剩余数据未拉取')
+        return
+
+    page_count = math.ceil(total / page_size)
+    if page_count > ORDER_LIST_MAX_PAGES:
+        print(f'⚠️ {label}共 {page_count} 页，超过分页上限 {ORDER_LIST_MAX_PAGES} 页，剩余数据未拉取')
+        page_count = ORDER_LIST_MAX_PAGES
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # 滑动窗口：最多 max_workers 页同时在途，按页码顺序取结果
+        pending = deque()
+        next_page = 2
+        while next_page <= page_count and len(pending) < max_workers:
+            pending.append((next_page, pool.submit(_fetch_order_page, payload, next_page, page_size)))
+            next_page += 1
+
+        while pending:
+            page_num, future = pending.popleft()
+            data = future.result()
+            if next_page <= page_count:
+                pending.append((next_page, pool.submit(_fetch_order_page, payload, next_page, page_size)))
+                next_page += 1
+
+            orders, _ = _page_orders(page_num, data)
+            if orders:
+                yield orders
+
+
+def iter_jushuitan_orders(payload, page_size=None, label="订单", max_workers=None, stats=None):
+    """逐条 yield 订单，内部按页拉取，调用方可以边拉边处理"""
+    for orders in iter_jushuitan_order_pages(payload, page_size=page_size, label=label,
+                                             max_workers=max_workers, stats=stats):
+        yield from orders
+
+
+def _build_order_list_payload(sync_date, order_status, start_time=None, end_time=None, date_query_type="OrderDate"):
+    """默认按订单日期查询一整天；传入 start_time/end_time 时按指定时间段查询"""
+    if start_time and end_time:
+        start_text = start_time.strftime("%Y-%m-%d %H:%M:%S")
+        end_text = end_time.strftime("%Y-%m-%d %H:%M:%S")
+    else:
+        sync_date = _format_sync_date(sync_date)
+        start_text = f"{sync_date} 00:00:00"
+        end_text = f"{sync_date} 23:59:59"
+    return {
+        "startTime": start_text,
+        "endTime": end_text,
+        "dateQueryType": date_query_type,
         "orderTypeEnum": "ALL",
-        "orderStatus": ["WaitConfirm", "WaitOuterSent", "Sent", "Split", "Cancelled", "Question", "Delivering"],
+        "orderStatus": order_status,
         "noteType": "NOFILTER",
         "orderByKey": 4,
         "ascOrDesc": True,
         "coId": "14482113",
         "uid": "20116651",
-        "pageNum": 1,
-        "pageSize": 9999,
         "searchType": 1
     }
 
-    try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=15)
-        resp.raise_for_status()
-
-        data = resp.json()
-        order_count = len(data.get('data', []))
-        print(f'成功获取销售金额订单数据，共{order_count}条记录')
-
-        return data
 
-    except requests.exceptions.RequestException as e:
-        print(f'请求聚水潭API失败: {e}')
-        return None
-    except Exception as e:
-        print(f'处理聚水潭数据时发生错误: {e}')
-        return None
+# 逐页获取销售金额订单（包含所有状态）
+def iter_jushuitan_orders_for_sales_amount(sync_date=None, page_size=None, max_workers=None, stats=None):
+    """
+    逐条 yield 用于计算销售金额的订单
+    orderStatus: ["WaitConfirm", "WaitOuterSent", "Sent", "Split", "Cancelled", "Question", "Delivering"]
+    """
+    payload = _build_order_list_payload(sync_date, SALES_AMOUNT_ORDER_STATUS)
+    return iter_jushuitan_orders(payload, page_size=page_size, label="销售金额订单",
+                                 max_workers=max_workers, stats=stats)
 
 
-# 获取销售成本订单数据（不包含已取消和被拆分）
-def get_jushuitan_orders_for_sales_cost(sync_date=None):
+# 逐页获取销售成本订单（不包含已取消和被拆分）
+def iter_jushuitan_orders_for_sales_cost(sync_date=None, page_size=None, max_workers=None, stats=None):
     """
-    获取用于计算销售成本的订单数据
+    逐条 yield 用于计算销售成本的订单
     orderStatus: ["WaitConfirm", "WaitOuterSent", "Sent", "Question", "Delivering"]
     """
-    url = "https://innerapi.scm121.com/api/inner/order/list"
-
-    headers = {
-        "authorization": authorization,
-        "content-type": "application/json;charset=UTF-8",
-        "origin": "https://innerorder.scm121.com",
-        "referer": "https://innerorder.scm121.com/distribute",
-        "user-agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 Chrome/144.0.0.0 Safari/537.36",
-        "appcode": "sc.scm121.com",
-        "app-version": "TOWER_20260207204353",
-        "source": "SUPPLIER"
-    }
+    payload = _build_order_list_payload(sync_date, SALES_COST_ORDER_STATUS)
+    return iter_jushuitan_orders(payload, page_size=page_size, label="销售成本订单",
+                                 max_workers=max_workers, stats=stats)
 
-    # 如果没有提供sync_date，则默认使用前一天的日期
-    if sync_date is None:
-        yesterday = datetime.now() - timedelta(days=1)
-        sync_date = yesterday.strftime("%Y-%m-%d")
-    elif isinstance(sync_date, date):
-        sync_date = sync_date.strftime("%Y-%m-%d")
 
-    # 设置当天的开始和结束时间
-    start_time = f"{sync_date} 00:00:00"
-    end_time = f"{sync_date} 23:59:59"
+# 逐页获取时间段内有修改的销售金额订单（增量同步）
+def iter_jushuitan_modified_orders_for_sales_amount(start_time, end_time, page_size=None, max_workers=None, stats=None):
+    """
+    逐条 yield 修改时间在 [start_time, end_time] 内、用于计算销售金额的订单
+    同时拉取 SALES_EXCLUDED_ORDER_STATUS 状态的订单，由调用方按 orderStatus 找出已不计入销售金额的订单
+    """
+    payload = _build_order_list_payload(None, SALES_AMOUNT_ORDER_STATUS + SALES_EXCLUDED_ORDER_STATUS,
+                                        start_time=start_time, end_time=end_time,
+                                        date_query_type=ORDER_MODIFIED_QUERY_TYPE)
+    return iter_jushuitan_orders(payload, page_size=page_size, label="增量销售金额订单",
+                                 max_workers=max_workers, stats=stats)
 
-    payload = {
-        "startTime": start_time,
-        "endTime": end_time,
-        "dateQueryType": "OrderDate",
-        "orderTypeEnum": "ALL",
-        "orderStatus": ["WaitConfirm", "WaitOuterSent", "Sent", "Question", "Delivering"],
-        "noteType": "NOFILTER",
-        "orderByKey": 4,
-        "ascOrDesc": True,
-        "coId": "14482113",
-        "uid": "20116651",
-        "pageNum": 1,
-        "pageSize": 9999,
-        "searchType": 1
-    }
 
-    try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=15)
-        resp.raise_for_status()
+# 逐页获取时间段内有修改的销售成本订单（增量同步）
+def iter_jushuitan_modified_orders_for_sales_cost(start_time, end_time, page_size=None, max_workers=None, stats=None):
+    """逐条 yield 修改时间在 [start_time, end_time] 内、用于计算销售成本的订单"""
+    payload = _build_order_list_payload(None, SALES_COST_ORDER_STATUS, start_time=start_time, end_time=end_time,
+                                        date_query_type=ORDER_MODIFIED_QUERY_TYPE)
+    return iter_jushuitan_orders(payload, page_size=page_size, label="增量销售成本订单",
+                                 max_workers=max_workers, stats=stats)
 
-        data = resp.json()
-        order_count = len(data.get('data', []))
-        print(f'成功获取销售成本订单数据，共{order_count}条记录')
 
-        return data
+def _collect_orders(order_iter, label):
+    """把分页结果收集成旧接口的 {'data': [...]} 格式，失败时返回 None"""
+    try:
+        orders = list(order_iter)
+        print(f'成功获取{label}数据，共{len(orders)}条记录')
+        return {'data': orders}
 
     except requests.exceptions.RequestException as e:
         print(f'请求聚水潭API失败: {e}')
@@ -138,69 +219,37 @@ def get_jushuitan_orders_for_sales_cost(sync_date=None):
         return None
 
 
-# 获取所有聚水潭订单数据（保留旧方法以兼容）
-def get_all_jushuitan_orders(sync_date=None):
+# 获取销售金额订单数据（包含所有状态）
+def get_jushuitan_orders_for_sales_amount(sync_date=None, page_size=None):
     """
-    获取聚水潭订单数据，支持查询指定时间段内的所有订单
-    如果未提供日期范围，则默认查询最近7天的订单
+    获取用于计算销售金额的订单数据（一次性收集所有分页）
+    orderStatus: ["WaitConfirm", "WaitOuterSent", "Sent", "Split", "Cancelled", "Question", "Delivering"]
     """
-    url = "https://innerapi.scm121.com/api/inner/order/list"
-
-    headers = {
-        "authorization": authorization,
-        "content-type": "application/json;charset=UTF-8",
-        "origin": "https://innerorder.scm121.com",
-        "referer": "https://innerorder.scm121.com/distribute",
-        "user-agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 Chrome/141.0.0.0 Safari/537.36",
-        "appcode": "sc.scm121.com",
-        "app-version": "TOWER_20260116204226",
-        "source": "SUPPLIER"
-    }
+    return _collect_orders(iter_jushuitan_orders_for_sales_amount(sync_date, page_size=page_size), "销售金额订单")
 
-    # 如果没有提供sync_date，则默认使用前一天的日期
-    if sync_date is None:
-        yesterday = datetime.now() - timedelta(days=1)
-        sync_date = yesterday.strftime("%Y-%m-%d")
-    elif isinstance(sync_date, date):
-        # 如果传入的是date对象，转换为字符串
-        sync_date = sync_date.strftime("%Y-%m-%d")
 
-    # 设置当天的开始和结束时间
-    start_time = f"{sync_date} 00:00:00"
-    end_time = f"{sync_date} 23:59:59"
+# 获取销售成本订单数据（不包含已取消和被拆分）
+def get_jushuitan_orders_for_sales_cost(sync_date=None, page_size=None):
+    """
+    获取用于计算销售成本的订单数据（一次性收集所有分页）
+    orderStatus: ["WaitConfirm", "WaitOuterSent", "Sent", "Question", "Delivering"]
+    """
+    return _collect_orders(iter_jushuitan_orders_for_sales_cost(sync_date, page_size=page_size), "销售成本订单")
 
-    payload = {
-        "startTime": start_time,
-        "endTime": end_time,
-        "dateQueryType": "OrderDate",
-        "orderTypeEnum": "ALL",
-        "orderStatus": ["WaitConfirm", "WaitOuterSent", "Sent", "Question", "Delivering"],
-        "noteType": "NOFILTER",
+
+# 获取所有聚水潭订单数据（保留旧方法以兼容）
+def get_all_jushuitan_orders(sync_date=None, page_size=None):
+    """
+    获取聚水潭订单数据，查询指定日期（默认前一天）的所有订单
+    """
+    payload = _build_order_list_payload(sync_date, SALES_COST_ORDER_STATUS)
+    payload.update({
         "orderByKey": 0,
         "ascOrDesc": False,
-        "coId": "14482113",
-        "uid": "22227282",
-        "pageNum": 1,
-        "pageSize": 9999,
-        "searchType": 1
-    }
-
-    try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=15)
-        resp.raise_for_status()
-
-        data = resp.json()
-        order_count = len(data.get('data', []))
-        print(f'成功获取聚水潭订单数据，共{order_count}条记录')
-
-        return data
+        "uid": "22227282"
+    })
 
-    except requests.exceptions.RequestException as e:
-        print(f'请求聚水潭API失败: {e}')
-        return None
-    except Exception as e:
-        print(f'处理聚水潭数据时发生错误: {e}')
-        return None
+    return _collect_orders(iter_jushuitan_orders(payload, page_size=page_size), "聚水潭订单")
 
 
 
@@ -222,28 +271,6 @@ def acquire_all_simple_orders(oid_list):
     返回:
         订单详细数据
     """
-    url = "https://innerapi.scm121.com/api/inner/order/acquireAllSimpleOrders"
-    
-    headers = {
-        "accept": "application/json",
-        "accept-language": "zh-CN,zh;q=0.9",
-        "app-version": "TOWER_20260205204706",
-        "appcode": "sc.scm121.com",
-        "authorization": authorization,
-        "content-type": "application/json;charset=UTF-8",
-        "gwfp": "180fcdc0c0f8aa459761e4b59acf09a5",
-        "origin": "https://innerorder.scm121.com",
-        "referer": "https://innerorder.scm121.com/afterSales",
-        "sec-ch-ua": '"Not(A:Brand";v="8", "Chromium";v="144", "Google Chrome";v="144"',
-        "sec-ch-ua-mobile": "?0",
-        "sec-ch-ua-platform": '"macOS"',
-        "sec-fetch-dest": "empty",
-        "sec-fetch-mode": "cors",
-        "sec-fetch-site": "same-site",
-        "source": "SUPPLIER",
-        "user-agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36"
-    }
-    
     payload = {
         "oidList": oid_list,
         "pageSize": 1,
@@ -251,10 +278,7 @@ def acquire_all_simple_orders(oid_list):
     }
     
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=15)
-        resp.raise_for_status()
-        
-        data = resp.json()
+        data = scm121_client.post("/api/inner/order/acquireAllSimpleOrders", payload, referer="/afterSales")
         order_count = len(data.get('data', []))
         print(f'成功获取售后订单详细数据，共{order_count}条记录')
         
@@ -20,6 +20,8 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from backend.models.database import PddTable, PddBillRecord, database
+from backend.services.profit_enrichment import enrich_pdd_changes, bill_order_keys
+from backend.services.response_cache import bump_data_version
 
 
 
@@ -480,6 +482,10 @@ def save_promotion_to_db(items, store_id=None, data_date=None):
                 print(f"❌ 保存数据失败: {e}")
                 print(f"   数据: {item.get('adId')}")
                 continue
+
+        # 3. 补全该店铺该日期的商品台账、店铺汇总的广告费和利润，并重算商品日汇总
+        enrich_pdd_changes({(store_id, data_date)})
+    bump_data_version()
     
     # 显示统计信息
     print(f"\n{'='*60}")
@@ -943,6 +949,9 @@ def get_bill_outcome_amount(driver, shop_id, begin_time, end_time):
                 
                 # 保存到数据库 - 先删除旧数据，再插入新数据
                 with database.atomic():
+                    # 旧账单涉及的订单，删除后这些订单的退款也要重算
+                    old_order_keys = bill_order_keys({(shop_id, actual_bill_date)})
+
                     # 1. 删除该店铺该日期的所有旧记录
                     deleted_count = PddBillRecord.delete().where(
                         (PddBillRecord.shop_id == shop_id) &
@@ -967,6 +976,10 @@ def get_bill_outcome_amount(driver, shop_id, begin_time, end_time):
                             error_count += 1
                             print(f"❌ 保存失败: {order_sn} - {e}")
                             continue
+
+                    # 3. 补全商品台账、店铺汇总的退款金额，并重算商品日汇总
+                    enrich_pdd_changes({(shop_id, actual_bill_date)}, old_order_keys)
+                bump_data_version()
                 
                 # 显示统计信息
                 print(f"\n{'='*60}")
@@ -1028,6 +1041,9 @@ def get_bill_outcome_amount(driver, shop_id, begin_time, end_time):
                                 # 先删除旧数据，再插入新数据
                                 print(f'删除 时间为：{actual_bill_date} 的旧数据')
                                 with database.atomic():
+                                    # 旧账单涉及的订单，删除后这些订单的退款也要重算
+                                    old_order_keys = bill_order_keys({(shop_id, actual_bill_date)})
+
                                     # 删除该店铺该日期的所有旧记录
                                     deleted_count = PddBillRecord.delete().where(
                                         (PddBillRecord.shop_id == shop_id) &
@@ -1048,7 +1064,11 @@ def get_bill_outcome_amount(driver, shop_id, begin_time, end_time):
                                             saved_count += 1
                                         except:
                                             continue
+
+                                    # 补全商品台账、店铺汇总的退款金额，并重算商品日汇总
+                                    enrich_pdd_changes({(shop_id, actual_bill_date)}, old_order_keys)
                                     print(f"✅ 保存了 {saved_count} 条数据")
+                                bump_data_version()
                             break
                             
                     except Exception as e:
@@ -0,0 +1,114 @@
+"""
+scm121（聚水潭供销）接口的共享客户端
+- 全进程共用一个 requests.Session：复用 TCP/TLS 连接，开启 gzip
+- 超时、连接错误和 5xx 响应按指数退避 + 随机抖动重试
+- 按接口统计调用次数、失败次数、重试次数和耗时
+- 请求头和登录凭证只在这里配置一次
+"""
+import os
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from spiders.jushuitan_api_auth import authorization
+
+
+SCM121_API_BASE = "https://innerapi.scm121.com"
+SCM121_ORIGIN = "https://innerorder.scm121.com"
+SCM121_APP_VERSION = os.getenv("JST_APP_VERSION", "TOWER_20260207204353")
+SCM121_USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36"
+
+# 单次请求超时（秒）
+HTTP_TIMEOUT = float(os.getenv("JST_HTTP_TIMEOUT", 15))
+# 失败后的最大重试次数（不含第一次请求）
+HTTP_MAX_RETRIES = int(os.getenv("JST_HTTP_MAX_RETRIES", 3))
+# 指数退避的基准和上限（秒）：第 n 次重试等待 random(0, min(上限, 基准 * 2^n))
+HTTP_BACKOFF_BASE = float(os.getenv("JST_HTTP_BACKOFF_BASE", 0.5))
+HTTP_BACKOFF_MAX = float(os.getenv("JST_HTTP_BACKOFF_MAX", 8))
+# 连接池大小：需要覆盖 回补并发天数 × 订单流数 × 分页并发数
+HTTP_POOL_SIZE = int(os.getenv("JST_HTTP_POOL_SIZE", 32))
+
+
+class Scm121Client:
+    """线程安全：Session 的连接池按 HTTP_POOL_SIZE 配置，统计数据在锁内更新"""
+
+    def __init__(self, authorization_token=None, pool_size=HTTP_POOL_SIZE):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "accept": "application/json",
+            "accept-encoding": "gzip, deflate",
+            "authorization": os.getenv("JST_AUTHORIZATION") or authorization_token or authorization,
+            "content-type": "application/json;charset=UTF-8",
+            "origin": SCM121_ORIGIN,
+            "user-agent": SCM121_USER_AGENT,
+            "appcode": "sc.scm121.com",
+            "app-version": SCM121_APP_VERSION,
+            "source": "SUPPLIER"
+        })
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def post(self, path, payload, referer=None, timeout=None):
+        """
+        POST 一个 scm121 接口，返回解析后的 JSON
+        超时、连接错误和 5xx 会重试，重试用完后抛出最后一次的异常；4xx 直接抛出
+        """
+        url = f"{SCM121_API_BASE}{path}"
+        headers = {"referer": f"{SCM121_ORIGIN}{referer}"} if referer else None
+
+        for attempt in range(HTTP_MAX_RETRIES + 1):
+            started = time.time()
+            try:
+                resp = self.session.post(url, headers=headers, json=payload, timeout=timeout or HTTP_TIMEOUT)
+                if resp.status_code >= 500:
+                    resp.raise_for_status()
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError, requests.exceptions.HTTPError) as e:
+                self._record(path, time.time() - started, failed=True)
+                if attempt >= HTTP_MAX_RETRIES:
+                    raise
+                delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+                print(f"请求 {path} 失败（第 {attempt + 1} 次）：{e}，{delay:.2f} 秒后重试")
+                self._record_retry(path)
+                time.sleep(delay)
+                continue
+
+            self._record(path, time.time() - started, failed=not resp.ok)
+            resp.raise_for_status()
+            return resp.json()
+
+    def _record(self, path, elapsed, failed=False):
+        with self._lock:
+            stat = self._stats.setdefault(path, {
+                "calls": 0, "failures": 0, "retries": 0, "total_latency": 0.0, "max_latency": 0.0
+            })
+            stat["calls"] += 1
+            stat["total_latency"] += elapsed
+            stat["max_latency"] = max(stat["max_latency"], elapsed)
+            if failed:
+                stat["failures"] += 1
+
+    def _record_retry(self, path):
+        with self._lock:
+            self._stats[path]["retries"] += 1
+
+    def get_stats(self):
+        """按接口返回调用次数、失败次数、重试次数、平均和最大耗时（秒）"""
+        with self._lock:
+            return {
+                path: {
+                    "calls": stat["calls"],
+                    "failures": stat["failures"],
+                    "retries": stat["retries"],
+                    "avg_latency": round(stat["total_latency"] / stat["calls"], 3) if stat["calls"] else 0,
+                    "max_latency": round(stat["max_latency"], 3),
+                    "total_latency": round(stat["total_latency"], 3)
+                }
+                for path, stat in self._stats.items()
+            }
+
+
+# 全进程共用的客户端
+scm121_client = Scm121Client()
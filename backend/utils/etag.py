@@ -0,0 +1,93 @@
+"""
+报表接口的条件请求（ETag / If-None-Match）
+- ETag 由数据版本号（见 services/response_cache.py）、请求路径、查询参数和 Authorization 头计算，
+  在调用接口之前就能算出；客户端带着相同的 If-None-Match 再次请求时直接返回 304，
+  不查询数据库、不序列化响应
+- 数据版本号只在当前进程内递增：ETag 中加入进程启动时生成的随机值，多个进程之间不会误判；
+  其他进程（抓取脚本）写入的数据通知不到这里，ETag 至少每 ETAG_MAX_AGE 秒换一次
+- 需要登录的接口在返回 304 前校验令牌的签名和有效期（不查询数据库），令牌无效时交给接口返回 401
+- 响应带 Cache-Control: no-cache，浏览器每次都会带上 If-None-Match 重新验证
+- 同一份数据可能以 brotli / gzip / 不压缩三种编码返回（见 compression.py），使用弱 ETag，比较时忽略 W/ 前缀
+"""
+import os
+import time
+import uuid
+import hashlib
+from jose import JWTError, jwt
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+from ..services.response_cache import get_data_version
+from .auth import SECRET_KEY, ALGORITHM
+
+# ETag 的最长有效时间（秒）
+ETAG_MAX_AGE = float(os.getenv("ETAG_MAX_AGE", 60))
+# 支持条件请求的接口路径 -> 是否需要登录
+ETAG_PATHS = {
+    "/api/stores_data/": True,
+    "/api/goods/": False,
+    "/api/dashboard/stats": True,
+    "/api/dashboard/chart-data": True,
+    "/api/dashboard/recent-activities": True,
+}
+
+# 进程启动时生成，区分不同进程的数据版本号
+_PROCESS_TOKEN = uuid.uuid4().hex
+
+
+def build_etag(request):
+    """根据数据版本号、路径、查询参数和 Authorization 头计算弱 ETag"""
+    parts = [
+        _PROCESS_TOKEN,
+        str(get_data_version()),
+        str(int(time.time() // ETAG_MAX_AGE)),
+        request.url.path,
+        "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items())),
+        request.headers.get("authorization", ""),
+    ]
+    return 'W/"' + hashlib.sha1("\n".join(parts).encode()).hexdigest() + '"'
+
+
+def _opaque_tag(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _etag_matches(if_none_match, etag):
+    """If-None-Match 按弱比较"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque_tag(etag) in [_opaque_tag(tag) for tag in if_none_match.split(",")]
+
+
+def _token_valid(request):
+    """只校验 Bearer 令牌的签名和有效期"""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return True
+    except JWTError:
+        return False
+
+
+class ETagMiddleware(BaseHTTPMiddleware):
+    """为 ETAG_PATHS 中的 GET 请求计算 ETag，命中 If-None-Match 时直接返回 304"""
+
+    async def dispatch(self, request, call_next):
+        path = request.url.path
+        if request.method != "GET" or path not in ETAG_PATHS:
+            return await call_next(request)
+
+        # 在调用接口之前计算：接口执行期间数据有变化时，下次请求会拿到新的 ETag
+        etag = build_etag(request)
+        if _etag_matches(request.headers.get("if-none-match"), etag) and (not ETAG_PATHS[path] or _token_valid(request)):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+        response = await call_next(request)
+        if response.status_code == 200:
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = "no-cache"
+        return response
@@ -0,0 +1,126 @@
+"""
+按请求统计 SQL：查询次数、数据库耗时和最慢的一条语句
+- instrument_database() 包装数据库实例的 execute_sql，每条 SQL 计时后记到当前请求的统计上
+- 当前请求的统计放在 contextvar 里；默认线程池和执行通道（见 services/executors.py）都会复制 context，
+  接口在哪个线程里执行都能记到同一个请求上
+- QueryStatsMiddleware 在响应头中加上 X-Query-Count 和 Server-Timing（浏览器开发者工具的 Timing 面板可以直接看到），
+  查询次数或耗时超过阈值的请求记录警告日志
+- 流式响应在发送响应头之后还会继续查询，响应头里只有发送响应头之前的统计，日志中是完整的统计
+- 请求结束后由它提交的后台任务（如同步任务）执行的 SQL 不再计入
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from functools import wraps
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+# 请求耗时超过多少毫秒时记录日志
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 1000))
+# 请求的查询次数超过多少时记录日志（用于发现 N+1 查询）
+SLOW_REQUEST_QUERIES = int(os.getenv("SLOW_REQUEST_QUERIES", 50))
+# 日志中最慢语句的最大长度
+SLOW_SQL_MAX_LENGTH = 500
+
+_current_stats = contextvars.ContextVar("query_stats", default=None)
+
+
+class QueryStats:
+    """一个请求的 SQL 统计，可能在多个线程中累加，修改在锁内进行"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = ""
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def record(self, sql, elapsed):
+        with self._lock:
+            if self.finished:
+                return
+            self.count += 1
+            self.total_time += elapsed
+            if elapsed > self.slowest_time:
+                self.slowest_time = elapsed
+                self.slowest_sql = sql
+
+    def snapshot(self):
+        with self._lock:
+            return self.count, self.total_time, self.slowest_time, self.slowest_sql
+
+    def finish(self):
+        """请求结束：之后执行的 SQL 不再计入，返回最终统计"""
+        with self._lock:
+            self.finished = True
+            return self.count, self.total_time, self.slowest_time, self.slowest_sql
+
+
+def instrument_database(database):
+    """包装数据库实例的 execute_sql（重复调用不会重复包装）"""
+    if getattr(database, "_query_stats_installed", False):
+        return database
+    execute_sql = database.execute_sql
+
+    @wraps(execute_sql)
+    def timed_execute_sql(sql, params=None, *args, **kwargs):
+        stats = _current_stats.get()
+        if stats is None:
+            return execute_sql(sql, params, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return execute_sql(sql, params, *args, **kwargs)
+        finally:
+            stats.record(sql, time.perf_counter() - started)
+
+    database.execute_sql = timed_execute_sql
+    database._query_stats_installed = True
+    return database
+
+
+class QueryStatsMiddleware:
+    """纯 ASGI 中间件：统计每个请求的 SQL，写入响应头，超过阈值时记录日志"""
+
+    def __init__(self, app, slow_ms=SLOW_REQUEST_MS, slow_queries=SLOW_REQUEST_QUERIES):
+        self.app = app
+        self.slow_ms = slow_ms
+        self.slow_queries = slow_queries
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_stats(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                count, db_time, _, _ = stats.snapshot()
+                app_time = (time.perf_counter() - started) * 1000
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Query-Count", str(count))
+                headers.append("Server-Timing",
+                               f'db;dur={db_time * 1000:.1f};desc="{count} queries", app;dur={app_time:.1f}')
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            count, db_time, slowest_time, slowest_sql = stats.finish()
+            _current_stats.reset(token)
+            if elapsed_ms >= self.slow_ms or count >= self.slow_queries:
+                logger.warning(
+                    f"慢请求 {scope['method']} {scope['path']} {status_code}: 耗时 {elapsed_ms:.1f}ms，"
+                    f"{count} 条 SQL 共 {db_time * 1000:.1f}ms，"
+                    f"最慢 {slowest_time * 1000:.1f}ms: {slowest_sql[:SLOW_SQL_MAX_LENGTH]}"
+                )
@@ -0,0 +1,46 @@
+"""
+接口的 JSON 响应
+- FastJSONResponse 用 orjson 序列化（未安装时回退到标准库 json），作为应用的默认响应类
+- datetime 直接交给响应类序列化，输出和原来 strftime("%Y-%m-%d %H:%M:%S") 相同的格式，
+  接口不用再逐行格式化时间；date 输出 YYYY-MM-DD
+- 接口返回普通 dict 时 FastAPI 会先用 jsonable_encoder 逐个字段转换一遍，
+  行数多的报表接口直接返回 FastJSONResponse(数据) 跳过这一步
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    # datetime 交给 _default 处理：orjson 自带的格式是 2026-01-01T10:00:00，前端直接展示原字符串
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+except ImportError:  # pragma: no cover - requirements.txt 中已包含 orjson
+    orjson = None
+
+
+def _default(value):
+    """orjson / json 不能直接序列化的类型"""
+    if isinstance(value, datetime):
+        # isoformat 比 strftime 快，timespec='seconds' 时和 "%Y-%m-%d %H:%M:%S" 输出相同
+        return value.isoformat(sep=' ', timespec='seconds')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def dumps(content):
+    """序列化为 UTF-8 编码的 JSON 字节串"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+                      default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
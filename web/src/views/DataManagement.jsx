@@ -1,17 +1,44 @@
-import React, { useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { ArrowDownTrayIcon, XMarkIcon } from '@heroicons/react/24/outline';
 import { apiRequest } from '../utils/api';
 import { DatePicker } from 'antd';
 
+// 同步任务阶段的显示名称
+const PHASE_LABELS = {
+  queued: '排队中',
+  fetching: '拉取订单',
+  writing_goods: '写入商品',
+  writing_stores: '写入店铺',
+  done: '已完成',
+  failed: '失败',
+};
+
+// 同步任务进度的轮询间隔，以及最长等待时间（超过后不再轮询，任务仍在后台执行）
+const SYNC_POLL_INTERVAL = 2000;
+const SYNC_POLL_MAX_DURATION = 30 * 60 * 1000;
+
+// 轮询同步任务时的错误，message 直接展示给用户
+class SyncPollError extends Error {}
+
 const DataManagement = () => {
   const [startDate, setStartDate] = useState('');
   const [endDate, setEndDate] = useState('');
   const [loading, setLoading] = useState(false);
+  const [progress, setProgress] = useState(null);
   const [showNotification, setShowNotification] = useState({
     show: false,
     message: '',
     type: '',
   });
+  // 页面卸载后停止轮询，也不再更新状态
+  const unmountedRef = useRef(false);
+
+  useEffect(() => {
+    unmountedRef.current = false;
+    return () => {
+      unmountedRef.current = true;
+    };
+  }, []);
 
   const showNotificationFunc = (message, type = 'success') => {
     setShowNotification({ show: true, message, type });
@@ -20,30 +47,84 @@ const DataManagement = () => {
     }, 3000);
   };
 
+  // 轮询同步任务进度，直到任务结束；页面已卸载时返回 null
+  const waitForSyncJob = async (jobId) => {
+    const deadline = Date.now() + SYNC_POLL_MAX_DURATION;
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, SYNC_POLL_INTERVAL));
+      if (unmountedRef.current) {
+        return null;
+      }
+      if (Date.now() > deadline) {
+        throw new SyncPollError('同步任务执行时间过长，已停止查询进度，任务仍在后台执行，请稍后查看数据');
+      }
+      const response = await apiRequest(`/sync_jobs/${jobId}`);
+      if (unmountedRef.current) {
+        return null;
+      }
+      if (response && response.status === 404) {
+        throw new SyncPollError('同步任务不存在（服务可能已重启），请重新同步');
+      }
+      if (!response || !response.ok) {
+        throw new SyncPollError('查询同步任务进度失败');
+      }
+      const job = await response.json();
+      if (unmountedRef.current) {
+        return null;
+      }
+      setProgress(job);
+      if (job.status === 'success' || job.status === 'failed') {
+        return job;
+      }
+    }
+  };
+
   const handleSync = async () => {
     if (loading) return;
 
     setLoading(true);
+    setProgress(null);
     try {
-      // 调用 /sync_jushuitan_data，并传递选择的年月日（sync_date）
+      // 提交后台同步任务（/sync_jobs），并传递选择的年月日（sync_date）
       const payload = startDate ? { sync_date: startDate } : {};
-      const response = await apiRequest('/sync_jushuitan_data', {
+      const response = await apiRequest('/sync_jobs', {
         method: 'POST',
         body: JSON.stringify(payload),
       });
 
-      if (response.ok) {
-        const result = await response.json().catch(() => ({}));
-        showNotificationFunc(result.message || '数据同步成功', 'success');
-      } else {
+      if (!response.ok) {
         const errorData = await response.json().catch(() => ({}));
-        showNotificationFunc(errorData.detail || '数据同步失败', 'error');
+        const detail = errorData.detail;
+        showNotificationFunc((detail && detail.message) || detail || '提交同步任务失败', 'error');
+        return;
+      }
+
+      const { job_id: jobId } = await response.json();
+      const job = await waitForSyncJob(jobId);
+      if (!job) {
+        return;
+      }
+      if (job.status === 'success') {
+        const result = job.result || {};
+        showNotificationFunc(
+          `成功同步聚水潭数据，处理了 ${result.goods_processed_count || 0} 条商品记录和 ${result.stores_processed_count || 0} 条店铺记录`,
+          'success'
+        );
+      } else {
+        showNotificationFunc(job.errors[0] || '数据同步失败', 'error');
       }
     } catch (error) {
       console.error('同步数据错误:', error);
-      showNotificationFunc('同步数据时发生错误', 'error');
+      if (!unmountedRef.current) {
+        showNotificationFunc(
+          error instanceof SyncPollError ? error.message : '同步数据时发生错误',
+          'error'
+        );
+      }
     } finally {
-      setLoading(false);
+      if (!unmountedRef.current) {
+        setLoading(false);
+      }
     }
   };
 
@@ -125,6 +206,11 @@ const DataManagement = () => {
                 <ArrowDownTrayIcon className="h-5 w-5 mr-2" />
                 {loading ? '同步中...' : '开始同步'}
               </div>
+              {loading && progress && (
+                <div className="text-xs text-slate-500 text-center md:text-left">
+                  {PHASE_LABELS[progress.phase] || progress.phase}：已处理 {progress.rows_processed} 行（{progress.rows_per_second} 行/秒）
+                </div>
+              )}
               <div className="text-xs text-slate-400 text-center md:text-left">
                 点击「开始同步」后，请在几分钟后再刷新其他页面查看最新数据。
               </div>